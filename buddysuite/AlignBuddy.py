@@ -41,7 +41,7 @@ except ImportError:
 # Standard library
 import sys
 import os
-from copy import deepcopy
+from copy import copy, deepcopy
 from io import StringIO, TextIOWrapper
 import random
 import re
@@ -79,6 +79,7 @@ class AlignBuddy(object):
     Core class.
     Open a file or read a handle and parse, or convert raw into a Seq object
     """
+    @br.profiled("parse")
     def __init__(self, _input, in_format=None, out_format=None):
         # ####  IN AND OUT FORMATS  #### #
         # Holders for input type. Used for some error handling below
@@ -87,8 +88,21 @@ class AlignBuddy(object):
         in_file = None
         self.hash_map = OrderedDict()  # This variable is only filled if the hash_ids() fuction is called.
 
+        # Files that have already been parsed can be pulled straight out of the opt-in parse cache
+        cache_args = None
+        if br.PARSE_CACHE and type(_input) == str and os.path.isfile(_input):
+            cache_args = (_input, "AlignBuddy", in_format)
+            cached = br.PARSE_CACHE.get(*cache_args)
+            if cached:
+                _input, in_format = cached["alignments"], cached["in_format"]
+                cache_args = None
+
+        # Compression is applied by write(), so drop any suffix (e.g., 'fasta.gz')
+        out_format = br.split_compression(out_format)[0]
+
         # Handles
         if str(type(_input)) == "<class '_io.TextIOWrapper'>":
+            _input = br.decompress_handle(_input)
             if not _input.seekable():  # Deal with input streams (e.g., stdout pipes)
                 input_txt = _input.read()
                 if re.search("Buddy::.* has crashed with the following traceback", input_txt):
@@ -111,7 +125,7 @@ class AlignBuddy(object):
         try:
             if os.path.isfile(_input):
                 in_file = _input
-                with open(_input, "r", encoding="utf-8") as ifile:
+                with br.open_text(_input) as ifile:
                     _input = StringIO(ifile.read())
         except TypeError:  # This happens when testing something other than a string.
             pass
@@ -157,7 +171,7 @@ class AlignBuddy(object):
                 alignments = list(AlignIO.parse(_input, self.in_format))
 
         elif os.path.isfile(_input):
-            with open(_input, "r", encoding='utf-8') as _input:
+            with br.open_text(_input) as _input:
                 if self.in_format == "phylipss":
                     alignments = list(br.phylip_sequential_read(_input.read(), relaxed=False))
                 elif self.in_format == "phylipsr":
@@ -168,15 +182,32 @@ class AlignBuddy(object):
         else:  # May be unreachable
             alignments = None
 
+        if cache_args:
+            br.PARSE_CACHE.put({"in_format": self.in_format, "alignments": alignments}, *cache_args)
+
         self.alpha = guess_alphabet(alignments)
         for alignment in alignments:
             alignment._alphabet = self.alpha
             for rec in alignment:
                 rec.seq.alphabet = self.alpha
         self.alignments = alignments
-        self.memory_footprint = sum([len(rec) for rec in self.records()])
+
+    @property
+    def memory_footprint(self):
+        # Estimated from the parsed records, so nothing has to be serialized just to size the object
+        return br.estimate_memory(self)
 
     def __str__(self):
+        output = StringIO()
+        self._write_handle(output)
+        return output.getvalue()
+
+    def _write_handle(self, handle):
+        """
+        Serialize alignments straight into an open handle, so large outputs don't need to be built up in memory first
+        :param handle: Any object with a write() method
+        :return: None
+        """
         empty_alignments = []
         for indx, alignment in enumerate(self.alignments):
             if not len(alignment):
@@ -186,7 +217,8 @@ class AlignBuddy(object):
             del self.alignments[indx]
 
         if len(self.alignments) == 0:
-            return "AlignBuddy object contains no alignments.\n"
+            handle.write("AlignBuddy object contains no alignments.\n")
+            return
 
         # There is a weird bug in genbank write() that concatenates dots to the organism name (if set).
         # The following is a work around...
@@ -203,35 +235,29 @@ class AlignBuddy(object):
         if self.out_format in multiple_alignments_unsupported and len(self.alignments) > 1:
             raise ValueError("%s format does not support multiple alignments in one file.\n" % self.out_format)
 
+        ofile = br.TrimmedHandle(handle, end="\n\n" if self.out_format == "clustal" else "\n")
         if self.out_format == "phylipsr":
-            output = br.phylip_sequential_out(self)
+            ofile.write(br.phylip_sequential_out(self))
 
         elif self.out_format == "phylipss":
-            output = br.phylip_sequential_out(self, relaxed=False)
+            ofile.write(br.phylip_sequential_out(self, relaxed=False))
 
         else:
-            tmp_file = br.TempFile()
-            with open(tmp_file.path, "w", encoding="utf-8") as ofile:
-                try:
-                    AlignIO.write(self.alignments, ofile, self.out_format)
-                except ValueError as e:
-                    if "Sequences must all be the same length" in str(e):
-                        br._stderr("Warning: Alignment format detected but sequences are different lengths. "
-                                   "Format changed to fasta to accommodate proper printing of records.\n\n")
-                        AlignIO.write(self.alignments, ofile, "fasta")
-                    elif "Repeated name" in str(e) and self.out_format == "phylip":
-                        br._stderr("Warning: Phylip format returned a 'repeat name' error, probably due to truncation. "
-                                   "Format changed to phylip-relaxed.\n")
-                        AlignIO.write(self.alignments, ofile, "phylip-relaxed")
-                    else:
-                        raise e
-
-            with open(tmp_file.path, "r", encoding="utf-8") as ifile:
-                output = ifile.read()
-        if self.out_format == "clustal":
-            return "%s\n\n" % output.rstrip()
-        else:
-            return "%s\n" % output.rstrip()
+            try:
+                AlignIO.write(self.alignments, ofile, self.out_format)
+            except ValueError as e:
+                if "Sequences must all be the same length" in str(e):
+                    br._stderr("Warning: Alignment format detected but sequences are different lengths. "
+                               "Format changed to fasta to accommodate proper printing of records.\n\n")
+                    AlignIO.write(self.alignments, ofile, "fasta")
+                elif "Repeated name" in str(e) and self.out_format == "phylip":
+                    br._stderr("Warning: Phylip format returned a 'repeat name' error, probably due to truncation. "
+                               "Format changed to phylip-relaxed.\n")
+                    AlignIO.write(self.alignments, ofile, "phylip-relaxed")
+                else:
+                    raise e
+        ofile.close()
+        return
 
     def set_format(self, in_format):
         self.out_format = br.parse_format(in_format)
@@ -259,19 +285,39 @@ class AlignBuddy(object):
         lengths = [alignment.get_alignment_length() for alignment in self.alignments]
         return lengths
 
-    def write(self, file_path, out_format=None):
-        with open(file_path, "w", encoding="utf-8") as ofile:
+    def write(self, file_path, out_format=None, compression=None):
+        """
+        :param file_path: Path to the output file, or an open handle to write into
+        :param out_format: Use this format instead of self.out_format. Add a suffix to compress (e.g., 'fasta.gz')
+        :param compression: "bgzf", "gzip", or "xz". Otherwise set from the out_format suffix or file extension
+        :return: None
+        """
+        out_format, format_compression = br.split_compression(out_format)
+        compression = compression if compression else format_compression
+        if not compression and not hasattr(file_path, "write"):
+            compression = br.split_compression(str(file_path))[1]
+
+        out_format_save = str(self.out_format)
+        if out_format:
+            self.set_format(out_format)
+        try:
+            if hasattr(file_path, "write"):
+                if compression:
+                    with br.compress_handle(file_path, compression) as ofile:
+                        self._write_handle(ofile)
+                else:
+                    self._write_handle(file_path)
+            else:
+                with br.open_text(file_path, "w", compression) as ofile:
+                    self._write_handle(ofile)
+        finally:
             if out_format:
-                out_format_save = str(self.out_format)
-                self.set_format(out_format)
-                ofile.write(str(self))
                 self.set_format(out_format_save)
-            else:
-                ofile.write(str(self))
         return
 
 
 # ################################################# HELPER FUNCTIONS ################################################# #
+@br.profiled("guess_alphabet")
 def guess_alphabet(alignments):
     """
     :param alignments: Duck typed --> AlignBuddy object, list of alignment objects, or a single alignment object
@@ -303,6 +349,7 @@ def guess_alphabet(alignments):
         return IUPAC.protein
 
 
+@br.profiled("guess_format")
 def guess_format(_input):  # _input can be list, SeqBuddy object, file handle, or file path.
     # If input is just a list, there is no BioPython in-format. Default to stockholm.
     if isinstance(_input, list):
@@ -314,17 +361,26 @@ def guess_format(_input):  # _input can be list, SeqBuddy object, file handle, o
 
     # If input is a handle or path, try to read the file in each format, and assume success if not error and # seqs > 0
     if os.path.isfile(str(_input)):
-        _input = open(_input, "r", encoding="utf-8")
+        _input = br.open_text(_input)
 
     if str(type(_input)) == "<class '_io.TextIOWrapper'>" or isinstance(_input, StringIO):
         if not _input.seekable():  # Deal with input streams (e.g., stdout pipes)
             _input = StringIO(_input.read().decode("utf-8"))
-        if _input.read() == "":
+        head = _input.read(4096)
+        if head == "":
             return "empty file"
         _input.seek(0)
 
         possible_formats = ["gb", "phylipss", "phylipsr", "phylip", "phylip-relaxed",
                             "stockholm", "fasta", "nexus", "clustal"]
+
+        # Sniff the header first, so only the likely candidates need to be trial parsed
+        sniffed = br.sniff_format(head)
+        if sniffed:
+            if sniffed[0] in ["stockholm", "clustal"]:  # These headers can't be mistaken for anything else
+                return br.parse_format(sniffed[0])
+            possible_formats = [x for x in possible_formats if x in sniffed] + \
+                               [x for x in possible_formats if x not in sniffed]
         for next_format in possible_formats:
             try:
                 _input.seek(0)
@@ -354,11 +410,25 @@ def guess_format(_input):  # _input can be list, SeqBuddy object, file handle, o
 
 
 def make_copy(alignbuddy):
-    alphabet_list = [rec.seq.alphabet for rec in alignbuddy.records()]
-    _copy = deepcopy(alignbuddy)
+    """
+    Copy an AlignBuddy object. Records are copied with br.copy_records(), which skips the deepcopy of the sequence data.
+    :param alignbuddy: AlignBuddy object
+    :return: AlignBuddy object
+    """
+    alignments = alignbuddy.alignments
+    alignbuddy.alignments = []
+    try:
+        _copy = deepcopy(alignbuddy)
+    finally:
+        alignbuddy.alignments = alignments
+
+    for alignment in alignments:
+        new_alignment = copy(alignment)
+        new_alignment._records = br.copy_records(alignment._records)
+        new_alignment._per_col_annotations = deepcopy(alignment._per_col_annotations)
+        new_alignment.annotations = deepcopy(alignment.annotations)
+        _copy.alignments.append(new_alignment)
     _copy.alpha = alignbuddy.alpha
-    for indx, rec in enumerate(_copy.records()):
-        rec.seq.alphabet = alphabet_list[indx]
     return _copy
 
 
@@ -1519,9 +1589,20 @@ def argparse_init():
     alignbuddy = []
     align_set = ""
 
+    if in_args.cache:
+        try:
+            br.enable_parse_cache()
+        except OSError as e:  # Only an optimization, so run without it
+            br._stderr("Warning: %s\n" % e, in_args.quiet)
+
+    if in_args.profile:
+        br.enable_profiler()
+
     if in_args.out_format:
         try:
-            in_args.out_format = br.parse_format(in_args.out_format)
+            out_format = br.split_compression(in_args.out_format)[0]
+            # Keep any compression suffix on the format for command_line_ui() to pick up
+            in_args.out_format = br.parse_format(out_format) + in_args.out_format[len(out_format):]
         except TypeError as e:
             br._stderr("%s\n" % str(e))
             sys.exit()
@@ -1563,31 +1644,35 @@ def argparse_init():
 
 def command_line_ui(in_args, alignbuddy, skip_exit=False, pass_through=False):  # ToDo: Convert to a class
     # ############################################# INTERNAL FUNCTIONS ############################################## #
+    @br.profiled("serialize")
     def _print_aligments(_alignbuddy):
         try:
-            _output = str(_alignbuddy)
+            if in_args.test:
+                str(_alignbuddy)
+                br._stderr("*** Test passed ***\n", in_args.quiet)
+
+            elif in_args.in_place:
+                _in_place(_alignbuddy, in_args.alignments[0])
+
+            else:
+                _alignbuddy.write(sys.stdout, compression=out_compression)
+                sys.stdout.flush()
         except ValueError as err:
             br._stderr("ValueError: %s\n" % str(err))
             return False
-
-        if in_args.test:
-            br._stderr("*** Test passed ***\n", in_args.quiet)
-
-        elif in_args.in_place:
-            _in_place(_output, in_args.alignments[0])
-
-        else:
-            br._stdout("%s" % _output)
         return True
 
-    def _in_place(_output, file_path):
+    def _in_place(_alignbuddy, file_path):
         if not os.path.exists(file_path):
             br._stderr("Warning: The -i flag was passed in, but the positional argument doesn't seem to be a "
                        "file. Nothing was written.\n", in_args.quiet)
-            br._stderr("%s" % _output, in_args.quiet)
+            br._stderr("%s" % _alignbuddy, in_args.quiet)
         else:
-            with open(os.path.abspath(file_path), "w", encoding="utf-8") as _ofile:
-                _ofile.write(_output)
+            # Compressed files stay compressed
+            compression = out_compression if out_compression else br.compression_type(file_path)
+            # Stream into a temporary file and swap it in at the end, so a failed write can't truncate the input
+            with br.atomic_write(file_path, compression) as _ofile:
+                _alignbuddy.write(_ofile)
             br._stderr("File overwritten at:\n%s\n" % os.path.abspath(file_path), in_args.quiet)
 
     def _exit(_tool, skip=skip_exit):
@@ -1595,7 +1680,7 @@ def command_line_ui(in_args, alignbuddy, skip_exit=False, pass_through=False):
             return
         usage = br.Usage()
         memory_footprint = 0 if type(alignbuddy) != AlignBuddy else alignbuddy.memory_footprint
-        usage.increment("AlignBuddy", VERSION.short(), _tool, memory_footprint)
+        usage.increment("AlignBuddy", VERSION.short(), _tool, memory_footprint, br.peak_memory())
         usage.save()
         sys.exit()
 
@@ -1616,6 +1701,9 @@ def command_line_ui(in_args, alignbuddy, skip_exit=False, pass_through=False):
         _exit(_tool)
 
     # ############################################## COMMAND LINE LOGIC ############################################## #
+    # Compressed output is requested with a suffix on the format (e.g., '-o fasta.gz')
+    in_args.out_format, out_compression = br.split_compression(in_args.out_format)
+
     # Alignment lengths
     if in_args.alignment_lengths:
         counts = alignment_lengths(alignbuddy)
@@ -2030,7 +2118,8 @@ def main():
     initiation = []
     try:
         initiation = argparse_init()  # initiation = [in_agrs, alignbuddy]
-        command_line_ui(*initiation)
+        with br.profile_phase("operation"):
+            command_line_ui(*initiation)
     except (KeyboardInterrupt, br.GuessError) as _e:
         print(_e)
         return False
@@ -2044,6 +2133,10 @@ def main():
                 break
         br.send_traceback("AlignBuddy", function, _e, VERSION)
         return False
+    finally:
+        if br.PROFILER and initiation and initiation[0].profile:
+            br.PROFILER.write(initiation[0].profile)
+            br.disable_profiler()
     return True
 
 if __name__ == '__main__':
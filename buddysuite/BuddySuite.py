@@ -22,22 +22,33 @@ Description: Setup and uninstall tools
 """
 import argparse
 from configparser import ConfigParser, NoOptionError
+from collections import OrderedDict
 import os
 import re
 import shutil
 import random
 import string
+import sys
+import io
+import json
+import socketserver
+import struct
+import signal
+import time
 
 try:
     from . import buddysuite
     from . import buddy_resources as br
+    from . import buddy_client as bc
 except ImportError:
     try:
         from . import buddysuite
         from . import buddysuite.buddy_resources as br
+        from . import buddysuite.buddy_client as bc
     except AttributeError:
         from . import buddysuite
         from . import buddy_resources as br
+        from . import buddy_client as bc
 
 
 def setup():  # ToDo: Check permissions?
@@ -181,6 +192,166 @@ def count():
     print(("Total: %s\n" % sum([len(x) for x in [br.sb_flags, br.alb_flags, br.pb_flags, br.db_flags]])))
 
 
+# ################################################ WARM-WORKER DAEMON ################################################ #
+# A local server that imports SeqBuddy, AlignBuddy, and PhyloBuddy once, and then forks a pre-loaded worker for each
+# command line call forwarded to it over a Unix socket. This skips interpreter startup and module imports, which is
+# where most of the time goes on small jobs. The client side, and the protocol, are in buddy_client.py.
+class _FrameWriter(io.RawIOBase):
+    """Raw byte stream that forwards everything written to it back to the client as frames on a single channel"""
+    def __init__(self, sock, channel):
+        io.RawIOBase.__init__(self)
+        self.sock = sock
+        self.channel = channel
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        if data:
+            bc._send_frame(self.sock, self.channel, data)
+        return len(data)
+
+
+class _ForwardedStdin(io.RawIOBase):
+    """Raw byte stream that requests the client's stdin as it is read, and reports whether it is a terminal"""
+    def __init__(self, sock, ifile, isatty):
+        io.RawIOBase.__init__(self)
+        self.sock = sock
+        self.ifile = ifile
+        self._isatty = isatty
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._eof:
+            return 0
+        bc._send_frame(self.sock, b"i", struct.pack("!I", len(buffer)))
+        channel, payload = bc._read_frame(self.ifile)
+        if not payload:
+            self._eof = True
+            return 0
+        buffer[:len(payload)] = payload
+        return len(payload)
+
+    def isatty(self):
+        return self._isatty
+
+
+class _DaemonHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        # Where the kernel can report it, refuse anyone but the user running the daemon. Elsewhere, the private socket
+        # directory is what keeps other users out.
+        peer_uid = bc._peer_uid(self.connection)
+        if peer_uid is not None and peer_uid != os.getuid():
+            return
+
+        header = json.loads(self.rfile.readline().decode("utf-8"))
+        if header.get("command") == "ping":
+            bc._send_frame(self.connection, b"x", b"0")
+            return
+
+        os.chdir(header["cwd"])
+        for var in bc.DAEMON_ENV:
+            if var in header["env"]:
+                os.environ[var] = header["env"][var]
+            else:
+                os.environ.pop(var, None)
+        os.environ["BUDDYSUITE_NO_DAEMON"] = "1"
+        sys.argv = ["%s.py" % header["tool"]] + header["argv"]
+        sys.stdin = io.TextIOWrapper(io.BufferedReader(_ForwardedStdin(self.connection, self.rfile, header["isatty"])),
+                                     encoding="utf-8")
+        sys.stdout = io.TextIOWrapper(io.BufferedWriter(_FrameWriter(self.connection, b"o")), encoding="utf-8")
+        sys.stderr = io.TextIOWrapper(io.BufferedWriter(_FrameWriter(self.connection, b"e")), encoding="utf-8",
+                                      line_buffering=True)
+        # The tools were imported (and the parse cache set up from the environment) when the daemon started, so set
+        # the cache up again from the client's $BUDDYSUITE_CACHE_DIR and $BUDDYSUITE_CACHE_SIZE
+        tool_br = self.server.tools[header["tool"]].br
+        tool_br.PARSE_CACHE = tool_br._env_parse_cache()
+        exit_code = 1
+        try:
+            exit_code = int(self.server.tools[header["tool"]].main() or 0)  # Same as sys.exit(main())
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            bc._send_frame(self.connection, b"x", str(exit_code).encode("utf-8"))
+
+
+class BuddyDaemon(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    def __init__(self, socket_path=None):
+        self.socket_path = socket_path if socket_path else bc.daemon_socket_path()
+        self.tools = OrderedDict([(tool, bc._import_tool(tool)) for tool in bc.DAEMON_TOOLS])
+        socket_dir = os.path.dirname(os.path.abspath(self.socket_path))
+        try:
+            os.mkdir(socket_dir, 0o700)
+        except FileExistsError:
+            pass  # Only used if it passes the check below
+        if not bc._private_dir(socket_dir):
+            raise OSError("Refusing to create the BuddySuite daemon socket in %s, which is not a directory that only "
+                          "you can access (it must be owned by you, with 0700 permissions)" % socket_dir)
+        if os.path.exists(self.socket_path):
+            if bc.daemon_status(self.socket_path):
+                raise OSError("A BuddySuite daemon is already listening on %s" % self.socket_path)
+            os.remove(self.socket_path)  # Stale socket left behind by a daemon that was killed
+        socketserver.UnixStreamServer.__init__(self, self.socket_path, _DaemonHandler)
+        with open("%s.pid" % self.socket_path, "w") as ofile:
+            ofile.write(str(os.getpid()))
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        for _path in [self.socket_path, "%s.pid" % self.socket_path]:
+            if os.path.exists(_path):
+                os.remove(_path)
+
+
+def start_daemon(socket_path=None, foreground=False):
+    """
+    :param socket_path: Where to create the Unix socket (defaults to bc.daemon_socket_path())
+    :param foreground: Serve from the current process, instead of detaching into the background
+    :return: The socket path being served
+    """
+    daemon = BuddyDaemon(socket_path)
+    if not foreground and os.fork():
+        daemon.socket.close()
+        return daemon.socket_path
+
+    if not foreground:
+        os.setsid()
+        with open("%s.pid" % daemon.socket_path, "w") as ofile:
+            ofile.write(str(os.getpid()))
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for stream in [sys.stdin, sys.stdout, sys.stderr]:
+            os.dup2(devnull, stream.fileno())
+
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit())
+    try:
+        daemon.serve_forever()
+    finally:
+        daemon.server_close()
+    return daemon.socket_path
+
+
+def stop_daemon(socket_path=None):
+    """
+    :return: True if a running daemon was stopped
+    """
+    socket_path = socket_path if socket_path else bc.daemon_socket_path()
+    try:
+        with open("%s.pid" % socket_path, "r") as ifile:
+            os.kill(int(ifile.read().strip()), signal.SIGTERM)
+    except (OSError, ValueError):
+        return False
+    for _ in range(50):  # Give it up to 5 seconds to clean up after itself
+        if not os.path.exists(socket_path):
+            break
+        time.sleep(0.1)
+    return True
+
+
 def main():
     def fmt(prog):
         return br.CustomHelpFormatter(prog)
@@ -197,6 +368,9 @@ def main():
     parser.add_argument('-versions', help='Show module version #s', action='store_true')
     parser.add_argument('-tools', help="List all BuddySuite tools", action='store_true')
     parser.add_argument('-count', help="Output number of tools available", action='store_true')
+    parser.add_argument('-daemon', help="Manage a background process that keeps SeqBuddy, AlignBuddy, and PhyloBuddy "
+                                         "loaded, so command line calls start instantly",
+                        choices=["start", "stop", "status", "run"], metavar="start|stop|status|run")
 
     in_args = parser.parse_args()
 
@@ -210,6 +384,14 @@ def main():
         setup()
     elif in_args.uninstall:
         uninstall()
+    elif in_args.daemon == "start":
+        print("BuddySuite daemon listening on %s" % start_daemon())
+    elif in_args.daemon == "run":
+        start_daemon(foreground=True)
+    elif in_args.daemon == "stop":
+        print("BuddySuite daemon stopped" if stop_daemon() else "No BuddySuite daemon running")
+    elif in_args.daemon == "status":
+        print("BuddySuite daemon running" if bc.daemon_status() else "No BuddySuite daemon running")
     return
 
 if __name__ == '__main__':
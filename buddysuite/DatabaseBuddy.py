@@ -52,12 +52,9 @@ import cmd
 from subprocess import Popen, PIPE
 from io import TextIOWrapper, StringIO
 import warnings
-import readline
-import dill
 import glob
 
 # Third party
-from Bio import Entrez
 from Bio import SeqIO
 from Bio import BiopythonWarning
 warnings.simplefilter('ignore', BiopythonWarning)
@@ -127,7 +124,7 @@ class DbBuddy(object):  # Open a file or read a handle and parse, or convert raw
         # Handles
         elif str(type(_input)) == "<class '_io.TextIOWrapper'>":
             # This will also deal with input streams (e.g., stdout pipes)
-            _input = _input.read().strip()
+            _input = br.decompress_handle(_input).read().strip()
 
         # Plain text
         elif type(_input) == str and not os.path.isfile(_input):
@@ -135,7 +132,7 @@ class DbBuddy(object):  # Open a file or read a handle and parse, or convert raw
 
         # File paths
         elif type(_input) == str and os.path.isfile(_input):
-            with open(_input, "r", encoding="utf-8") as _ifile:
+            with br.open_text(_input) as _ifile:
                 _input = _ifile.read().strip()
 
         else:
@@ -251,7 +248,7 @@ class DbBuddy(object):  # Open a file or read a handle and parse, or convert raw
         :param _num: Limit the number of rows (records) returned, otherwise everything is output
         :param quiet: suppress stderr
         :param columns: Variable, list of column names to include in summary output
-        :param destination: a file path or handle to write to
+        :param destination: a file path or handle to write to. File paths ending in .gz, .bgz, or .xz are compressed
         :param group: Either 'records' or 'trash_bin'
         :return: Nothing.
         """
@@ -400,7 +397,11 @@ class DbBuddy(object):  # Open a file or read a handle and parse, or convert raw
             # remove any escape characters and convert space padding to tabs if writing the file
             _output = re.sub("\\033\[[0-9]*m", "", _output)
             _output = re.sub(" +\n", "\n", _output)
-            destination.write(_output)
+            if type(destination) == str:
+                with br.open_text(destination, "w", br.split_compression(destination)[1]) as _ofile:
+                    _ofile.write(_output)
+            else:
+                destination.write(_output)
 
 
 # ################################################# SUPPORT CLASSES ################################################## #
@@ -911,6 +912,7 @@ class UniProtRestClient(GenericClient):
 class NCBIClient(GenericClient):
     def __init__(self, _dbbuddy):
         GenericClient.__init__(self, _dbbuddy)
+        from Bio import Entrez  # Slow import, so only pulled in when NCBI is actually queried
         self.Entrez = Entrez
         self.Entrez.email = CONFIG["email"]
         self.Entrez.tool = "buddysuite"
@@ -937,16 +939,17 @@ class NCBIClient(GenericClient):
             try:
                 if tool == "esummary_taxa":
                     # Example query of taxa ids: "649,734,1009,2302"
-                    handle = Entrez.esummary(db="taxonomy", id=query, retmax=10000)
+                    handle = self.Entrez.esummary(db="taxonomy", id=query, retmax=10000)
                 elif tool == "esummary_seq":
                     # Example query of ACCNs: "XP_010103297.1,XP_010103298.1,XP_010103299.1"
-                    handle = Entrez.esummary(db=db, id=query, retmax=10000)
+                    handle = self.Entrez.esummary(db=db, id=query, retmax=10000)
                 elif tool == "efetch_seq":
                     # Example query of ACCNs: "XP_010103297.1,XP_010103298.1,XP_010103299.1"
-                    handle = Entrez.efetch(db=db, id=query, rettype="gb", retmode="text", retmax=10000)
+                    handle = self.Entrez.efetch(db=db, id=query, rettype="gb", retmode="text", retmax=10000)
                 elif tool == "esearch":
-                    count = Entrez.read(Entrez.esearch(db=db, term=re.sub('[\'"]', '', query), rettype="count"))["Count"]
-                    handle = Entrez.esearch(db=db, term=re.sub('[\'"]', '', query), retmax=count, idtype='acc')
+                    count = self.Entrez.read(self.Entrez.esearch(db=db, term=re.sub('[\'"]', '', query),
+                                                                 rettype="count"))["Count"]
+                    handle = self.Entrez.esearch(db=db, term=re.sub('[\'"]', '', query), retmax=count, idtype='acc')
                 else:
                     raise ValueError("_mc_query() 'tool' argument must be in 'esummary_taxa', "
                                      "'esummary_seq', or 'efetch_seq'")
@@ -1004,7 +1007,7 @@ class NCBIClient(GenericClient):
         results = [x for x in results if x != ""]
         accns = []
         for result in results:
-            result = Entrez.read(StringIO(result))
+            result = self.Entrez.read(StringIO(result))
             accns += result["IdList"]
         if not accns:
             br._stderr("NCBI returned no %s results\n\n" % _type)
@@ -1049,7 +1052,7 @@ class NCBIClient(GenericClient):
         taxa = []
         for result in results:
             try:  # This will catch and retry when the server fails on us
-                summaries = [x for x in Entrez.parse(StringIO(result))]
+                summaries = [x for x in self.Entrez.parse(StringIO(result))]
                 self.tries = 0
             except RuntimeError:
                 if self.tries >= self.max_attempts:
@@ -1101,7 +1104,7 @@ class NCBIClient(GenericClient):
 
         taxa = {}
         for result in results:
-            for summary in Entrez.parse(StringIO(result)):
+            for summary in self.Entrez.parse(StringIO(result)):
                 taxa[summary["TaxId"]] = "Unclassified" if "ScientificName" not in summary \
                     else summary["ScientificName"]
 
@@ -1400,6 +1403,7 @@ Further details about each command can be accessed by typing 'help <command>'
             self.history_path = "%s%scmd_history" % (self.tmpdir.path, os.sep)
             open(self.history_path, "w", encoding="utf-8").close()
 
+        import readline
         readline.read_history_file(self.history_path)
         readline.set_history_length(1000)
 
@@ -1428,6 +1432,7 @@ Further details about each command can be accessed by typing 'help <command>'
         # ToDo: Long commands are added to history, they are not output correctly in the terminal. For some reason they
         # are not cleared completely when you move to the next history index, leaving a truncated path at the prompt.
         # Need to track this bug down and squash it, just not sure how (i.e., don't want the 'and len(line) < 40' part)
+        import readline
         if line not in ["y", "n", "yes", "no"] and len(line) < 50:
             readline.write_history_file(self.history_path)
         else:
@@ -1445,6 +1450,7 @@ Further details about each command can be accessed by typing 'help <command>'
             client.lock = False
         self.crash_file.save("%s_undo" % self.crash_file.path)
         self.crash_file.open()
+        import dill
         dill.dump(self.dbbuddy, self.crash_file.handle, protocol=-1)
         self.crash_file.close()
         self.undo = True
@@ -1725,6 +1731,7 @@ Further details about each command can be accessed by typing 'help <command>'
         if not line:
             line = eval(input("%sWhere is the dump_file?%s " % (RED, self.terminal_default)))
         try:
+            import dill
             with open(os.path.abspath(line), "rb") as ifile:
                 dbbuddy = dill.load(ifile)
                 self.dbbuddy.search_terms = dbbuddy.search_terms
@@ -56,20 +56,6 @@ from copy import deepcopy
 # sys.path.insert(0, "./")  # For stand alone executable, where dependencies are packaged with BuddySuite
 from Bio.Alphabet import IUPAC
 
-try:
-    import ete3
-    from ete3.coretype.tree import TreeError
-except ImportError:
-    print("""\
-ETE3 toolkit not detected on your system. Try running the following:
-
-    pip install --upgrade  https://github.com/jhcepas/ete/archive/3.0.zip
-    pip install six
-
-Or see http://etetoolkit.org/download/ for installation details.
-""")
-    sys.exit()
-
 try:
     import dendropy
 except ImportError:
@@ -154,6 +140,7 @@ PHYLO_INFERENCE_TOOLS = ["raxml", "phyml", "fasttree"]
 
 # #################################################### PHYLOBUDDY #################################################### #
 class PhyloBuddy(object):
+    @br.profiled("parse")
     def __init__(self, _input, _in_format=None, _out_format=None):
         # ####  IN AND OUT FORMATS  #### #
         # Holders for input type. Used for some error handling below
@@ -164,8 +151,13 @@ class PhyloBuddy(object):
         self.trees = []
         self.hash_map = []  # Only used when hash_ids() function is called
         tree_classes = [Tree]  # Dendropy Tree
+
+        # Compression is applied by write(), so drop any suffix (e.g., 'newick.gz')
+        _out_format = br.split_compression(_out_format)[0]
+
         # Handles
         if str(type(_input)) == "<class '_io.TextIOWrapper'>":
+            _input = br.decompress_handle(_input)
             if not _input.seekable():  # Deal with input streams (e.g., stdout pipes)
                 input_txt = _input.read()
                 if re.search("Buddy::.* has crashed with the following traceback", input_txt):
@@ -189,7 +181,7 @@ class PhyloBuddy(object):
         try:
             if os.path.isfile(_input):
                 in_file = _input
-                with open(in_file, "r", encoding="utf-8") as ifile:
+                with br.open_text(in_file) as ifile:
                     _input = StringIO(ifile.read())
                     in_from_handle = _input.read()
                     _input.seek(0)
@@ -269,7 +261,11 @@ class PhyloBuddy(object):
             for _tree in self.trees:
                 for _node in _tree.nodes():
                     _node.edge_length = 1.0
-        self.memory_footprint = len(str(self))
+
+    @property
+    def memory_footprint(self):
+        # Estimated from the parsed trees, so nothing has to be serialized just to size the object
+        return br.estimate_memory(self)
 
     def __str__(self):
         if len(self.trees) == 0:
@@ -293,13 +289,46 @@ class PhyloBuddy(object):
 
         return _output
 
-    def write(self, _file_path):
-        with open(_file_path, "w", encoding="utf-8") as _ofile:
-            _ofile.write(str(self))
+    def write(self, _file_path, compression=None):
+        """
+        :param _file_path: Path to the output file, or an open handle to write into
+        :param compression: "bgzf", "gzip", or "xz". Otherwise set from the file extension (e.g., 'tree.nwk.gz')
+        :return: None
+        """
+        if hasattr(_file_path, "write"):
+            if compression:
+                with br.compress_handle(_file_path, compression) as _ofile:
+                    _ofile.write(str(self))
+            else:
+                _file_path.write(str(self))
+        else:
+            compression = compression if compression else br.split_compression(str(_file_path))[1]
+            with br.open_text(_file_path, "w", compression) as _ofile:
+                _ofile.write(str(self))
         return
 
 
 # ################################################# HELPER FUNCTIONS ################################################# #
+def _import_ete():
+    """
+    ETE3 is slow to import and only a few functions need it, so it is loaded on demand
+    :return: The ete3 module
+    """
+    try:
+        import ete3
+    except ImportError:
+        print("""\
+ETE3 toolkit not detected on your system. Try running the following:
+
+    pip install --upgrade  https://github.com/jhcepas/ete/archive/3.0.zip
+    pip install six
+
+Or see http://etetoolkit.org/download/ for installation details.
+""")
+        sys.exit()
+    return ete3
+
+
 def _convert_to_ete(_tree, ignore_color=False):
     """
     Converts dendropy trees to ete trees
@@ -307,6 +336,7 @@ def _convert_to_ete(_tree, ignore_color=False):
     :param ignore_color: Specifies if figtree color metadata should be turned into ETE NodeStyle objects
     :return: An ETE Tree object
     """
+    ete3 = _import_ete()
     tmp_dir = br.TempDir()
     with open("%s/tree.tmp" % tmp_dir.path, "w", encoding="utf-8") as _ofile:
         _ofile.write(re.sub('!color', 'pb_color', _tree.as_string(schema='newick', annotations_as_nhx=True,
@@ -365,6 +395,7 @@ def _get_tree_binaries(_tool):
     return tool_dict[_tool]
 
 
+@br.profiled("guess_format")
 def _guess_format(_input):
     # If input is just a list, there is no BioPython in-format. Default to Newick.
     if isinstance(_input, list):
@@ -376,15 +407,22 @@ def _guess_format(_input):
 
     # If input is a handle or path, try to read the file in each format, and assume success if not error and # trees > 0
     if os.path.isfile(str(_input)):
-        _input = open(_input, "r", encoding='utf-8')
+        _input = br.open_text(_input)
 
     if str(type(_input)) == "<class '_io.TextIOWrapper'>" or isinstance(_input, StringIO):
         # Die if file is empty
-        contents = _input.read()
-        if contents == "":
+        head = _input.read(4096)
+        if head == "":
             sys.exit("Input file is empty.")
         _input.seek(0)
 
+        # The header is usually enough, only search the whole file if it isn't recognized
+        sniffed = br.sniff_format(head)
+        if sniffed and sniffed[0] in ["nexml", "nexus", "newick"]:
+            return sniffed[0]
+
+        contents = _input.read()
+        _input.seek(0)
         if re.search('<nex:nexml', contents, re.IGNORECASE):
             return 'nexml'
         # Maddison, Swofford, and Maddison, 1997 DOI: 10.1093/sysbio/46.4.590
@@ -969,6 +1007,7 @@ def show_unique(phylobuddy):
     trees = [_convert_to_ete(phylobuddy.trees[0], ignore_color=True),
              _convert_to_ete(phylobuddy.trees[1], ignore_color=True)]  # Need ETE so we can compare them
 
+    from ete3.coretype.tree import TreeError
     try:
         data = trees[0].robinson_foulds(trees[1])
 
@@ -1115,10 +1154,13 @@ def argparse_init():
                    "Valid options include %s.\n" % (in_args.in_format, OUTPUT_FORMATS))
         sys.exit()
 
-    if in_args.out_format and in_args.out_format.lower() not in OUTPUT_FORMATS:
+    if in_args.out_format and br.split_compression(in_args.out_format)[0].lower() not in OUTPUT_FORMATS:
         br._stderr("Error: Output type %s is not recognized/supported\n" % in_args.out_format)
         sys.exit()
 
+    if in_args.profile:
+        br.enable_profiler()
+
     if not in_args.generate_tree:  # If passing in an alignment, don't want to try and build PhyloBuddy obj
         for tree_set in in_args.trees:
             if isinstance(tree_set, TextIOWrapper) and tree_set.buffer.raw.isatty():
@@ -1134,24 +1176,32 @@ def argparse_init():
 
 def command_line_ui(in_args, phylobuddy, skip_exit=False, pass_through=False):   # ToDo: Convert to a class
     # ############################################## INTERNAL FUNCTIONS ############################################## #
+    @br.profiled("serialize")
     def _print_trees(_phylobuddy):
         if in_args.test:
             br._stderr("*** Test passed ***\n", in_args.quiet)
 
         elif in_args.in_place:
-            _in_place(str(_phylobuddy), in_args.trees[0])
+            _in_place(_phylobuddy, in_args.trees[0])
+
+        elif out_compression:
+            _phylobuddy.write(sys.stdout, compression=out_compression)
+            sys.stdout.flush()
 
         else:
             br._stdout("{0}\n".format(str(_phylobuddy).rstrip()))
 
-    def _in_place(_output, file_path):
+    def _in_place(_phylobuddy, file_path):
         if not os.path.isfile(str(file_path)):
             br._stderr("Warning: The -i flag was passed in, but the positional argument doesn't seem to be a "
                        "file. Nothing was written.\n", in_args.quiet)
-            br._stderr("%s\n" % _output.strip(), in_args.quiet)
+            br._stderr("%s\n" % str(_phylobuddy).strip(), in_args.quiet)
         else:
-            with open(os.path.abspath(file_path), "w", encoding="utf-8") as _ofile:
-                _ofile.write(_output)
+            # Compressed files stay compressed
+            compression = out_compression if out_compression else br.compression_type(file_path)
+            # Stream into a temporary file and swap it in at the end, so a failed write can't truncate the input
+            with br.atomic_write(file_path, compression) as _ofile:
+                _phylobuddy.write(_ofile)
             br._stderr("File overwritten at:\n%s\n" % os.path.abspath(file_path), in_args.quiet)
 
     def _exit(_tool, skip=skip_exit):
@@ -1159,7 +1209,7 @@ def command_line_ui(in_args, phylobuddy, skip_exit=False, pass_through=False):
             return
         usage = br.Usage()
         memory_footprint = 0 if type(phylobuddy) != PhyloBuddy else phylobuddy.memory_footprint
-        usage.increment("PhyloBuddy", VERSION.short(), _tool, memory_footprint)
+        usage.increment("PhyloBuddy", VERSION.short(), _tool, memory_footprint, br.peak_memory())
         usage.save()
         sys.exit()
 
@@ -1180,6 +1230,9 @@ def command_line_ui(in_args, phylobuddy, skip_exit=False, pass_through=False):
         _exit(_tool)
 
     # ############################################## COMMAND LINE LOGIC ############################################## #
+    # Compressed output is requested with a suffix on the format (e.g., '-o newick.gz')
+    in_args.out_format, out_compression = br.split_compression(in_args.out_format)
+
     # Collapse polytomies
     if in_args.collapse_polytomies:
         args = in_args.collapse_polytomies[0]
@@ -1438,7 +1491,8 @@ def main():
     initiation = []
     try:
         initiation = argparse_init()  # initiation = [in_agrs, phylobuddy]
-        command_line_ui(*initiation)
+        with br.profile_phase("operation"):
+            command_line_ui(*initiation)
     except (KeyboardInterrupt, br.GuessError) as _e:
         print(_e)
         return False
@@ -1452,6 +1506,10 @@ def main():
                 break
         br.send_traceback("PhyloBuddy", function, _e, VERSION)
         return False
+    finally:
+        if br.PROFILER and initiation and initiation[0].profile:
+            br.PROFILER.write(initiation[0].profile)
+            br.disable_profiler()
     return True
 
 if __name__ == '__main__':
@@ -45,30 +45,30 @@ except ImportError:
 import sys
 import os
 import re
+import shlex
 import string
-import zipfile
 import shutil
+import mmap
+import gzip
 import time
-import urllib.parse
-import urllib.request
-import urllib.error
-from copy import deepcopy
+from copy import copy, deepcopy
 from random import sample, randint, random, Random
 from math import floor, ceil, log
 from subprocess import Popen, PIPE
-from multiprocessing import Lock
+from multiprocessing import Lock, Pool
 from shutil import which
 from hashlib import md5
 from io import StringIO, TextIOWrapper
-from collections import OrderedDict
+from array import array
+from collections import OrderedDict, namedtuple, Counter
+from itertools import accumulate, product
+from bisect import bisect_right
 from xml.sax import SAXParseException
 
 # Third party
-from Bio import SeqIO
+from Bio import SeqIO, bgzf
 from Bio.SeqFeature import SeqFeature, FeatureLocation, CompoundLocation
 from Bio.SeqRecord import SeqRecord
-from Bio.Restriction import RestrictionBatch, CommOnly, AllEnzymes, Analysis
-from Bio.SeqUtils.ProtParam import ProteinAnalysis
 from Bio.Seq import Seq
 from Bio.Alphabet import IUPAC
 from Bio.Data import CodonTable
@@ -162,6 +162,56 @@ OUTPUT_FORMATS = ["ids", "accessions", "summary", "full-summary", "clustal", "em
                   "fastq-solexa", "fastq-illumina", "genbank", "gb", "imgt", "nexus", "phd", "phylip", "phylip-relaxed",
                   "phylipss", "phylipsr", "raw", "seqxml", "sff", "stockholm", "tab", "qual"]
 
+# Formats that can be parsed record-by-record, and written out in independent chunks
+STREAM_IN_FORMATS = ["embl", "fasta", "fastq", "fastq-sanger", "fastq-solexa", "fastq-illumina", "genbank", "gb",
+                     "imgt", "qual", "seqxml", "swiss", "tab"]
+STREAM_OUT_FORMATS = ["embl", "fasta", "fastq", "fastq-sanger", "fastq-solexa", "fastq-illumina", "genbank", "gb",
+                      "imgt", "qual", "tab"]
+# Records per chunk for stream() and the -stm flag. Looked up each time stream() runs, so it can be tuned by setting
+# SeqBuddy.STREAM_CHUNK_SIZE (larger chunks are faster, smaller chunks use less memory).
+STREAM_CHUNK_SIZE = 1000
+
+# Formats that SeqIndex can build a sidecar offset index for, and the commands that can use it (-idx flag)
+INDEX_FORMATS = ["fasta", "fastq", "fastq-sanger", "fastq-solexa", "fastq-illumina", "gb", "genbank"]
+INDEX_COMMANDS = ["extract_regions", "pull_random_record", "pull_records", "pull_records_file"]
+
+# Large, uncompressed files in these formats are split at record boundaries and parsed on multiple cores
+PARALLEL_FORMATS = ["fasta", "fastq", "fastq-sanger", "fastq-solexa", "fastq-illumina"]
+PARALLEL_PARSE_SIZE = 2 ** 24  # Bytes
+PARALLEL_HEAD_SIZE = 2 ** 16  # Bytes read in by the main process to guess the format of large files
+
+# _guess_alphabet() only looks at the start of a spread of records, unless the sample lands close to the threshold
+ALPHA_THRESHOLD = 0.85
+ALPHA_SAMPLE_RECORDS = 1000
+ALPHA_SAMPLE_SIZE = 2 ** 20  # Residues
+ALPHA_SAMPLE_MARGIN = 0.05
+
+# Residue masses (Da) used by molecular_weight(). Gaps and stops weigh nothing.
+AMINO_ACID_WEIGHTS = {'A': 71.08, 'R': 156.19, 'N': 114.10, 'D': 115.09, 'C': 103.14, 'Q': 128.13, 'E': 129.12,
+                      'G': 57.05, 'H': 137.14, 'I': 113.16, 'L': 113.16, 'K': 128.17, 'M': 131.19, 'F': 147.18,
+                      'P': 97.12, 'S': 87.08, 'T': 101.11, 'W': 186.21, 'Y': 163.18, 'V': 99.13, '-': 0, '*': 0,
+                      'X': 110}
+DNA_WEIGHTS = {'A': 313.2, 'G': 329.2, 'C': 289.2, 'T': 304.2, 'Y': 296.7, 'R': 321.2, 'W': 308.7, 'S': 309.2,
+               'K': 316.7, 'M': 301.2, 'D': 315.53, 'V': 310.53, 'H': 302.2, 'B': 307.53, 'X': 308.95, 'N': 308.95,
+               '-': 0, '.': 0}
+RNA_WEIGHTS = {'A': 329.2, 'G': 306.2, 'C': 305.2, 'U': 345.2, 'Y': 325.2, 'R': 317.7, 'W': 337.2, 'S': 305.7,
+               'K': 325.7, 'M': 317.2, 'D': 326.87, 'V': 313.53, 'H': 326.53, 'B': 318.87, 'X': 321.45, 'N': 321.45,
+               '-': 0, '.': 0}
+DNA_COMPLEMENTS = {'A': 'T', 'G': 'C', 'C': 'G', 'T': 'A', 'Y': 'R', 'R': 'Y', 'W': 'W', 'S': 'S', 'K': 'M', 'M': 'K',
+                   'D': 'H', 'V': 'B', 'H': 'D', 'B': 'V', 'X': 'X', 'N': 'N', '-': '-', '.': '.'}
+DS_DNA_WEIGHTS = {base: weight + DNA_WEIGHTS[DNA_COMPLEMENTS[base]] for base, weight in DNA_WEIGHTS.items()}
+
+# Nucleotide codes understood by the translation engine, and its codon lookups (filled in by _translation_table())
+TRANSLATION_CODES = "ACGTRYSWKMBDHVN-"
+TRANSLATION_TABLES = {}
+
+# Commands that only ever look at one record at a time, so can be run with the -stm flag
+STREAM_COMMANDS = ["back_translate", "clean_seq", "complement", "delete_features", "delete_large", "delete_metadata",
+                   "delete_small", "extract_regions", "lowercase", "order_features_alphabetically",
+                   "order_features_by_position", "pull_record_ends", "pull_records", "pull_records_file",
+                   "reverse_complement", "reverse_transcribe", "screw_formats", "select_frame", "transcribe",
+                   "translate", "translate6frames", "uppercase"]
+
 
 # ##################################################### SEQBUDDY ##################################################### #
 class SeqBuddy(object):
@@ -169,21 +219,36 @@ class SeqBuddy(object):
     Core class.
     Open a file or read a handle and parse, or convert raw into a Seq object
     """
+    @br.profiled("parse")
     def __init__(self, sb_input, in_format=None, out_format=None, alpha=None):
         # ####  IN AND OUT FORMATS  #### #
         # Holders for input type. Used for some error handling below
         in_handle = None
         raw_sequence = None
         in_file = None
+        parallel_file = None
         self.alpha = alpha
         self.hash_map = OrderedDict()  # This is only used by functions that use hash_id()
 
+        # Files that have already been parsed can be pulled straight out of the opt-in parse cache
+        cache_args = None
+        if br.PARSE_CACHE and type(sb_input) == str and in_format != "raw" and os.path.isfile(sb_input):
+            cache_args = (sb_input, "SeqBuddy", in_format, str(alpha))
+            cached = br.PARSE_CACHE.get(*cache_args)
+            if cached:
+                sb_input, in_format, self.alpha = cached["records"], cached["in_format"], cached["alpha"]
+                cache_args = None
+
         # SeqBuddy obj
         if sb_input.__class__.__name__ == "SeqBuddy":
             sb_input = make_copy(sb_input)
 
+        # Compression is applied by write(), so drop any suffix (e.g., 'fasta.gz')
+        out_format = br.split_compression(out_format)[0]
+
         # Handles
         if str(type(sb_input)) == "<class '_io.TextIOWrapper'>":
+            sb_input = br.decompress_handle(sb_input)
             if not sb_input.seekable():  # Deal with input streams (e.g., stdout pipes)
                 input_txt = sb_input.read()
                 if re.search("Buddy::.* has crashed with the following traceback", input_txt):
@@ -216,8 +281,16 @@ class SeqBuddy(object):
         try:
             if os.path.isfile(sb_input):
                 in_file = sb_input
-                with open(sb_input, "r", encoding="utf-8") as ifile:
-                    sb_input = StringIO(ifile.read())
+                if os.path.getsize(in_file) >= PARALLEL_PARSE_SIZE and not br.compression_type(in_file):
+                    # Only read the head for now, if the records can be parsed in parallel from the file itself
+                    with open(in_file, "r", encoding="utf-8") as ifile:
+                        head = StringIO(ifile.read(PARALLEL_HEAD_SIZE))
+                    if (in_format if in_format else _guess_format(head)) in PARALLEL_FORMATS:
+                        parallel_file = in_file
+                        sb_input = head
+                if not parallel_file:
+                    with br.open_text(sb_input) as ifile:
+                        sb_input = StringIO(ifile.read())
 
         except TypeError:  # This happens when testing something other than a string.
             pass
@@ -254,11 +327,14 @@ class SeqBuddy(object):
         if sb_input.__class__.__name__ == "SeqBuddy":
             sequences = sb_input.records
 
+        elif parallel_file:
+            sequences = _parse_parallel(parallel_file, self.in_format)
+
         elif isinstance(sb_input, list):
             # make sure that the list is actually SeqIO records (just test a few...)
             rand_sample = sb_input if len(sb_input) < 5 else sample(sb_input, 5)
             for seq in rand_sample:
-                if type(seq) != SeqRecord:
+                if not isinstance(seq, SeqRecord):
                     raise TypeError("Seqlist is not populated with SeqRecords.")
             sequences = sb_input
 
@@ -273,7 +349,7 @@ class SeqBuddy(object):
                 sequences = list(SeqIO.parse(sb_input, self.in_format))
 
         elif os.path.isfile(sb_input):
-            with open(sb_input, "r", encoding="utf-8") as sb_input:
+            with br.open_text(sb_input) as sb_input:
                 if self.in_format in ["phylipss", "phylipsr"]:
                     relaxed = False if self.in_format == "phylipss" else True
                     aligns = br.phylip_sequential_read(sb_input.read(), relaxed=relaxed)
@@ -305,12 +381,35 @@ class SeqBuddy(object):
             for rec in sequences:
                 rec.id = re.sub("\.copy[0-9]*$", "", rec.id)
 
+        if cache_args:
+            alpha_name = {IUPAC.protein: "protein", IUPAC.ambiguous_dna: "dna",
+                          IUPAC.ambiguous_rna: "rna"}.get(self.alpha)
+            br.PARSE_CACHE.put({"in_format": self.in_format, "alpha": alpha_name, "records": sequences}, *cache_args)
+
         self.records = sequences
-        self.memory_footprint = sum([len(rec) for rec in sequences])
+
+    @property
+    def memory_footprint(self):
+        # Estimated from the parsed records, so nothing has to be serialized just to size the object
+        return br.estimate_memory(self)
 
     def __str__(self):
+        output = StringIO()
+        self._write_handle(output)
+        return output.getvalue()
+
+    def __len__(self):
+        return len(self.records)
+
+    def _write_handle(self, handle):
+        """
+        Serialize records straight into an open handle, so large outputs don't need to be built up in memory first
+        :param handle: Any object with a write() method
+        :return: None
+        """
         if len(self.records) == 0:
-            return "Error: No sequences in object.\n"
+            handle.write("Error: No sequences in object.\n")
+            return
 
         # There is a weird bug in genbank write() that concatenates dots to the organism name (if set).
         # The following is a work around...
@@ -323,64 +422,75 @@ class SeqBuddy(object):
                 except KeyError:
                     pass
 
+        _ofile = br.TrimmedHandle(handle)
         if self.out_format == "phylipsr":
-            output = br.phylip_sequential_out(self, _type="seqbuddy")
+            _ofile.write(br.phylip_sequential_out(self, _type="seqbuddy"))
 
         elif self.out_format == "phylipss":
-            output = br.phylip_sequential_out(self, relaxed=False, _type="seqbuddy")
+            _ofile.write(br.phylip_sequential_out(self, relaxed=False, _type="seqbuddy"))
 
         elif self.out_format == "raw":
-            output = "\n\n".join([str(rec.seq) for rec in self.records])
+            for indx, rec in enumerate(self.records):
+                _ofile.write("%s%s" % ("\n\n" if indx else "", str(rec.seq)))
         else:
-            tmp_dir = br.TempDir()
-            with open("%s%sseqs.tmp" % (tmp_dir.path, os.path.sep), "w", encoding="utf-8") as _ofile:
-                try:
-                    SeqIO.write(self.records, _ofile, self.out_format)
-                except ValueError as e:
-                    if "Sequences must all be the same length" in str(e):
-                        br._stderr("Warning: Alignment format detected but sequences are different lengths. "
-                                   "Format changed to fasta to accommodate proper printing of records.\n\n")
-                        SeqIO.write(self.records, _ofile, "fasta")
-                    elif "Repeated name" in str(e) and self.out_format == "phylip":
-                        br._stderr("Warning: Phylip format returned a 'repeat name' error, probably due to truncation. "
-                                   "Attempting phylip-relaxed.\n")
-                        SeqIO.write(self.records, _ofile, "phylip-relaxed")
-                    elif "Locus identifier" in str(e) and "is too long" in str(e) \
-                            and self.out_format in ["gb", "genbank"]:
-                        br._stderr("Warning: Genbank format returned an 'ID too long' error. "
-                                   "Format changed to EMBL.\n\n")
-                        SeqIO.write(self.records, _ofile, "embl")
-                    else:
-                        raise e
-
-            with open("%s%sseqs.tmp" % (tmp_dir.path, os.path.sep), "r", encoding="utf-8") as ifile:
-                output = ifile.read()
-
-        return "%s\n" % output.rstrip()
-
-    def __len__(self):
-        return len(self.records)
+            try:
+                SeqIO.write(self.records, _ofile, self.out_format)
+            except ValueError as e:
+                if "Sequences must all be the same length" in str(e):
+                    br._stderr("Warning: Alignment format detected but sequences are different lengths. "
+                               "Format changed to fasta to accommodate proper printing of records.\n\n")
+                    SeqIO.write(self.records, _ofile, "fasta")
+                elif "Repeated name" in str(e) and self.out_format == "phylip":
+                    br._stderr("Warning: Phylip format returned a 'repeat name' error, probably due to truncation. "
+                               "Attempting phylip-relaxed.\n")
+                    SeqIO.write(self.records, _ofile, "phylip-relaxed")
+                elif "Locus identifier" in str(e) and "is too long" in str(e) \
+                        and self.out_format in ["gb", "genbank"]:
+                    br._stderr("Warning: Genbank format returned an 'ID too long' error. "
+                               "Format changed to EMBL.\n\n")
+                    SeqIO.write(self.records, _ofile, "embl")
+                else:
+                    raise e
+        _ofile.close()
+        return
 
     def to_dict(self):
-        sb_copy = find_repeats(make_copy(self))
-        if len(sb_copy.repeat_ids) > 0:
-            raise RuntimeError("There are repeat IDs in self.records\n%s" %
-                               ", ".join([key for key, recs in list(sb_copy.repeat_ids.items())]))
+        id_counts = Counter([rec.id for rec in self.records])
+        repeat_ids = [rec_id for rec_id, count in id_counts.items() if count > 1]
+        if repeat_ids:
+            raise RuntimeError("There are repeat IDs in self.records\n%s" % ", ".join(repeat_ids))
 
         records_dict = OrderedDict()
         for rec in self.records:
             records_dict[rec.id] = rec
         return records_dict
 
-    def write(self, file_path, out_format=None):
-        with open(file_path, "w", encoding="utf-8") as ofile:
-            if out_format:
-                out_format_save = str(self.out_format)
-                self.out_format = out_format
-                ofile.write(str(self))
-                self.out_format = out_format_save
+    def write(self, file_path, out_format=None, compression=None):
+        """
+        :param file_path: Path to the output file, or an open handle to write into
+        :param out_format: Use this format instead of self.out_format. Add a suffix to compress (e.g., 'fasta.gz')
+        :param compression: "bgzf", "gzip", or "xz". Otherwise set from the out_format suffix or file extension
+        :return: None
+        """
+        out_format, format_compression = br.split_compression(out_format)
+        compression = compression if compression else format_compression
+        if not compression and not hasattr(file_path, "write"):
+            compression = br.split_compression(str(file_path))[1]
+
+        out_format_save = str(self.out_format)
+        self.out_format = out_format if out_format else self.out_format
+        try:
+            if hasattr(file_path, "write"):
+                if compression:
+                    with br.compress_handle(file_path, compression) as ofile:
+                        self._write_handle(ofile)
+                else:
+                    self._write_handle(file_path)
             else:
-                ofile.write(str(self))
+                with br.open_text(file_path, "w", compression) as ofile:
+                    self._write_handle(ofile)
+        finally:
+            self.out_format = out_format_save
         return
 
     def print_hashmap(self):
@@ -397,6 +507,72 @@ class SeqBuddy(object):
         return
 
 
+def stream(sb_input, in_format=None, out_format=None, alpha=None, chunk_size=None):
+    """
+    Lazily read a sequence file, yielding SeqBuddy objects that each hold at most `chunk_size` records. Only one chunk
+    is in memory at a time, so record-local functions (clean_seq, uppercase, translate_cds, etc.) can be run on files
+    that are too large to load all at once.
+    Note that piped input must be buffered in full if in_format is not specified, because the format guess needs to
+    rewind the handle.
+    :param sb_input: File path or file handle
+    :param in_format: Input format. Guessed if not provided.
+    :param out_format: Output format of the yielded objects. Defaults to in_format.
+    :param alpha: Alphabet. Guessed from the first chunk if not provided, and then applied to every subsequent chunk.
+    :param chunk_size: Maximum number of records per SeqBuddy object (defaults to STREAM_CHUNK_SIZE)
+    :return: Generator of SeqBuddy objects
+    """
+    chunk_size = STREAM_CHUNK_SIZE if chunk_size is None else chunk_size
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer, not %s" % chunk_size)
+
+    in_file = None
+    if type(sb_input) == str and os.path.isfile(sb_input):
+        in_file = sb_input
+        in_format = _guess_format(in_file) if not in_format else in_format
+        sb_input = br.open_text(in_file)
+
+    elif hasattr(sb_input, "read"):
+        sb_input = br.decompress_handle(sb_input)
+        if not in_format:
+            if not sb_input.seekable():  # Deal with input streams (e.g., stdout pipes)
+                sb_input = StringIO(br.utf_encode(sb_input.read()))
+            in_format = _guess_format(sb_input)
+            sb_input.seek(0)
+    else:
+        raise TypeError("stream() requires a file path or file handle, not %s" % type(sb_input))
+
+    try:
+        if in_format == "empty file":
+            return
+
+        if not in_format:
+            raise br.GuessError("Could not determine format from input '%s'.\n"
+                                "Try explicitly setting with -f flag." % (in_file if in_file else sb_input))
+
+        in_format = in_format.lower()
+        out_format = in_format if not out_format else out_format.lower()
+        if in_format not in STREAM_IN_FORMATS:
+            raise ValueError("Unable to stream '%s' input. Supported formats: %s" %
+                             (in_format, ", ".join(STREAM_IN_FORMATS)))
+        if out_format not in STREAM_OUT_FORMATS:
+            raise ValueError("Unable to stream '%s' output. Supported formats: %s" %
+                             (out_format, ", ".join(STREAM_OUT_FORMATS)))
+
+        chunk = []
+        for rec in SeqIO.parse(sb_input, in_format):
+            chunk.append(rec)
+            if len(chunk) == chunk_size:
+                seqbuddy = SeqBuddy(chunk, in_format, out_format, alpha)
+                alpha = seqbuddy.alpha if seqbuddy.alpha else alpha
+                yield seqbuddy
+                chunk = []
+        if chunk:
+            yield SeqBuddy(chunk, in_format, out_format, alpha)
+    finally:
+        if in_file:
+            sb_input.close()
+
+
 # ################################################# HELPER FUNCTIONS ################################################# #
 def _add_buddy_data(rec, key=None, data=None):
     """
@@ -431,6 +607,94 @@ def _check_for_blast_bin(blast_bin):
         return False
 
 
+def _codon_table(alpha, table=1):
+    """
+    Look up one of the NCBI genetic codes
+    :param alpha: Alphabet of the sequences, which decides between the DNA and RNA versions of the table
+    :param table: NCBI table ID (e.g., 11) or name (e.g., 'Vertebrate Mitochondrial')
+    :return: Bio.Data.CodonTable ambiguous codon table
+    """
+    if alpha in [IUPAC.ambiguous_rna, IUPAC.unambiguous_rna]:
+        by_id, by_name = CodonTable.ambiguous_rna_by_id, CodonTable.ambiguous_rna_by_name
+    else:
+        by_id, by_name = CodonTable.ambiguous_dna_by_id, CodonTable.ambiguous_dna_by_name
+
+    if str(table).strip().isdigit() and int(table) in by_id:
+        return by_id[int(table)]
+    for name, codon_table in by_name.items():
+        if name.lower() == str(table).strip().lower():
+            return codon_table
+    raise ValueError("Unknown genetic code '%s'. Use one of the NCBI table IDs (%s), or a table name." %
+                     (table, ", ".join([str(x) for x in sorted(by_id)])))
+
+
+def _cpg_islands(seq, window, min_gc, min_oe, numpy=None):
+    """
+    Score every base with the mean GC fraction and CpG observed/expected ratio of all the windows that cover it. Window
+    counts come from prefix sums, and so do the per-base means, so the whole thing is linear in sequence length.
+    :param seq: Upper case DNA sequence (str)
+    :param window: Window size (no larger than the sequence)
+    :param min_gc: GC fraction a base must exceed to fall within an island
+    :param min_oe: Observed/expected ratio a base must exceed to fall within an island
+    :param numpy: The numpy module, if available. Pure python is used otherwise.
+    :return: ([(start, end), ...], GC track, O/E track)
+    """
+    length = len(seq)
+    if not length:
+        return [], [], []
+    num_windows = length - window + 1
+
+    if numpy:
+        codes = numpy.frombuffer(seq.encode("ascii", "replace"), dtype=numpy.uint8)
+        is_cg = numpy.zeros(length + 1, dtype=numpy.int64)
+        is_cg[2:] = (codes[:-1] == 67) & (codes[1:] == 71)
+        gc_sum = numpy.zeros(length + 1, dtype=numpy.int64)
+        gc_sum[1:] = numpy.cumsum((codes == 67) | (codes == 71))
+        cg_sum = numpy.cumsum(is_cg)
+
+        starts = numpy.arange(num_windows)
+        gc_count = gc_sum[starts + window] - gc_sum[starts]
+        cg_count = cg_sum[starts + window] - cg_sum[starts + 1]  # Both bases of the dinucleotide inside the window
+        expected = (gc_count / 2) ** 2
+        expected[expected == 0] = 1  # Prevent DivByZero
+        oe_windows = cg_count * window / expected
+
+        positions = numpy.arange(length)
+        first = numpy.maximum(positions - window + 1, 0)
+        last = numpy.minimum(positions, num_windows - 1) + 1
+        coverage = last - first
+        gc_totals = numpy.concatenate(([0], numpy.cumsum(gc_count)))
+        oe_totals = numpy.concatenate(([0.], numpy.cumsum(oe_windows)))
+        gc_track = (gc_totals[last] - gc_totals[first]) / window / coverage
+        oe_track = (oe_totals[last] - oe_totals[first]) / coverage
+
+        edges = numpy.flatnonzero(numpy.diff(numpy.concatenate(([0], (gc_track > min_gc) & (oe_track > min_oe), [0]))))
+        islands = list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+        return islands, gc_track, oe_track
+
+    gc_sum = [0] + list(accumulate(1 if base in "CG" else 0 for base in seq))
+    cg_sum = [0, 0] + list(accumulate(1 if seq[i:i + 2] == "CG" else 0 for i in range(length - 1)))
+    gc_totals, oe_totals = [0], [0.]
+    for start in range(num_windows):
+        gc_count = gc_sum[start + window] - gc_sum[start]
+        expected = (gc_count / 2) ** 2
+        expected = 1 if not expected else expected  # Prevent DivByZero
+        gc_totals.append(gc_totals[-1] + gc_count)
+        oe_totals.append(oe_totals[-1] + (cg_sum[start + window] - cg_sum[start + 1]) * window / expected)
+
+    islands, gc_track, oe_track = [], [], []
+    for indx in range(length):
+        first, last = max(indx - window + 1, 0), min(indx, num_windows - 1) + 1
+        gc_track.append((gc_totals[last] - gc_totals[first]) / window / (last - first))
+        oe_track.append((oe_totals[last] - oe_totals[first]) / (last - first))
+        if gc_track[-1] > min_gc and oe_track[-1] > min_oe:
+            if islands and islands[-1][1] == indx:
+                islands[-1][1] += 1
+            else:
+                islands.append([indx, indx + 1])
+    return [tuple(island) for island in islands], gc_track, oe_track
+
+
 def _feature_rc(feature, seq_len):
     """
     BioPython does not properly handle reverse complement of features, so implement it...
@@ -541,35 +805,79 @@ class FeatureReMapper(object):
             return feature
 
 
+@br.profiled("guess_alphabet")
 def _guess_alphabet(seqbuddy):
     """
     Looks through the characters in the SeqBuddy records to determine the most likely alphabet
     Does not attempt to explicitly deal with weird cases (e.g., ambiguous residues).
     The user will need to specify an alphabet with the -a flag if using many non-standard characters in their sequences.
+    Large data sets are guessed from the first residues of records spread across the whole set, and are only scanned
+    in full if that sample is too close to call.
     :param seqbuddy: SeqBuddy object
     :return: IUPAC alphebet object
     """
     seq_list = seqbuddy if isinstance(seqbuddy, list) else seqbuddy.records
-    seq_list = [str(x.seq) for x in seq_list]
-    sequence = "".join(seq_list).upper()
-    sequence = re.sub("[NX\-?]", "", sequence)
+    if not seq_list:
+        return None
 
-    if len(sequence) == 0:
+    num_samples = min(len(seq_list), ALPHA_SAMPLE_RECORDS)
+    sample_length = max(ALPHA_SAMPLE_SIZE // num_samples, 1)
+    step = len(seq_list) / num_samples
+    complete = num_samples == len(seq_list)
+    counts = Counter()
+    for indx in range(num_samples):
+        seq = seq_list[int((indx + 0.5) * step)].seq
+        if len(seq) > sample_length:
+            seq = seq[:sample_length]
+            complete = False
+        counts.update(str(seq))
+
+    alpha = _alphabet_from_counts(counts, margin=0 if complete else ALPHA_SAMPLE_MARGIN)
+    if alpha is not False:
+        return alpha
+
+    # Too close to call, so count everything (one record at a time, to avoid building one giant string)
+    counts = Counter()
+    for rec in seq_list:
+        counts.update(str(rec.seq))
+    return _alphabet_from_counts(counts)
+
+
+def _alphabet_from_counts(counts, margin=0):
+    """
+    :param counts: Residue counts, as a Counter or dict
+    :param margin: Refuse to make a call if the DNA/protein fraction lands within this distance of ALPHA_THRESHOLD
+    :return: IUPAC alphabet object, None if the alphabet can't be determined, or False if the counts are too close
+    """
+    upper_counts = Counter()
+    for residue, count in counts.items():
+        upper_counts[residue.upper()] += count
+    for residue in "NX-?":
+        del upper_counts[residue]
+
+    total = sum(upper_counts.values())
+    if total == 0:
         return None
 
-    if 'U' in sequence:  # U is unique to RNA
+    if upper_counts["U"]:  # U is unique to RNA
         return IUPAC.ambiguous_rna
 
-    percent_dna = len(re.findall("[ATCG]", sequence)) / float(len(sequence))
-    percent_protein = len(re.findall("[ACDEFGHIKLMNPQRSTVWXY]", sequence)) / float(len(sequence))
-    if percent_dna > 0.85:  # odds that a sequence with no Us and such a high ATCG count be anything but DNA is low
+    percent_dna = sum([upper_counts[residue] for residue in "ATCG"]) / float(total)
+    percent_protein = sum([upper_counts[residue] for residue in "ACDEFGHIKLMNPQRSTVWXY"]) / float(total)
+    if abs(percent_dna - ALPHA_THRESHOLD) < margin:
+        return False
+    # odds that a sequence with no Us and such a high ATCG count be anything but DNA is low
+    elif percent_dna > ALPHA_THRESHOLD:
         return IUPAC.ambiguous_dna
-    elif percent_protein > 0.85:
+    elif abs(percent_protein - ALPHA_THRESHOLD) < margin:
+        return False
+    elif percent_protein > ALPHA_THRESHOLD:
         return IUPAC.protein
     else:
         return None
 
 
+@br.profiled("guess_format")
 def _guess_format(_input):
     """
     Loop through many possible formats that BioPython has a parser for, and return the format that is
@@ -587,17 +895,26 @@ def _guess_format(_input):
 
     # If input is a handle or path, try to read the file in each format, and assume success if not error and # seqs > 0
     if os.path.isfile(str(_input)):
-        _input = open(_input, "r", encoding="utf-8")
+        _input = br.open_text(_input)
 
     if str(type(_input)) == "<class '_io.TextIOWrapper'>" or isinstance(_input, StringIO):
         if not _input.seekable():  # Deal with input streams (e.g., stdout pipes)
             _input = StringIO(_input.read())
-        if _input.read() == "":
+        head = _input.read(4096)
+        if head == "":
             return "empty file"
         _input.seek(0)
 
         possible_formats = ["stockholm", "fasta", "gb", "phylipss", "phylipsr", "phylip", "phylip-relaxed",
                             "fastq", "embl", "nexus", "seqxml", "clustal", "swiss"]
+
+        # Sniff the header first, so only the likely candidates need to be trial parsed
+        sniffed = br.sniff_format(head)
+        if sniffed:
+            if sniffed[0] in ["stockholm", "clustal"]:  # These headers can't be mistaken for anything else
+                return sniffed[0]
+            possible_formats = [x for x in possible_formats if x in sniffed] + \
+                               [x for x in possible_formats if x not in sniffed]
         for next_format in possible_formats:
             try:
                 _input.seek(0)
@@ -635,21 +952,499 @@ def _guess_format(_input):
         raise br.GuessError("Unsupported _input argument in guess_format(). %s" % _input)
 
 
+def _molecular_weights(seqbuddy):
+    """
+    Compute single and double stranded (DNA only) masses from per-record residue counts and the weight tables
+    :param seqbuddy: SeqBuddy object
+    :return: Generator of (rec, mass_ss, mass_ds) tuples. mass_ds is None unless the sequences are DNA
+    """
+    if seqbuddy.alpha == IUPAC.protein:
+        weights, ds_weights, mass_ss, mass_ds = AMINO_ACID_WEIGHTS, None, 18.02, None  # Add a water molecule
+    elif seqbuddy.alpha in [IUPAC.ambiguous_dna, IUPAC.unambiguous_dna]:
+        # 5' monophosphate in ssDNA and 5' triphosphate in dsDNA
+        weights, ds_weights, mass_ss, mass_ds = DNA_WEIGHTS, DS_DNA_WEIGHTS, 79.0, 157.9
+    else:
+        weights, ds_weights, mass_ss, mass_ds = RNA_WEIGHTS, None, 159.0, None  # 5' triphosphate in ssRNA
+
+    for rec in seqbuddy.records:
+        seq = str(rec.seq).upper()
+        counts = Counter(seq)
+        if not all(residue in weights for residue in counts):
+            value = [residue for residue in seq if residue not in weights][0]
+            raise KeyError("Invalid residue '{0}' in record {1}. '{0}' is not valid a valid character in "
+                           "{2}.".format(value, rec.id, str(seqbuddy.alpha)))
+        rec_ss = mass_ss + sum([weights[residue] * count for residue, count in counts.items()])
+        rec_ds = None if ds_weights is None else \
+            mass_ds + sum([ds_weights[residue] * count for residue, count in counts.items()])
+        yield rec, rec_ss, rec_ds
+
+
+def _parse_parallel(file_path, in_format, processes=0):
+    """
+    Split a large FASTA/FASTQ file into byte ranges at record boundaries, parse each range in its own process, and
+    concatenate the records back together in their original order.
+    :param file_path: Path to an uncompressed sequence file
+    :param in_format: One of PARALLEL_FORMATS
+    :param processes: Number of worker processes (0 uses br.usable_cpu_count())
+    :return: list of SeqRecord objects
+    """
+    processes = processes if processes else br.usable_cpu_count()
+    ranges = _record_ranges(file_path, in_format, processes)
+    if len(ranges) > 1 and os.name != "nt":  # Multicore doesn't work well on Windows, so just run serial
+        try:
+            with Pool(min(processes, len(ranges))) as pool:
+                chunks = pool.map(_parse_range, [(file_path, in_format, start, end) for start, end in ranges])
+            return [rec for chunk in chunks for rec in chunk]
+        except (ValueError, AssertionError):  # A range boundary was misjudged, so fall back on a serial parse
+            pass
+    with open(file_path, "r", encoding="utf-8") as ifile:
+        return list(SeqIO.parse(ifile, in_format))
+
+
+def _parse_range(args):
+    file_path, in_format, start, end = args
+    with open(file_path, "rb") as ifile:
+        ifile.seek(start)
+        content = ifile.read(end - start).decode("utf-8")
+    return list(SeqIO.parse(StringIO(content), in_format))
+
+
+def _record_ranges(file_path, in_format, num_ranges):
+    """
+    :return: list of (start, end) byte offsets, each range holding whole records
+    """
+    size = os.path.getsize(file_path)
+    boundaries = [0]
+    with open(file_path, "rb") as ifile:
+        for indx in range(1, num_ranges):
+            ifile.seek(max(size * indx // num_ranges, boundaries[-1]))
+            ifile.readline()  # Skip to the start of the next full line
+            offset = _next_record_offset(ifile, in_format)
+            if offset is None:
+                break
+            if offset > boundaries[-1]:
+                boundaries.append(offset)
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _next_record_offset(ifile, in_format):
+    # FASTQ quality lines can also start with '@', so a header is only trusted if the '+' line is two lines down
+    window = []
+    while True:
+        offset = ifile.tell()
+        line = ifile.readline()
+        if not line:
+            return None
+        if in_format == "fasta":
+            if line.startswith(b">"):
+                return offset
+            continue
+        window.append((offset, line))
+        if len(window) == 3:
+            if window[0][1].startswith(b"@") and window[2][1].startswith(b"+"):
+                return window[0][0]
+            window.pop(0)
+
+
+def _translation_table(table=1, numpy=None, start_codons=None):
+    """
+    Codon --> residue lookup covering every combination of the IUPAC nucleotide codes and gaps, built once per NCBI
+    genetic code and cached. Ambiguous codons translate to whatever all of their possible codons agree on
+    (e.g., GCN -> A, TAR -> *), and to X otherwise. Codons with a single gap are X, and codons with more are gaps.
+    :param table: NCBI table ID or name
+    :param numpy: The numpy module, if available. Also build the lookup as a flat array, indexed by encoded codon.
+    :param start_codons: Classify codons for ORF scanning instead of translating them. Stop codons are '*', the
+                         start codons listed here are '>', and everything else is '.'
+    :return: (dict, numpy array or None)
+    """
+    codon_table = _codon_table(IUPAC.ambiguous_dna, table)
+    key = codon_table.id if start_codons is None else (codon_table.id, tuple(sorted(start_codons)))
+    if key not in TRANSLATION_TABLES and start_codons is not None:
+        lookup = {codon: "*" if residue == "*" else ">" if codon in start_codons else "."
+                  for codon, residue in _translation_table(codon_table.id)[0].items()}
+        TRANSLATION_TABLES[key] = [lookup, None]
+
+    elif key not in TRANSLATION_TABLES:
+        stops = set(codon_table.stop_codons)
+        lookup = {}
+        for codon in product(TRANSLATION_CODES, repeat=3):
+            codon = "".join(codon)
+            gaps = codon.count("-")
+            if gaps:
+                lookup[codon] = "-" if gaps > 1 else "X"
+            elif codon in stops:
+                lookup[codon] = "*"
+            else:
+                try:
+                    residue = codon_table.forward_table[codon]
+                    # B, J and Z (D/N, I/L and E/Q) aren't part of the protein alphabet used everywhere else
+                    lookup[codon] = residue if residue not in "BJZ" else "X"
+                except (KeyError, CodonTable.TranslationError):
+                    lookup[codon] = "X"
+        TRANSLATION_TABLES[key] = [lookup, None]
+
+    cached = TRANSLATION_TABLES[key]
+    if numpy and cached[1] is None:
+        # One extra code for characters that aren't nucleotides at all; any codon containing one is X
+        size = len(TRANSLATION_CODES) + 1
+        residues = numpy.full(size ** 3, ord("X"), dtype=numpy.uint8)
+        for codon, residue in cached[0].items():
+            first, second, third = [TRANSLATION_CODES.index(nucl) for nucl in codon]
+            residues[(first * size + second) * size + third] = ord(residue)
+        cached[1] = residues
+    return cached[0], cached[1] if numpy else None
+
+
+def _translate_frames(seq, table=1, frames=(1, 2, 3, -1, -2, -3), numpy=None, start_codons=None):
+    """
+    Translate any of the six reading frames of a nucleotide sequence. The sequence is encoded once and the reverse
+    frames are read off of its complement, so no intermediate sequences are built. Trailing partial codons are dropped.
+    :param seq: Nucleotide sequence (str)
+    :param table: NCBI table ID or name
+    :param frames: Forward frames are 1, 2 and 3, reverse complement frames are -1, -2 and -3
+    :param numpy: The numpy module, if available. Pure python is used otherwise.
+    :param start_codons: Return start/stop codon classes instead of residues (see _translation_table())
+    :return: list of protein sequences (str), in the same order as frames
+    """
+    lookup, residues = _translation_table(table, numpy, start_codons)
+    seq = seq.upper().replace("U", "T").replace(".", "-").replace("X", "N")
+    output = []
+    if numpy:
+        size = len(TRANSLATION_CODES) + 1
+        encoder = numpy.full(256, size - 1, dtype=numpy.intp)
+        complements = numpy.arange(size, dtype=numpy.intp)
+        for indx, nucl in enumerate(TRANSLATION_CODES):
+            encoder[ord(nucl)] = indx
+            complements[indx] = TRANSLATION_CODES.index(DNA_COMPLEMENTS[nucl])
+        encoded = encoder[numpy.frombuffer(seq.encode("ascii", "replace"), dtype=numpy.uint8)]
+        rc_encoded = complements[encoded[::-1]] if [f for f in frames if f < 0] else None
+        for frame in frames:
+            codes = encoded[frame - 1:] if frame > 0 else rc_encoded[abs(frame) - 1:]
+            codes = codes[:len(codes) - len(codes) % 3].reshape(-1, 3)
+            indices = (codes[:, 0] * size + codes[:, 1]) * size + codes[:, 2]
+            output.append(residues[indices].tobytes().decode("ascii"))
+    else:
+        rc_seq = seq[::-1].translate(str.maketrans(DNA_COMPLEMENTS)) if [f for f in frames if f < 0] else None
+        for frame in frames:
+            sub_seq = seq if frame > 0 else rc_seq
+            start = abs(frame) - 1
+            output.append("".join([lookup.get(sub_seq[i:i + 3], "X")
+                                   for i in range(start, len(sub_seq) - 2, 3)]))
+    return output
+
+
+def _frame_features(rec, frame):
+    """
+    Copy a record's features onto one of its six reading frames, the same way that reverse_complement() and
+    select_frame() would move them (this is the inverse of the offsets that find_orfs() applies to its hits)
+    :param rec: Nucleotide SeqRecord
+    :param frame: Forward frames are 1, 2 and 3, reverse complement frames are -1, -2 and -3
+    :return: list of SeqFeature objects, relative to the first residue of the frame
+    """
+    seq_len = len(rec.seq)
+    features = deepcopy(rec.features)
+    if frame < 0:
+        features = [_feature_rc(feature, seq_len) for feature in features]
+    if abs(frame) > 1:
+        features = br.shift_features(features, 1 - abs(frame), seq_len)
+    return features
+
+
+def _translate6frames_shifted(seqbuddy, table=1):
+    """
+    Six frame translation for records that select_frame() has already shifted. Each new frame has to undo that shift
+    first, so the frames are built by actually shifting and reverse complementing copies of the records.
+    :param seqbuddy: SeqBuddy object
+    :param table: NCBI table ID or name
+    :return: list of SeqRecords, six per input record
+    """
+    frame1, frame2, frame3 = make_copy(seqbuddy), make_copy(seqbuddy), make_copy(seqbuddy)
+    seqbuddy = reverse_complement(make_copy(seqbuddy))
+    rframe1, rframe2, rframe3 = make_copy(seqbuddy), make_copy(seqbuddy), make_copy(seqbuddy)
+
+    frame2 = select_frame(frame2, 2, add_metadata=False)
+    frame3 = select_frame(frame3, 3, add_metadata=False)
+    rframe2 = select_frame(rframe2, 2, add_metadata=False)
+    rframe3 = select_frame(rframe3, 3, add_metadata=False)
+
+    frames = [translate_cds(frame, quiet=True, table=table)
+              for frame in [frame1, frame2, frame3, rframe1, rframe2, rframe3]]
+
+    output = []
+    for i in range(len(frame1)):
+        for frame, suffix in zip(frames, ["f1", "f2", "f3", "rf1", "rf2", "rf3"]):
+            frame.records[i].id = "%s_%s" % (frame.records[i].id, suffix)
+            output.append(frame.records[i])
+    return output
+
+
 def make_copy(seqbuddy):
     """
-    Deepcopy a SeqBuddy object. The alphabet objects are not handled properly when deepcopy is called,
-    so need to wrap it.
+    Copy a SeqBuddy object. Records are copied with br.copy_records(), which skips the deepcopy of the sequence data.
+    The alphabet objects are not handled properly when deepcopy is called, so they are carried over directly.
     :param seqbuddy: SeqBuddy object
     :return: SeqBuddy object
     """
-    alphabet_list = [rec.seq.alphabet for rec in seqbuddy.records]
-    _copy = deepcopy(seqbuddy)
+    records = seqbuddy.records
+    seqbuddy.records = []
+    try:
+        _copy = deepcopy(seqbuddy)
+    finally:
+        seqbuddy.records = records
+    _copy.records = br.copy_records(records)
     _copy.alpha = seqbuddy.alpha
-    for indx, rec in enumerate(_copy.records):
-        rec.seq.alphabet = alphabet_list[indx]
     return _copy
 
 
+class SeqIndex(object):
+    """
+    faidx-style offset index for large FASTA, FASTQ and GenBank files.
+    The index is saved next to the sequence file (<file>.sbi) and reused until the file changes. Whole records, or
+    parts of FASTA sequences, are read directly out of the file with mmap, so nothing is parsed until it's needed.
+    BGZF compressed files (bgzip, or SeqBuddy '-o <format>.gz' output) are indexed on their uncompressed offsets.
+    pull_recs(), pull_random_recs(), extract_regions() and delete_records() accept a SeqIndex in place of a SeqBuddy.
+    """
+    Entry = namedtuple("Entry", ["offset", "nbytes", "seq_len", "seq_offset", "line_bases", "line_width",
+                                 "id", "name", "description"])
+
+    def __init__(self, file_path, in_format=None, out_format=None, alpha=None):
+        if not os.path.isfile(str(file_path)):
+            raise ValueError("SeqIndex requires a path to a sequence file, not '%s'" % file_path)
+
+        self.path = os.path.abspath(file_path)
+        self.compression = br.compression_type(self.path)
+        if self.compression not in [None, "bgzf"]:
+            raise ValueError("Only BGZF compressed files can be indexed, but '%s' is %s compressed. Recompress it with "
+                             "bgzip, or with 'SeqBuddy.py <file> -o <format>.gz'." % (file_path, self.compression))
+        self.in_format = in_format.lower() if in_format else _guess_format(self.path)
+        if self.in_format not in INDEX_FORMATS:
+            raise ValueError("Unable to index '%s' files. Supported formats: %s" %
+                             (self.in_format, ", ".join(INDEX_FORMATS)))
+        self.out_format = out_format if out_format else self.in_format
+        self.alpha = alpha
+        self.index_path = "%s.sbi" % self.path
+        self.entries = []
+        self.blocks = []  # BGZF (block offset, uncompressed offset) pairs
+        self._mmap = None
+        self._reader = None
+        if not self._load():
+            self._build()
+            self._save()
+        self._block_starts = [block[1] for block in self.blocks]
+        self.positions = {}
+        for indx, entry in enumerate(self.entries):
+            self.positions.setdefault(entry.id, indx)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, rec_id):
+        return rec_id in self.positions
+
+    def _stamp(self):
+        stats = os.stat(self.path)
+        return "#sbi\t%s\t%s\t%s" % (self.in_format, stats.st_size, stats.st_mtime)
+
+    def _load(self):
+        if not os.path.isfile(self.index_path):
+            return False
+        with open(self.index_path, "r", encoding="utf-8") as ifile:
+            if ifile.readline().rstrip("\n") != self._stamp():
+                return False
+            for line in ifile:
+                if line.startswith("#blk\t"):
+                    self.blocks.append(tuple([int(x) for x in line.split("\t")[1:]]))
+                    continue
+                line = line.rstrip("\n").split("\t", 8)
+                self.entries.append(self.Entry(*[int(x) for x in line[:6]], *line[6:]))
+        return True
+
+    def _save(self):
+        try:
+            with open(self.index_path, "w", encoding="utf-8") as ofile:
+                ofile.write("%s\n" % self._stamp())
+                for block in self.blocks:
+                    ofile.write("#blk\t%s\t%s\n" % block)
+                for entry in self.entries:
+                    ofile.write("%s\n" % "\t".join([str(x) for x in entry]))
+        except OSError:  # Read-only location, so just keep the index in memory
+            pass
+
+    def _build(self):
+        if self.compression:
+            with open(self.path, "rb") as ifile:
+                self.blocks = [(start, data_start) for start, raw_len, data_start, data_len
+                               in bgzf.BgzfBlocks(ifile) if data_len]
+
+        with gzip.open(self.path, "rb") if self.compression else open(self.path, "rb") as ifile:
+            if self.in_format == "fasta":
+                self._build_fasta(ifile)
+            elif self.in_format in ["gb", "genbank"]:
+                self._build_genbank(ifile)
+            else:
+                self._build_fastq(ifile)
+
+    def _build_fasta(self, ifile):
+        offset = 0
+        header = None
+        lines = []
+
+        def add_entry():
+            while lines and not lines[-1].strip():
+                lines.pop()
+            title = header[1][1:].decode("utf-8").rstrip().replace("\t", " ")
+            rec_id = title.split(None, 1)[0] if title else ""
+            bases = [len(line.rstrip()) for line in lines]
+            widths = [len(line) for line in lines]
+            uniform = len(set(widths[:-1])) <= 1 and len(set(bases[:-1])) <= 1 and \
+                (len(bases) < 2 or bases[-1] <= bases[0])
+            uniform = uniform and not any(b" " in line.strip() for line in lines)
+            line_bases, line_width = (bases[0], widths[0]) if lines and uniform else (0, 0)
+            self.entries.append(self.Entry(header[0], offset - header[0], sum(bases),
+                                           header[0] + len(header[1]), line_bases, line_width,
+                                           rec_id, rec_id, title))
+
+        for line in ifile:
+            if line.startswith(b">"):
+                if header:
+                    add_entry()
+                header = (offset, line)
+                lines = []
+            elif header:
+                lines.append(line)
+            offset += len(line)
+        if header:
+            add_entry()
+
+    def _build_fastq(self, ifile):
+        offset = 0
+        start, title, seq_len, qual_len, in_qual = None, None, 0, 0, False
+        for line in ifile:
+            if start is None:
+                if line.startswith(b"@"):
+                    start, title, seq_len, qual_len, in_qual = offset, line[1:].decode("utf-8").strip(), 0, 0, False
+            elif not in_qual:
+                if line.startswith(b"+"):
+                    in_qual = True
+                else:
+                    seq_len += len(line.strip())
+            else:
+                qual_len += len(line.strip())
+            offset += len(line)
+            if in_qual and qual_len >= seq_len:
+                title = title.replace("\t", " ")
+                rec_id = title.split(None, 1)[0] if title else ""
+                self.entries.append(self.Entry(start, offset - start, seq_len, 0, 0, 0, rec_id, rec_id, title))
+                start = None
+
+    def _build_genbank(self, ifile):
+        offset = 0
+        start, name, accession, version, definition, field = None, "", "", "", [], None
+        for line in ifile:
+            if line.startswith(b"LOCUS"):
+                start, accession, version, definition, field = offset, "", "", [], None
+                name = line.decode("utf-8").split()[1] if len(line.split()) > 1 else ""
+            elif start is not None:
+                if line[:12].strip():
+                    field = line[:12].decode("utf-8").strip()
+                    value = line[12:].decode("utf-8").strip()
+                    if field == "DEFINITION":
+                        definition.append(value)
+                    elif field == "ACCESSION" and value:
+                        accession = value.split()[0]
+                    elif field == "VERSION" and value:
+                        version = value.split()[0]
+                elif field == "DEFINITION" and not line.startswith(b"//"):
+                    definition.append(line.decode("utf-8").strip())
+
+                if line.startswith(b"//"):
+                    offset += len(line)
+                    description = " ".join(definition).replace("\t", " ")
+                    description = description[:-1] if description.endswith(".") else description
+                    rec_id = version if version else accession if accession else name
+                    self.entries.append(self.Entry(start, offset - start, 0, 0, 0, 0, rec_id, name, description))
+                    start, field = None, None
+                    continue
+            offset += len(line)
+
+    def _open(self):
+        if not self._mmap:
+            with open(self.path, "rb") as ifile:
+                if not os.fstat(ifile.fileno()).st_size:  # mmap can't map an empty file
+                    return b""
+                self._mmap = mmap.mmap(ifile.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def _read(self, offset, nbytes):
+        if not self.compression:
+            return self._open()[offset:offset + nbytes]
+
+        if not self._reader:
+            self._reader = bgzf.BgzfReader(self.path, "rb")
+        block_start, data_start = self.blocks[bisect_right(self._block_starts, offset) - 1]
+        self._reader.seek(bgzf.make_virtual_offset(block_start, offset - data_start))
+        return self._reader.read(nbytes)
+
+    def close(self):
+        if self._mmap:
+            self._mmap.close()
+            self._mmap = None
+        if self._reader:
+            self._reader.close()
+            self._reader = None
+
+    def get_records(self, positions):
+        """
+        :param positions: List of indices into self.entries
+        :return: List of SeqRecord objects
+        """
+        records = []
+        for indx in positions:
+            entry = self.entries[indx]
+            content = self._read(entry.offset, entry.nbytes).decode("utf-8")
+            records.append(SeqIO.read(StringIO(content), self.in_format))
+        return records
+
+    def iter_records(self):
+        """
+        Parse every record in a single pass over the file, for searches that need more than the index holds
+        :return: Generator of SeqRecord objects
+        """
+        with br.open_text(self.path) as ifile:
+            for rec in SeqIO.parse(ifile, self.in_format):
+                yield rec
+
+    def get_subseq(self, position, start, end):
+        """
+        Read part of a FASTA sequence without loading the rest of the record
+        :param position: Index into self.entries
+        :param start: First residue (0-based, inclusive)
+        :param end: Last residue (0-based, exclusive)
+        :return: str
+        """
+        entry = self.entries[position]
+        if not entry.line_bases:  # Irregular line lengths or not FASTA, so the record needs to be parsed
+            return str(self.get_records([position])[0].seq)[start:end]
+        start, end = max(start, 0), min(end, entry.seq_len)
+        if start >= end:
+            return ""
+
+        def byte_pos(residue):
+            return entry.seq_offset + (residue // entry.line_bases) * entry.line_width + residue % entry.line_bases
+
+        content = self._read(byte_pos(start), byte_pos(end - 1) + 1 - byte_pos(start)).decode("utf-8")
+        return re.sub("[\r\n]", "", content)
+
+    def to_seqbuddy(self, positions=None):
+        """
+        :param positions: List of indices into self.entries (all records if None)
+        :return: SeqBuddy object
+        """
+        positions = range(len(self.entries)) if positions is None else positions
+        return SeqBuddy(self.get_records(positions), self.in_format, self.out_format, self.alpha)
+
+
 # ################################################ MAIN API FUNCTIONS ################################################ #
 def annotate(seqbuddy, _type, location, strand=None, qualifiers=None, pattern=None):
     """
@@ -1302,110 +2097,102 @@ def concat_seqs(seqbuddy, clean=False):
     return seqbuddy
 
 
-def count_codons(seqbuddy):
+def count_codons(seqbuddy, table=1, aggregate=False):
     """
     Generate frequency statistics for codon composition
     :param seqbuddy: SeqBuddy object
+    :param table: NCBI genetic code used to assign amino acids to codons (table ID or name)
+    :param aggregate: Pool the codons from all records into a single table, keyed as 'aggregate' in the output
     :return: A tuple containing the original SeqBuddy object and a dictionary - dict[id][codon] = (Amino acid, num, %)
     """
     if seqbuddy.alpha not in [IUPAC.ambiguous_dna, IUPAC.unambiguous_dna, IUPAC.ambiguous_rna, IUPAC.unambiguous_rna]:
         raise TypeError("Nucleic acid sequence required, not protein or other.")
-    if seqbuddy.alpha in [IUPAC.ambiguous_dna, IUPAC.unambiguous_dna]:
-        codontable = CodonTable.ambiguous_dna_by_name['Standard'].forward_table
-    else:
-        codontable = CodonTable.ambiguous_rna_by_name['Standard'].forward_table
-    output = OrderedDict()
-    sb_copy = make_copy(seqbuddy)
-    replace_subsequence(sb_copy, "[-.]")
-    uppercase(sb_copy)
-    for rec in sb_copy.records:
-        sequence = str(rec.seq)
-        if len(sequence) % 3 != 0:
-            while len(sequence) % 3 != 0:
-                sequence = sequence[:-1]
-        data_table = {}
-        num_codons = len(sequence) / 3
-        while len(sequence) > 0:
-            codon = str(sequence[:3])
-            if codon in data_table:
-                data_table[codon][1] += 1
+    codontable = _codon_table(seqbuddy.alpha, table)
+    stop_codons = set(codontable.stop_codons)
+    gaps = str.maketrans("", "", "-.")
+    invalid = set()
+
+    def frequencies(counts, num_codons):
+        data_table = OrderedDict()
+        for codon in sorted(counts):
+            if codon == 'NNN':
+                amino_acid = 'X'
+            elif codon in stop_codons:
+                amino_acid = '*'
             else:
-                if codon in ['ATG', 'AUG']:
-                    data_table[codon] = ['M', 1, 0.0]
-                elif codon == 'NNN':
-                    data_table[codon] = ['X', 1, 0.0]
-                elif codon in ['TAA', 'TAG', 'TGA', 'UAA', 'UAG', 'UGA']:
-                    data_table[codon] = ['*', 1, 0.0]
-                else:
-                    try:
-                        data_table[codon] = [codontable[codon], 1, 0.0]
-                    except KeyError:
+                try:
+                    amino_acid = codontable.forward_table[codon]
+                except KeyError:
+                    if codon not in invalid:
                         br._stderr("Warning: Codon '{0}' is invalid. Codon will be skipped.\n".format(codon))
-            sequence = sequence[3:]
-        for codon in data_table:
-            data_table[codon][2] = round(data_table[codon][1] / float(num_codons) * 100, 3)
-        output[rec.id] = OrderedDict(sorted(list(data_table.items()), key=lambda x: x[0]))
+                        invalid.add(codon)
+                    continue
+            data_table[codon] = [amino_acid, counts[codon], round(counts[codon] / float(num_codons) * 100, 3)]
+        return data_table
+
+    output = OrderedDict()
+    pooled_counts = Counter()
+    pooled_num = 0
     for rec in seqbuddy.records:
+        sequence = str(rec.seq).translate(gaps).upper()
+        num_codons = len(sequence) // 3
+        counts = Counter([sequence[indx:indx + 3] for indx in range(0, num_codons * 3, 3)])
+        output[rec.id] = frequencies(counts, num_codons)
         try:
             rec.buddy_data['Codon_frequency'] = output[rec.id]
         except AttributeError:
             rec.buddy_data = OrderedDict({'Codon_frequency': output[rec.id]})
+        if aggregate:
+            pooled_counts.update(counts)
+            pooled_num += num_codons
+
+    if aggregate:
+        output = OrderedDict([("aggregate", frequencies(pooled_counts, pooled_num))])
     return seqbuddy, output
 
 
-def count_residues(seqbuddy):
+def count_residues(seqbuddy, aggregate=False):
     """
     Generate frequency statistics for residue composition
     :param seqbuddy: SeqBuddy object
+    :param aggregate: Also pool the residues from all records, and store the result in seqbuddy.res_count
     :return: annotated SeqBuddy object. Residue counts are appended to buddy_data in the SeqRecord obects
     """
-    for rec in seqbuddy.records:
-        resid_count = {}
-        seq = str(rec.seq).upper()
-        for char in seq:
-            resid_count.setdefault(char, 0)
-            resid_count[char] += 1
-
-        seq_len = len(rec)
-        for residue, count in list(resid_count.items()):
-            resid_count[residue] = [count, count / seq_len]
-
-        if seqbuddy.alpha is IUPAC.protein:
-            ambig = len(re.findall("X", seq))
-            if ambig > 0:
-                resid_count['% Ambiguous'] = round(100 * ambig / seq_len, 2)
-
-            pos = len(re.findall("[HKR]", seq))
-            resid_count['% Positive'] = round(100 * pos / seq_len, 2)
-
-            neg = len(re.findall("[DEC]", seq))
-            resid_count['% Negative'] = round(100 * neg / seq_len, 2)
-
-            neut = len(re.findall("[GAVLIPFYWSTNQM]", seq))
-            resid_count['% Uncharged'] = round(100 * neut / seq_len, 2)
-
-            hydrophobic = len(re.findall("[AVLIPYFWMC]", seq))
-            resid_count['% Hydrophobic'] = round(100 * hydrophobic / seq_len, 2)
-
-            hydrophilic = len(re.findall("[NQSTKRHDE]", seq))
-            resid_count['% Hydrophilic'] = round(100 * hydrophilic / seq_len, 2)
-
+    protein = seqbuddy.alpha is IUPAC.protein
+    classes = [('% Positive', "HKR"), ('% Negative', "DEC"), ('% Uncharged', "GAVLIPFYWSTNQM"),
+               ('% Hydrophobic', "AVLIPYFWMC"), ('% Hydrophilic', "NQSTKRHDE")]
+
+    def composition(counts, seq_len):
+        resid_count = {residue: [count, count / seq_len] for residue, count in counts.items()}
+        if protein:
+            if counts["X"]:
+                resid_count['% Ambiguous'] = round(100 * counts["X"] / seq_len, 2)
+            for label, residues in classes:
+                resid_count[label] = round(100 * sum([counts[residue] for residue in residues]) / seq_len, 2)
             for residue in ["A", "C", "D", "E", "F", "G", "H", "I", "K", "L", "M",
                             "N", "P", "Q", "R", "S", "T", "V", "W", "Y"]:
                 resid_count.setdefault(residue, [0, 0])
-
         else:
-            ambig = len(re.findall("[^ATCGU]", seq))
+            ambig = sum(counts.values()) - sum([counts[residue] for residue in "ATCGU"])
             if ambig > 0:
                 resid_count['% Ambiguous'] = round(100 * ambig / seq_len, 2)
-
             for residue in ["A", "G", "C"]:
                 resid_count.setdefault(residue, [0, 0])
-
             if "T" not in resid_count and "U" not in resid_count:
                 resid_count["T"] = [0, 0]
+        return OrderedDict(sorted(resid_count.items()))
 
-        _add_buddy_data(rec, "res_count", OrderedDict(sorted(resid_count.items())))
+    pooled_counts = Counter()
+    pooled_len = 0
+    for rec in seqbuddy.records:
+        counts = Counter(str(rec.seq).upper())
+        _add_buddy_data(rec, "res_count", composition(counts, len(rec) or 1))
+        if aggregate:
+            pooled_counts.update(counts)
+            pooled_len += len(rec)
+
+    if aggregate:
+        seqbuddy.res_count = composition(pooled_counts, pooled_len or 1)
     return seqbuddy
 
 
@@ -1610,7 +2397,7 @@ def delete_metadata(seqbuddy):
 def delete_records(seqbuddy, patterns):
     """
     Deletes records with IDs matching a regex pattern
-    :param seqbuddy: SeqBuddy object
+    :param seqbuddy: SeqBuddy object, or SeqIndex to only read in the records that are needed
     :param patterns: A single regex pattern, or list of patterns, to search with
     :type patterns: list str
     :return: The modified SeqBuddy object
@@ -1623,16 +2410,15 @@ def delete_records(seqbuddy, patterns):
     for indx, pattern in enumerate(patterns):
         patterns[indx] = ".*" if pattern == "*" else pattern
 
-    patterns = "|".join(patterns)
+    patterns = re.compile("|".join(patterns))
 
-    retained_records = []
-    deleted = [rec.id for rec in pull_recs(make_copy(seqbuddy), patterns).records]
-    for rec in seqbuddy.records:
-        if rec.id in deleted:
-            continue
-        else:
-            retained_records.append(rec)
-    seqbuddy.records = retained_records
+    if type(seqbuddy) == SeqIndex:
+        deleted = set([entry.id for entry in seqbuddy.entries
+                       if patterns.search(entry.id) or patterns.search(entry.name)])
+        return seqbuddy.to_seqbuddy([indx for indx, entry in enumerate(seqbuddy.entries) if entry.id not in deleted])
+
+    deleted = set([rec.id for rec in seqbuddy.records if patterns.search(rec.id) or patterns.search(rec.name)])
+    seqbuddy.records = [rec for rec in seqbuddy.records if rec.id not in deleted]
     return seqbuddy
 
 
@@ -1643,34 +2429,25 @@ def delete_repeats(seqbuddy, scope='all'):  # scope in ['all', 'ids', 'seqs']
     :param scope: Specifies if deleting repeat seqs, ids, or all
     :return: The modified SeqBuddy object
     """
-    # First, remove duplicate IDs
+    # First, remove duplicate IDs (the first record with each repeated ID is kept)
     if scope in ['all', 'ids']:
         find_repeats(seqbuddy)
         if len(seqbuddy.repeat_ids) > 0:
-            for rep_id in seqbuddy.repeat_ids:
-                store_one_copy = pull_recs(make_copy(seqbuddy), ["^%s$" % rep_id]).records[0]
-                delete_records(seqbuddy, "^%s$" % rep_id)
-                seqbuddy.records.append(store_one_copy)
+            store_one_copy = [seqbuddy.records[indices[0]] for indices in seqbuddy.repeat_ids.values()]
+            seqbuddy.records = [rec for rec in seqbuddy.records if rec.id not in seqbuddy.repeat_ids]
+            seqbuddy.records += store_one_copy
 
-    # Then remove duplicate sequences
+    # Then remove duplicate sequences, only keeping the first record that each sequence appears in. Records are
+    # dropped individually, so this still works if the same ID is attached to more than one of them.
     if scope in ['all', 'seqs']:
-        find_repeats(seqbuddy)
-        if len(seqbuddy.repeat_seqs) > 0:
-            rep_seq_ids = []
-            for seq in seqbuddy.repeat_seqs:
-                rep_seq_ids.append([])
-                for rep_seq_id in seqbuddy.repeat_seqs[seq]:
-                    rep_seq_ids[-1].append(rep_seq_id)
-
-            repeat_regex = ""
-
-            for repeat_seqs in rep_seq_ids:
-                for rep_seq in repeat_seqs[1:]:
-                    rep_seq = re.sub("([|.*?^\[\]()])", r"\\\1", rep_seq)
-                    repeat_regex += "^%s$|" % rep_seq
-
-            repeat_regex = repeat_regex[:-1]
-            delete_records(seqbuddy, repeat_regex)
+        seen = set()
+        retained_records = []
+        for rec in seqbuddy.records:
+            digest = md5(str(rec.seq).encode("utf-8")).hexdigest()
+            if digest not in seen:
+                seen.add(digest)
+                retained_records.append(rec)
+        seqbuddy.records = retained_records
 
     seqbuddy.repeat_seqs = OrderedDict()
     seqbuddy.repeat_ids = OrderedDict()
@@ -1785,7 +2562,7 @@ def extract_feature_sequences(seqbuddy, patterns):
 def extract_regions(seqbuddy, positions):
     """
     Fine grained control of what residues to pull out of the sequences
-    :param seqbuddy: SeqBuddy object
+    :param seqbuddy: SeqBuddy object, or SeqIndex to only read in the records that are needed
     :param positions: Position code describing which residues to pull (str)
 
     Position Code:  - Always a string
@@ -1809,8 +2586,7 @@ def extract_regions(seqbuddy, positions):
             num = max_len
         return num
 
-    def create_residue_list(_rec, _positions):
-        rec_len = len(_rec.seq)
+    def create_residue_list(rec_len, _positions):
         singlets = []
         for _position in _positions:
             # Singlets
@@ -1862,9 +2638,7 @@ def extract_regions(seqbuddy, positions):
         singlets = sorted(singlets)
         return singlets
 
-    new_records = []
-    for rec in seqbuddy.records:
-        new_rec_positions = create_residue_list(rec, positions)
+    def extract_record(rec, new_rec_positions):
         letter_annotations = {}
         for anno_type in rec.letter_annotations:
             letter_annotations[anno_type] = [None for _ in range(len(new_rec_positions))]
@@ -1892,138 +2666,132 @@ def extract_regions(seqbuddy, positions):
             new_seq = Seq(new_seq, alphabet=rec.seq.alphabet)
             new_seq = SeqRecord(new_seq, id=rec.id, name=rec.name, description=rec.description, dbxrefs=rec.dbxrefs,
                                 annotations=rec.annotations, letter_annotations=letter_annotations)
+        return new_seq
 
-        new_records.append(new_seq)
+    new_records = []
+    if type(seqbuddy) == SeqIndex:
+        for indx, entry in enumerate(seqbuddy.entries):
+            if entry.line_bases:  # Regularly wrapped FASTA, so only read in the residues that are needed
+                new_rec_positions = create_residue_list(entry.seq_len, positions)
+                new_seq = ""
+                if new_rec_positions:
+                    first = new_rec_positions[0]
+                    subseq = seqbuddy.get_subseq(indx, first, new_rec_positions[-1] + 1)
+                    new_seq = "".join([subseq[pos - first] for pos in new_rec_positions])
+                new_records.append(SeqRecord(Seq(new_seq), id=entry.id, name=entry.name,
+                                             description=entry.description))
+            else:
+                rec = seqbuddy.get_records([indx])[0]
+                new_records.append(extract_record(rec, create_residue_list(len(rec.seq), positions)))
+    else:
+        for rec in seqbuddy.records:
+            new_records.append(extract_record(rec, create_residue_list(len(rec.seq), positions)))
 
     seqbuddy = SeqBuddy(new_records, out_format=seqbuddy.out_format, alpha=seqbuddy.alpha)
     return seqbuddy
 
 
-def find_cpg(seqbuddy):
+def find_cpg(seqbuddy, window=200, min_gc=0.5, min_oe=0.6, score_track=False):
     """
     Predicts locations of CpG islands in DNA sequences
     :param seqbuddy: SeqBuddy object
+    :param window: Size of the sliding window (shrinks to fit sequences shorter than the window)
+    :param min_gc: Mean GC fraction a position must exceed to be part of an island
+    :param min_oe: Mean observed/expected CpG ratio a position must exceed to be part of an island
+    :param score_track: Also store the per-base (GC fraction, observed/expected) tracks in buddy_data["cpg_scores"]
     :return: Modified SeqBuddy object (buddy_data["cpgs"] appended to all records)
     """
     seqbuddy = clean_seq(seqbuddy)
     if seqbuddy.alpha not in [IUPAC.ambiguous_dna, IUPAC.unambiguous_dna]:
         raise TypeError("DNA sequence required, not protein or RNA.")
+    if type(window) != int or window < 1:
+        raise ValueError("The CpG window size must be a positive integer, not '%s'" % window)
 
-    records = []
-
-    def cpg_calc(in_seq):  # Returns observed/expected value of a sequence
-        in_seq = in_seq.upper()
-        observed_cpg = len(re.findall("CG", in_seq)) * len(in_seq)
-        expected = (len(re.findall("[CG]", in_seq)) / 2) ** 2
-        expected = 1 if not expected else expected  # Prevent DivByZero
-        return observed_cpg / expected
-
-    def cg_percent(in_seq):  # Returns the CG % of a sequence
-        in_seq = in_seq.upper()
-        return len(re.findall("[CG]", in_seq)) / len(in_seq)
-
-    def find_islands(cg_percents, oe_values):  # Returns a list of tuples containing the start and end of an island
-        _indx = 0
-        out_list = []
-        while _indx < len(cg_percents):
-            if cg_percents[_indx] > .5 and oe_values[_indx] > .6:
-                start = _indx
-                while _indx < len(cg_percents) and cg_percents[_indx] > .5 and oe_values[_indx] > .6:
-                    _indx += 1
-                end = _indx
-                out_list.append((start, end))
-            _indx += 1
-        return out_list
-
-    def map_cpg(in_seq, island_ranges):  # Maps CpG islands onto a sequence as capital letters
-        cpg_seq = in_seq.lower()
-        for pair in island_ranges:
-            cpg_seq = cpg_seq[:pair[0]] + cpg_seq[pair[0]:pair[1] + 1].upper() + cpg_seq[pair[1] + 1:]
-        return cpg_seq
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
 
+    records = []
     for rec in seqbuddy.records:
-        seq = rec.seq
-
-        oe_vals_list = [0 for _ in range(len(seq))]
-        cg_percent_list = [0 for _ in range(len(seq))]
-        window_size = len(seq) if len(seq) < 200 else 200
-
-        for indx, window in enumerate([seq[i:i + window_size] for i in range(len(seq) - window_size + 1)]):
-            cpg = cpg_calc(str(window))
-            for i in range(window_size):
-                oe_vals_list[indx + i] += cpg
+        seq = str(rec.seq)
+        indices, gc_track, oe_track = _cpg_islands(seq.upper(), min(len(seq), window), min_gc, min_oe, numpy)
 
-            cg_perc = cg_percent(str(window))
-            for i in range(window_size):
-                cg_percent_list[indx + i] += cg_perc
+        # Map the islands onto the sequence as capital letters
+        cpg_seq, prev_end = [], 0
+        for start, end in indices:
+            cpg_seq += [seq[prev_end:start].lower(), seq[start:end + 1].upper()]
+            prev_end = end + 1
+        cpg_seq.append(seq[prev_end:].lower())
 
-        for indx in range(len(oe_vals_list)):
-            if indx + 1 <= window_size:
-                oe_vals_list[indx] /= (indx + 1)
-                cg_percent_list[indx] /= (indx + 1)
-
-            elif (len(oe_vals_list) - window_size) - (indx + 1) < 0:
-                oe_vals_list[indx] /= (len(oe_vals_list) - indx)
-                cg_percent_list[indx] /= (len(cg_percent_list) - indx)
-
-            else:
-                oe_vals_list[indx] /= window_size
-                cg_percent_list[indx] /= window_size
-
-        indices = find_islands(cg_percent_list, oe_vals_list)
         cpg_features = [SeqFeature(location=FeatureLocation(start, end), type="CpG_island",
                                    qualifiers={'created_by': 'SeqBuddy'}) for (start, end) in indices]
         for feature in rec.features:
             cpg_features.append(feature)
-        rec = SeqRecord(map_cpg(seq, indices), id=rec.id, name=rec.name, description=rec.description,
-                        dbxrefs=rec.dbxrefs, features=cpg_features, annotations=rec.annotations,
-                        letter_annotations=rec.letter_annotations)
+        rec = SeqRecord(Seq("".join(cpg_seq), alphabet=rec.seq.alphabet), id=rec.id, name=rec.name,
+                        description=rec.description, dbxrefs=rec.dbxrefs, features=cpg_features,
+                        annotations=rec.annotations, letter_annotations=rec.letter_annotations)
 
         records.append(rec)
         _add_buddy_data(rec, "cpgs", indices)
+        if score_track:
+            _add_buddy_data(rec, "cpg_scores", (gc_track, oe_track))
     seqbuddy.records = records
     return seqbuddy
 
 
-def find_orfs(seqbuddy, include_feature=True, include_buddy_data=True):
+def find_orfs(seqbuddy, include_feature=True, include_buddy_data=True, min_length=0, alt_starts=False, table=1):
     """
-    Finds all the open reading frames in the sequences and their reverse complements.
+    Finds all the open reading frames in the sequences and their reverse complements. Each of the six frames is scanned
+    once, and an ORF runs from the first start codon after a stop through to the next in-frame stop codon.
     :param seqbuddy: SeqBuddy object
     :param include_feature: Add a new 'orf' feature to records
     :param include_buddy_data: Append information directly to records
+    :param min_length: Minimum ORF length in nucleotides (stop codon included)
+    :param alt_starts: Also open ORFs on the alternative start codons of the genetic code (e.g., TTG and CTG)
+    :param table: NCBI genetic code, as a table ID or name
     :return: Annotated SeqBuddy object. The match indices are also stored in rec.buddy_data["find_orfs"].
     """
     if seqbuddy.alpha == IUPAC.protein:
         raise TypeError("Nucleic acid sequence required, not protein.")
 
-    pattern = "a[tu]g(?:...)*?(?:[tu]aa|[tu]ag|[tu]ga)"
-
-    clean_seq(seqbuddy)
-    lowercase(seqbuddy)
+    codon_table = _codon_table(IUPAC.ambiguous_dna, table)
+    start_codons = codon_table.start_codons if alt_starts else ["ATG"]
 
-    find_pattern(seqbuddy, pattern, ambig=True, include_feature=True, include_buddy_data=False)
-    lowercase(seqbuddy)
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
 
-    reverse_complement(seqbuddy)
-    find_pattern(seqbuddy, pattern, ambig=True, include_feature=True, include_buddy_data=False)
+    clean_seq(seqbuddy)
     lowercase(seqbuddy)
 
-    reverse_complement(seqbuddy)
-
     for rec in seqbuddy.records:
+        seq_len = len(rec.seq)
         buddy_data = {'+': [], '-': []}
-        feature_indicies = []
-        for indx, feature in enumerate(rec.features):
-            if 'regex' in list(feature.qualifiers.keys()) and feature.qualifiers['regex'] == pattern:
-                if include_feature:
-                    feature.type = "orf"
-                    strand = "+" if feature.strand == +1 else "-"
-                    feature.qualifiers.pop("regex")
-                    buddy_data[strand].append((int(feature.location.start), int(feature.location.end)))
-                else:
-                    feature_indicies.append(indx)
-        for indx in sorted(feature_indicies, reverse=True):
-            del rec.features[indx]
+        frames = _translate_frames(str(rec.seq), codon_table.id, numpy=numpy, start_codons=start_codons)
+        for frame, codons in zip([1, 2, 3, -1, -2, -3], frames):
+            offset = abs(frame) - 1
+            start = codons.find(">")
+            stop = codons.find("*", start) if start != -1 else -1
+            while stop != -1:
+                orf_start, orf_end = offset + start * 3, offset + stop * 3 + 3
+                if orf_end - orf_start >= min_length:
+                    if frame > 0:
+                        buddy_data['+'].append((orf_start, orf_end))
+                    else:
+                        buddy_data['-'].append((seq_len - orf_end, seq_len - orf_start))
+                start = codons.find(">", stop)
+                stop = codons.find("*", start) if start != -1 else -1
+
+        # Forward ORFs are listed 5' to 3' along the top strand, and reverse ORFs along the bottom strand
+        buddy_data['+'].sort()
+        buddy_data['-'].sort(reverse=True)
+
+        if include_feature:
+            for strand, orfs in [(+1, buddy_data['+']), (-1, buddy_data['-'])]:
+                rec.features += [SeqFeature(location=FeatureLocation(orf[0], orf[1], strand=strand), type="orf",
+                                            qualifiers={'added_by': 'SeqBuddy'}) for orf in orfs]
 
         if include_buddy_data:
             _add_buddy_data(rec, 'find_orfs')
@@ -2112,66 +2880,63 @@ def find_pattern(seqbuddy, *patterns, ambig=False, include_feature=True, include
     return seqbuddy
 
 
-def find_repeats(seqbuddy):
+def find_repeats(seqbuddy, ignore_case=False, ignore_gaps=False):
     """
     Finds sequences with identical IDs or sequences
     :param seqbuddy: SeqBuddy object
-    :return: modified seqbuddy object with three new attributes --> unique_seqs, repeat_ids, and repeat_seqs
+    :param ignore_case: Compare sequences without regard to upper/lower case
+    :param ignore_gaps: Compare sequences after stripping gap characters ('-' and '.')
+    :return: modified seqbuddy object with three new attributes --> unique_seqs {id: rec},
+    repeat_ids {id: [record indices]}, and repeat_seqs {md5 digest: [ids]}
+    Note that repeat_ids used to hold lists of records. Use seqbuddy.records[indx] to get the records back.
     """
     unique_seqs = OrderedDict()
     repeat_ids = OrderedDict()
     repeat_seqs = OrderedDict()
 
-    # First find replicate IDs
-    # MD5 hash all sequences as we go for memory efficiency when looking for replicate sequences (below)
-    # Need to work from a copy though, so sequences aren't overwritten
-    seqbuddy_copy = make_copy(seqbuddy)
-    for rec in seqbuddy_copy.records:
-        seq = str(rec.seq).encode("utf-8")
-        seq = md5(seq).hexdigest()
-        rec.seq = Seq(seq)
-        if rec.id in repeat_ids:
-            repeat_ids[rec.id].append(rec)
-        elif rec.id in unique_seqs:
-            repeat_ids[rec.id] = [rec]
-            repeat_ids[rec.id].append(unique_seqs[rec.id])
-            del (unique_seqs[rec.id])
-        else:
+    # Single pass over the records, building a side table of ID --> record indices and an MD5 digest for each
+    # sequence. The records themselves are never modified or copied.
+    gaps = str.maketrans("", "", "-.") if ignore_gaps else None
+    id_index = {}
+    digests = []
+    for indx, rec in enumerate(seqbuddy.records):
+        seq = str(rec.seq)
+        seq = seq.upper() if ignore_case else seq
+        seq = seq.translate(gaps) if ignore_gaps else seq
+        digests.append(md5(seq.encode("utf-8")).hexdigest())
+        if rec.id not in id_index:
+            id_index[rec.id] = [indx]
             unique_seqs[rec.id] = rec
+        else:
+            id_index[rec.id].append(indx)
+            if rec.id not in repeat_ids:
+                repeat_ids[rec.id] = id_index[rec.id]
+                del unique_seqs[rec.id]
+
+    # Group the digests. Records with unique IDs are considered first, followed by each set of repeated IDs.
+    first_seen = {}
+
+    def group(digest, seq_id):
+        if digest not in first_seen:
+            first_seen[digest] = seq_id
+            return False
+        if digest not in repeat_seqs:
+            repeat_seqs[digest] = [seq_id, first_seen[digest]]
+        else:
+            repeat_seqs[digest].append(seq_id)
+        return True
 
-    # Then look for replicate sequences
-    flip_uniqe = {}
     del_keys = []
-    for key, value in list(unique_seqs.items()):  # find and remove duplicates in/from the unique list
-        value = str(value.seq)
-        if value not in flip_uniqe:
-            flip_uniqe[value] = [key]
-        else:
-            if value not in repeat_seqs:
-                repeat_seqs[value] = [key]
-                repeat_seqs[value] += flip_uniqe[value]
-                if flip_uniqe[value][0] in unique_seqs:
-                    del_keys.append(flip_uniqe[value][0])
-            else:
-                repeat_seqs[value].append(key)
-            del_keys.append(unique_seqs[key].id)
-
-    for key in del_keys:
-        if key in unique_seqs:
-            del (unique_seqs[key])
-
-    for key, value in list(repeat_ids.items()):  # find duplicates in the repeat ID list
-        for rep_seq in value:
-            rep_seq = str(rep_seq.seq)
-            if rep_seq not in flip_uniqe:
-                flip_uniqe[rep_seq] = [key]
-            else:
-                if rep_seq not in repeat_seqs:
-                    repeat_seqs[rep_seq] = [key]
-                    repeat_seqs[rep_seq] += flip_uniqe[rep_seq]
+    for seq_id in unique_seqs:
+        if group(digests[id_index[seq_id][0]], seq_id):
+            del_keys += [seq_id, first_seen[digests[id_index[seq_id][0]]]]
 
-                else:
-                    repeat_seqs[rep_seq].append(key)
+    for seq_id, indices in repeat_ids.items():
+        for indx in indices[1:2] + indices[:1] + indices[2:]:
+            group(digests[indx], seq_id)
+
+    for seq_id in del_keys:
+        unique_seqs.pop(seq_id, None)
 
     seqbuddy.unique_seqs = unique_seqs
     seqbuddy.repeat_ids = repeat_ids
@@ -2190,6 +2955,7 @@ def find_restriction_sites(seqbuddy, enzyme_group=(), min_cuts=1, max_cuts=None,
     :param quiet: Suppress stderr
     :return: annotated SeqBuddy object, and a dictionary of restriction sites added as the `restriction_sites` attribute
     """
+    from Bio.Restriction import RestrictionBatch, CommOnly, AllEnzymes, Analysis  # Slow import, so only when needed
     if seqbuddy.alpha == IUPAC.protein:
         raise TypeError("Unable to identify restriction sites in protein sequences.")
 
@@ -2362,6 +3128,7 @@ def isoelectric_point(seqbuddy):
     :param seqbuddy: SeqBuddy object
     :return: SeqBuddy object with isoelectric point appended to each record as the last feature in the feature list
     """
+    from Bio.SeqUtils.ProtParam import ProteinAnalysis
     if seqbuddy.alpha is not IUPAC.protein:
         raise TypeError("Protein sequence required, not nucleic acid.")
     isoelectric_points = OrderedDict()
@@ -2696,60 +3463,21 @@ def molecular_weight(seqbuddy):
     :return: SeqBuddy object with appended molecular_weights dictionary -
     dict[id][(ssRNA_value/ssDNA_value, dsDNA_value/peptide_value)]
     """
-
-    amino_acid_weights = {'A': 71.08, 'R': 156.19, 'N': 114.10, 'D': 115.09, 'C': 103.14, 'Q': 128.13, 'E': 129.12,
-                          'G': 57.05, 'H': 137.14, 'I': 113.16, 'L': 113.16, 'K': 128.17, 'M': 131.19, 'F': 147.18,
-                          'P': 97.12, 'S': 87.08, 'T': 101.11, 'W': 186.21, 'Y': 163.18, 'V': 99.13, '-': 0, '*': 0,
-                          'X': 110}
-    deoxynucleotide_weights = {'A': 313.2, 'G': 329.2, 'C': 289.2, 'T': 304.2, 'Y': 296.7, 'R': 321.2, 'W': 308.7,
-                               'S': 309.2, 'K': 316.7, 'M': 301.2, 'D': 315.53, 'V': 310.53, 'H': 302.2, 'B': 307.53,
-                               'X': 308.95, 'N': 308.95, '-': 0, '.': 0}
-    deoxyribonucleotide_weights = {'A': 329.2, 'G': 306.2, 'C': 305.2, 'U': 345.2, 'Y': 325.2, 'R': 317.7, 'W': 337.2,
-                                   'S': 305.7, 'K': 325.7, 'M': 317.2, 'D': 326.87, 'V': 313.53, 'H': 326.53,
-                                   'B': 318.87, 'X': 321.45, 'N': 321.45, '-': 0, '.': 0}
-    deoxynucleotide_compliments = {'A': 'T', 'G': 'C', 'C': 'G', 'T': 'A', 'Y': 'R', 'R': 'Y', 'W': 'W',
-                                   'S': 'S', 'K': 'M', 'M': 'K', 'D': 'H', 'V': 'B', 'H': 'D', 'B': 'V',
-                                   'X': 'X', 'N': 'N', '-': '-', '.': '.'}
-    dna = False
     output = {'masses_ss': [], 'masses_ds': [], 'ids': []}
-    aa_dict = amino_acid_weights
-    if seqbuddy.alpha == IUPAC.protein:
-        aa_dict = amino_acid_weights
-    elif seqbuddy.alpha in [IUPAC.ambiguous_dna or IUPAC.unambiguous_dna]:
-        aa_dict = deoxynucleotide_weights
-        dna = True
-    elif seqbuddy.alpha in [IUPAC.ambiguous_rna or IUPAC.unambiguous_rna]:
-        aa_dict = deoxyribonucleotide_weights
-    for rec in seqbuddy.records:
-        rec.mass_ds = 0
-        rec.mass_ss = 0
-        if seqbuddy.alpha == IUPAC.protein:
-            rec.mass_ss += 18.02  # molecular weight of a water molecule
-        else:
-            if dna:
-                rec.mass_ss += 79.0  # molecular weight of 5' monophosphate in ssDNA
-                rec.mass_ds += 157.9  # molecular weight of the 5' triphosphate in dsDNA
-            else:
-                rec.mass_ss += 159.0  # molecular weight of a 5' triphosphate in ssRNA
-        for indx, value in enumerate(str(rec.seq).upper()):
-            try:
-                rec.mass_ss += aa_dict[value]
-                if dna:
-                    rec.mass_ds += aa_dict[value] + deoxynucleotide_weights[deoxynucleotide_compliments[value]]
-            except KeyError:
-                raise KeyError("Invalid residue '{0}' in record {1}. '{0}' is not valid a valid character in "
-                               "{2}.".format(value, rec.id, str(seqbuddy.alpha)))
-        output['masses_ss'].append(round(rec.mass_ss, 3))
+    for rec, mass_ss, mass_ds in _molecular_weights(seqbuddy):
+        rec.mass_ss = mass_ss
+        rec.mass_ds = 0 if mass_ds is None else mass_ds
+        output['masses_ss'].append(round(mass_ss, 3))
 
         qualifiers = {}
         if seqbuddy.alpha == IUPAC.protein:
-            qualifiers["peptide_value"] = round(rec.mass_ss, 3)
-        elif dna:
-            qualifiers["ssDNA_value"] = round(rec.mass_ss, 3)
-            qualifiers["dsDNA_value"] = round(rec.mass_ds, 3)
-            output['masses_ds'].append(round(rec.mass_ds, 3))
-        elif seqbuddy.alpha in [IUPAC.ambiguous_rna or IUPAC.unambiguous_rna]:
-            qualifiers["ssRNA_value"] = round(rec.mass_ss, 3)
+            qualifiers["peptide_value"] = round(mass_ss, 3)
+        elif mass_ds is not None:
+            qualifiers["ssDNA_value"] = round(mass_ss, 3)
+            qualifiers["dsDNA_value"] = round(mass_ds, 3)
+            output['masses_ds'].append(round(mass_ds, 3))
+        else:
+            qualifiers["ssRNA_value"] = round(mass_ss, 3)
         output['ids'].append(rec.id)
         mw_feature = SeqFeature(location=FeatureLocation(start=1, end=len(rec.seq)), type='mw', qualifiers=qualifiers)
         rec.features.append(mw_feature)
@@ -2757,6 +3485,19 @@ def molecular_weight(seqbuddy):
     return seqbuddy
 
 
+def molecular_weight_array(seqbuddy, double_stranded=False):
+    """
+    Batch version of molecular_weight(), for when only the numbers are needed. Records are left untouched.
+    :param seqbuddy: SeqBuddy object
+    :param double_stranded: Return dsDNA instead of ssDNA masses
+    :return: array.array('d') of masses in daltons, in record order
+    """
+    if double_stranded and seqbuddy.alpha not in [IUPAC.ambiguous_dna, IUPAC.unambiguous_dna]:
+        raise TypeError("Double stranded masses can only be calculated for DNA sequences.")
+    return array("d", [round(mass_ds if double_stranded else mass_ss, 3)
+                       for rec, mass_ss, mass_ds in _molecular_weights(seqbuddy)])
+
+
 def num_seqs(seqbuddy):
     """
     Counts the number of sequences in the SeqBuddy object
@@ -2885,6 +3626,7 @@ class PrositeScan(object):
     """
     def __init__(self, seqbuddy, common_match=True, quiet=False):
         import platform
+        import urllib.request
 
         self.seqbuddy = seqbuddy
         self.common_match = common_match
@@ -2906,6 +3648,7 @@ class PrositeScan(object):
         self.user_deets = br.config_values()
 
     def _rest_request(self, url, request_data=None):
+        import urllib.request
         # Set the User-agent.
         req = urllib.request.Request(url, None, self.http_headers)
         if request_data:
@@ -2928,6 +3671,7 @@ class PrositeScan(object):
         params = {'sequence': str(_rec.seq).upper(), 'email': email, 'commonMatch': self.common_match,
                   'database': 'prosite', 'scanControl': 'both', 'stype': 'protein'}
         # Submit the job
+        import urllib.parse
         request_data = urllib.parse.urlencode(params)
         request_data = request_data.encode("utf-8")
         job_id = self._rest_request('%s/run/' % self.base_url, request_data)
@@ -3003,17 +3747,20 @@ class PrositeScan(object):
 def pull_random_recs(seqbuddy, count=1, r_seed=None):
     """
     Return a random record or subset of records (without replacement)
-    :param seqbuddy: SeqBuddy object
+    :param seqbuddy: SeqBuddy object, or SeqIndex to only read in the records that are needed
     :param count: The number of random records to pull (int)
     :param r_seed: Set the random generator seed value
     :return: The original SeqBuddy object with only the selected records remaining
     """
     rand_gen = Random() if not r_seed else Random(r_seed)
     count = abs(count) if abs(count) <= len(seqbuddy) else len(seqbuddy)
+    records = list(range(len(seqbuddy))) if type(seqbuddy) == SeqIndex else seqbuddy.records
     random_recs = []
     for _ in range(count):
-        rand_index = rand_gen.randint(0, len(seqbuddy) - 1)
-        random_recs.append(seqbuddy.records.pop(rand_index))
+        rand_index = rand_gen.randint(0, len(records) - 1)
+        random_recs.append(records.pop(rand_index))
+    if type(seqbuddy) == SeqIndex:
+        return seqbuddy.to_seqbuddy(random_recs)
     seqbuddy.records = random_recs
     return seqbuddy
 
@@ -3043,28 +3790,54 @@ def pull_record_ends(seqbuddy, amount):
     return seqbuddy
 
 
-def pull_recs(seqbuddy, regex, description=False):
+def pull_recs(seqbuddy, regex, description=False, exact=False):
     """
     Retrieves sequences with names/IDs matching a search pattern
-    :param seqbuddy: SeqBuddy object
+    :param seqbuddy: SeqBuddy object, or SeqIndex to only read in the records that are needed. Searching descriptions
+    needs every record parsed, so a SeqIndex is then streamed through once instead.
     :param regex: List of regex expressions or single regex
     :type regex: str list
     :param description: Allow search in description string
+    :param exact: Treat 'regex' as a list (or set) of literal IDs/names, which are looked up in a set instead of
+    searched for
     :return: The modified SeqBuddy object
     """
     if type(regex) == str:
         regex = [regex]
+
+    if exact:
+        ids = regex if type(regex) == set else set(regex)
+        if type(seqbuddy) == SeqIndex:
+            return seqbuddy.to_seqbuddy([indx for indx, entry in enumerate(seqbuddy.entries)
+                                         if entry.id in ids or entry.name in ids])
+        seqbuddy.records = [rec for rec in seqbuddy.records if rec.id in ids or rec.name in ids]
+        return seqbuddy
+
     for indx, pattern in enumerate(regex):
         regex[indx] = ".*" if pattern == "*" else pattern
 
-    regex = "|".join(regex)
+    regex = re.compile("|".join(regex))
+    if type(seqbuddy) == SeqIndex:
+        if not description:  # Search the index, and only read in the records that match
+            return seqbuddy.to_seqbuddy([indx for indx, entry in enumerate(seqbuddy.entries)
+                                         if regex.search(entry.id) or regex.search(entry.name)])
+        # Annotations are only available once a record has been parsed, so the index can't narrow the search down.
+        # Stream through the file once instead, only holding on to the records that match.
+        records = seqbuddy.iter_records()
+    else:
+        records = seqbuddy.records
+
     matched_records = []
-    for rec in seqbuddy.records:
-        if re.search(regex, rec.id) or re.search(regex, rec.name):
+    for rec in records:
+        if regex.search(rec.id) or regex.search(rec.name):
             matched_records.append(rec)
             continue
-        if description and (re.search(regex, rec.description) or re.search(regex, str(rec.annotations))):
+        if description and (regex.search(rec.description) or
+                            (rec.annotations and regex.search(str(rec.annotations)))):
             matched_records.append(rec)
+
+    if type(seqbuddy) == SeqIndex:
+        return SeqBuddy(matched_records, seqbuddy.in_format, seqbuddy.out_format, seqbuddy.alpha)
     seqbuddy.records = matched_records
     return seqbuddy
 
@@ -3082,14 +3855,9 @@ def pull_recs_with_feature(seqbuddy, regex):
     for indx, pattern in enumerate(regex):
         regex[indx] = ".*" if pattern == "*" else pattern
 
-    regex = "|".join(regex)
-    matched_records = []
-    for rec in seqbuddy.records:
-        for feat in rec.features:
-            if re.search(regex, feat.type) or re.search(regex, feat.id):
-                matched_records.append(rec)
-                break
-    seqbuddy.records = matched_records
+    regex = re.compile("|".join(regex))
+    seqbuddy.records = [rec for rec in seqbuddy.records
+                        if any(regex.search(feat.type) or regex.search(feat.id) for feat in rec.features)]
     return seqbuddy
 
 
@@ -3263,96 +4031,95 @@ def shuffle_seqs(seqbuddy, r_seed=None):
     return seqbuddy
 
 
-def translate6frames(seqbuddy):
+def translate6frames(seqbuddy, table=1):
     """
     Translates a nucleotide sequence into a protein sequence across all six reading frames.
     :param seqbuddy: SeqBuddy object
+    :param table: NCBI genetic code, as a table ID or name
     :return: The translated SeqBuddy object
     """
-    frame1, frame2, frame3 = make_copy(seqbuddy), make_copy(seqbuddy), make_copy(seqbuddy)
-    seqbuddy = reverse_complement(seqbuddy)
-
-    rframe1, rframe2, rframe3 = make_copy(seqbuddy), make_copy(seqbuddy), make_copy(seqbuddy)
-
-    frame2 = select_frame(frame2, 2, add_metadata=False)
-    frame3 = select_frame(frame3, 3, add_metadata=False)
-    rframe2 = select_frame(rframe2, 2, add_metadata=False)
-    rframe3 = select_frame(rframe3, 3, add_metadata=False)
+    if seqbuddy.alpha == IUPAC.protein:
+        raise TypeError("Protein sequence cannot be translated.")
+    _translation_table(table)
 
-    frame1 = translate_cds(frame1, quiet=True)
-    frame2 = translate_cds(frame2, quiet=True)
-    frame3 = translate_cds(frame3, quiet=True)
-    rframe1 = translate_cds(rframe1, quiet=True)
-    rframe2 = translate_cds(rframe2, quiet=True)
-    rframe3 = translate_cds(rframe3, quiet=True)
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
 
+    suffixes = ["f1", "f2", "f3", "rf1", "rf2", "rf3"]
     output = []
-    for i in range(len(frame1)):
-        frame1.records[i].id = "%s_f1" % frame1.records[i].id
-        frame2.records[i].id = "%s_f2" % frame2.records[i].id
-        frame3.records[i].id = "%s_f3" % frame3.records[i].id
-        rframe1.records[i].id = "%s_rf1" % rframe1.records[i].id
-        rframe2.records[i].id = "%s_rf2" % rframe2.records[i].id
-        rframe3.records[i].id = "%s_rf3" % rframe3.records[i].id
+    nucl_frames, prot_frames = [], []  # Frames with features to carry over, mapped in one batch at the end
+    for rec in seqbuddy.records:
+        if rec.seq.alphabet == IUPAC.protein:
+            raise TypeError("Record %s is protein." % rec.id)
 
-        output += [frame1.records[i], frame2.records[i], frame3.records[i],
-                   rframe1.records[i], rframe2.records[i], rframe3.records[i]]
+        # Frame shifts recorded by select_frame() have to be undone before each new frame is selected
+        if re.search(r"\(frame[23][A-Za-z]{1,2}\)", rec.description):
+            output += _translate6frames_shifted(SeqBuddy([rec], out_format=seqbuddy.out_format,
+                                                         alpha=seqbuddy.alpha), table)
+            continue
 
-    seqbuddy = SeqBuddy(output, out_format=seqbuddy.out_format)
-    return seqbuddy
+        # Otherwise all six frames come straight out of a single pass over the sequence
+        seq = re.sub("[^ATGCURYWSMKHBVDNXatgcurywsmkhbvdnx]", "", str(rec.seq))
+        rc_seq = rec.seq.reverse_complement() if rec.features else None
+        for frame, new_seq, suffix in zip([1, 2, 3, -1, -2, -3], _translate_frames(seq, table, numpy=numpy), suffixes):
+            new_rec = SeqRecord(Seq(new_seq, IUPAC.protein), id="%s_%s" % (rec.id, suffix), name=rec.name,
+                                description=rec.description, dbxrefs=rec.dbxrefs[:],
+                                annotations=deepcopy(rec.annotations))
+            output.append(new_rec)
+            if rec.features:
+                frame_seq = rec.seq if frame > 0 else rc_seq
+                nucl_frames.append(SeqRecord(frame_seq[abs(frame) - 1:], id=rec.id,
+                                             features=_frame_features(rec, frame)))
+                prot_frames.append(new_rec)
+
+    if nucl_frames:
+        map_features_nucl2prot(SeqBuddy(nucl_frames, alpha=seqbuddy.alpha), SeqBuddy(prot_frames, alpha=IUPAC.protein),
+                               mode="list", quiet=True)
+    return SeqBuddy(output, out_format=seqbuddy.out_format, alpha=IUPAC.protein)
 
 
-def translate_cds(seqbuddy, quiet=False, alignment=False):
+def translate_cds(seqbuddy, quiet=False, alignment=False, table=1):
     """
     Translates a nucleotide sequence into a protein sequence.
     :param seqbuddy: SeqBuddy object
     :param quiet: Suppress the errors thrown by translate(cds=True)
     :param alignment: If the incoming sequence has gaps you want maintained, set to True. Otherwise they will be cleaned
+    :param table: NCBI genetic code, as a table ID or name
     :return: The translated SeqBuddy object
     """
     if seqbuddy.alpha == IUPAC.protein:
         raise TypeError("Protein sequence cannot be translated.")
-
-    codon_dict = {'---': '-', '--A': '-', '--C': '-', '--G': '-', '--T': '-', '-A-': '-', '-C-': '-', '-G-': '-',
-                  '-T-': '-', 'A--': '-', 'AAA': 'K', 'AAC': 'N', 'AAG': 'K', 'AAT': 'N', 'ACA': 'T', 'ACC': 'T',
-                  'ACG': 'T', 'ACT': 'T', 'AGA': 'R', 'AGC': 'S', 'AGG': 'R', 'AGT': 'S', 'ATA': 'I', 'ATC': 'I',
-                  'ATG': 'M', 'ATT': 'I', 'C--': '-', 'CAA': 'Q', 'CAC': 'H', 'CAG': 'Q', 'CAT': 'H', 'CCA': 'P',
-                  'CCC': 'P', 'CCG': 'P', 'CCT': 'P', 'CGA': 'R', 'CGC': 'R', 'CGG': 'R', 'CGT': 'R', 'CTA': 'L',
-                  'CTC': 'L', 'CTG': 'L', 'CTT': 'L', 'G--': '-', 'GAA': 'E', 'GAC': 'D', 'GAG': 'E', 'GAT': 'D',
-                  'GCA': 'A', 'GCC': 'A', 'GCG': 'A', 'GCT': 'A', 'GGA': 'G', 'GGC': 'G', 'GGG': 'G', 'GGT': 'G',
-                  'GTA': 'V', 'GTC': 'V', 'GTG': 'V', 'GTT': 'V', 'T--': '-', 'TAA': '*', 'TAC': 'Y', 'TAG': '*',
-                  'TAT': 'Y', 'TCA': 'S', 'TCC': 'S', 'TCG': 'S', 'TCT': 'S', 'TGA': '*', 'TGC': 'C', 'TGG': 'W',
-                  'TGT': 'C', 'TTA': 'L', 'TTC': 'F', 'TTG': 'L', 'TTT': 'F'}
+    _translation_table(table)  # Reject unknown genetic codes before anything is modified
 
     if not alignment:
         clean_seq(seqbuddy)
 
-    if seqbuddy.alpha == IUPAC.ambiguous_rna:
-        rna2dna(seqbuddy)
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
 
-    translated_sb = make_copy(seqbuddy)
-    uppercase(translated_sb)
-    for rec in translated_sb.records:
+    translated_sb = copy(seqbuddy)
+    translated_sb.records = []
+    for rec in seqbuddy.records:
         if rec.seq.alphabet == IUPAC.protein:
             raise TypeError("Record %s is protein." % rec.id)
+        new_seq = _translate_frames(str(rec.seq), table, frames=(1,), numpy=numpy)[0]
+        translated_sb.records.append(SeqRecord(Seq(new_seq, IUPAC.protein), id=rec.id, name=rec.name,
+                                               description=rec.description, dbxrefs=rec.dbxrefs,
+                                               annotations=rec.annotations))
 
-        new_seq = [""] * ceil(len(rec) / 3)
-        new_seq_indx = 0
-        old_seq = str(rec.seq)
-        for codon in [old_seq[::1][i:i + 3][::1] for i in range(0, len(old_seq), 3)][::1]:
-            if len(codon) == 3:
-                if codon in codon_dict:
-                    new_seq[new_seq_indx] = codon_dict[codon]
-                else:
-                    new_seq[new_seq_indx] = "N"
-                new_seq_indx += 1
-
-        new_seq = "".join(new_seq) if new_seq and new_seq[-1] != "" else "".join(new_seq[:-1])
-        new_seq = Seq(new_seq, IUPAC.protein)
-        rec.seq = new_seq
-        rec.features = []
+    if alignment or [True for rec in seqbuddy.records if rec.features]:
+        map_features_nucl2prot(seqbuddy, translated_sb, mode="list", quiet=quiet)
+    else:
+        # Nothing to map, so only the size check done by map_features_nucl2prot() is needed
+        for nucl_rec, prot_rec in zip(seqbuddy.records, translated_sb.records):
+            if len(prot_rec.seq) * 3 not in [len(nucl_rec.seq), len(nucl_rec.seq) - 3]:
+                br._stderr("Warning: size mismatch between aa and nucl seqs for %s --> %s, %s\n" %
+                           (nucl_rec.id, len(nucl_rec.seq), len(prot_rec.seq)), quiet)
 
-    map_features_nucl2prot(seqbuddy, translated_sb, mode="list", quiet=quiet)
     for indx, rec in enumerate(translated_sb.records):
         seqbuddy.records[indx] = rec
     seqbuddy.alpha = IUPAC.protein
@@ -3374,6 +4141,9 @@ def transmembrane_domains(seqbuddy, job_ids=None, quiet=False, keep_temp=None):
         from suds.client import Client
     except ImportError:
         raise ImportError("Please install the 'suds' package to run transmembrane_domains:\n\n$ pip install suds-py3")
+    import urllib.request
+    import urllib.error
+    import zipfile
 
     def dl_progress(count, block_size, total_size):
         percent = count * block_size * 100 / total_size
@@ -3679,6 +4449,41 @@ def uppercase(seqbuddy):
 
 
 # ################################################# COMMAND LINE UI ################################################## #
+def _parse_pipeline(pipeline):
+    """
+    Split a pipeline string into individual commands, each parsed the same way as they would be on the command line
+    :param pipeline: Semicolon separated commands (e.g., "clean_seq; translate; order_ids" or "-cs; -tr; -oi")
+    :return: list of (command name, argparse Namespace) tuples
+    """
+    import argparse
+
+    class PipelineParser(argparse.ArgumentParser):
+        def error(self, message):
+            raise ValueError("Pipeline %s" % message)
+
+    parser = PipelineParser(prog="SeqBuddy.py", add_help=False, allow_abbrev=False)
+    br.flags(parser, _flags=br.sb_flags)
+
+    steps = []
+    for step in pipeline.split(";"):
+        step = shlex.split(step)
+        if not step:
+            continue
+        if not step[0].startswith("-"):
+            step[0] = "--%s" % step[0]
+        step_args, unknown = parser.parse_known_args(step)
+        if unknown:
+            raise ValueError("Unrecognized pipeline argument(s): %s" % " ".join(unknown))
+        tools = [flag for flag in br.sb_flags if getattr(step_args, flag, None)]
+        if len(tools) != 1:
+            raise ValueError("Each step of a pipeline must be exactly one command, not '%s'" % " ".join(step))
+        steps.append((tools[0], step_args))
+
+    if not steps:
+        raise ValueError("No commands found in pipeline")
+    return steps
+
+
 def argparse_init():
     # Catching params to prevent weird collisions with 3rd party arguments
     if '--blast' in sys.argv:  # Only blast at the moment, but other flags may come up in the future.
@@ -3727,13 +4532,40 @@ def argparse_init():
     seqbuddy = []
     seq_set = ""
 
-    if in_args.out_format and in_args.out_format.lower() not in OUTPUT_FORMATS:
+    if in_args.out_format and br.split_compression(in_args.out_format)[0].lower() not in OUTPUT_FORMATS:
         br._stderr("Error: Output type '%s' is not recognized/supported\n" % in_args.out_format)
         sys.exit()
 
+    if in_args.cache:
+        try:
+            br.enable_parse_cache()
+        except OSError as e:  # Only an optimization, so run without it
+            br._stderr("Warning: %s\n" % e, in_args.quiet)
+
+    if in_args.profile:
+        br.enable_profiler()
+
     if in_args.guess_alphabet or in_args.guess_format:
         return in_args, SeqBuddy
 
+    if in_args.index:
+        return in_args, SeqBuddy
+
+    if in_args.pipeline:  # Check the pipeline before reading any sequences, and hand the steps on to command_line_ui()
+        try:
+            in_args.pipeline_steps = _parse_pipeline(in_args.pipeline)
+        except ValueError as e:
+            br._stderr("ValueError: %s\n" % e)
+            sys.exit()
+
+    if in_args.stream:
+        for seq_set in in_args.sequence:
+            if isinstance(seq_set, TextIOWrapper) and seq_set.buffer.raw.isatty():
+                br._stderr("Warning: No input detected so SeqBuddy is aborting...\n"
+                           "For more information, try:\n%s --help\n" % sys.argv[0])
+                sys.exit()
+        return in_args, SeqBuddy
+
     try:
         for seq_set in in_args.sequence:
             if isinstance(seq_set, TextIOWrapper) and seq_set.buffer.raw.isatty():
@@ -3753,25 +4585,38 @@ def argparse_init():
 
 def command_line_ui(in_args, seqbuddy, skip_exit=False, pass_through=False):  # ToDo: Convert to a class
     # ############################################ INTERNAL FUNCTIONS ################################################ #
+    @br.profiled("serialize")
     def _print_recs(_seqbuddy):
-        if in_args.test:
+        if pipeline_output is not None:  # Intermediate pipeline step, so hand the records on to the next command
+            pipeline_output.append(_seqbuddy)
+
+        elif stream_counts is not None and not _seqbuddy.records:
+            stream_counts.append(0)  # Empty chunk of a stream; only reported at the end if every chunk was empty
+
+        elif in_args.test:
             br._stderr("*** Test passed ***\n", in_args.quiet)
             pass
 
         elif in_args.in_place:
-            _in_place(str(_seqbuddy), in_args.sequence[0])
+            _in_place(_seqbuddy, in_args.sequence[0])
 
         else:
-            br._stdout("{0}\n".format(str(_seqbuddy).rstrip()))
+            _seqbuddy.write(sys.stdout, compression=out_compression)
+            sys.stdout.flush()
+            if stream_counts is not None:
+                stream_counts.append(len(_seqbuddy.records))
 
-    def _in_place(_output, file_path):
+    def _in_place(_seqbuddy, file_path):
         if not os.path.exists(file_path):
             br._stderr("Warning: The -i flag was passed in, but the positional argument doesn't seem to be a "
                        "file. Nothing was written.\n", in_args.quiet)
-            br._stderr("%s\n" % _output.strip(), in_args.quiet)
+            br._stderr("%s\n" % str(_seqbuddy).strip(), in_args.quiet)
         else:
-            with open(os.path.abspath(file_path), "w", encoding="utf-8") as _ofile:
-                _ofile.write(_output)
+            # Compressed files stay compressed
+            compression = out_compression if out_compression else br.compression_type(file_path)
+            # Stream into a temporary file and swap it in at the end, so a failed write can't truncate the input
+            with br.atomic_write(file_path, compression) as _ofile:
+                _seqbuddy.write(_ofile)
             br._stderr("File overwritten at:\n%s\n" % os.path.abspath(file_path), in_args.quiet)
 
     def _raise_error(_err, tool, check_string=None):
@@ -3791,15 +4636,121 @@ def command_line_ui(in_args, seqbuddy, skip_exit=False, pass_through=False):  #
         _exit(tool)
 
     def _exit(tool, skip=skip_exit):
+        if seq_index:
+            seq_index.close()
         if skip:
             return
         usage = br.Usage()
         memory_footprint = 0 if type(seqbuddy) != SeqBuddy else seqbuddy.memory_footprint
-        usage.increment("SeqBuddy", VERSION.short(), tool, memory_footprint)
+        usage.increment("SeqBuddy", VERSION.short(), tool, memory_footprint, br.peak_memory())
         usage.save()
         sys.exit()
 
     # ############################################## COMMAND LINE LOGIC ############################################## #
+    pipeline_output = getattr(in_args, "pipeline_output", None)
+    stream_counts = getattr(in_args, "stream_counts", None)  # Records written by each chunk of a -stm run
+    seq_index = None  # Set by the -idx flag, and closed by _exit()
+
+    # Compressed output is requested with a suffix on the format (e.g., '-o fasta.gz')
+    out_format_arg = in_args.out_format
+    in_args.out_format, out_compression = br.split_compression(in_args.out_format)
+
+    # Run a series of commands on the same in-memory records, only printing the result of the final step
+    if getattr(in_args, "pipeline", None):
+        tools = [flag for flag in br.sb_flags if getattr(in_args, flag, None)]
+        if tools or in_args.stream or in_args.index:
+            _raise_error(ValueError("The -pl flag cannot be combined with other commands, -stm, or -idx"), "pipeline")
+            return
+        try:
+            steps = getattr(in_args, "pipeline_steps", None) or _parse_pipeline(in_args.pipeline)
+            for indx, (tool, step_flags) in enumerate(steps):
+                step_args = copy(in_args)
+                step_args.pipeline = None
+                step_args.pipeline_steps = None
+                for flag in br.sb_flags:
+                    setattr(step_args, flag, getattr(step_flags, flag))
+                if indx == len(steps) - 1:
+                    step_args.out_format = out_format_arg
+                    command_line_ui(step_args, seqbuddy, skip_exit=True, pass_through=True)
+                    break
+
+                step_args.in_place = False
+                step_args.test = False
+                step_args.pipeline_output = []
+                temp_stdout, temp_stderr = StringIO(), StringIO()
+                sys.stdout, real_stdout = temp_stdout, sys.stdout
+                sys.stderr, real_stderr = temp_stderr, sys.stderr
+                try:
+                    command_line_ui(step_args, seqbuddy, skip_exit=True, pass_through=True)
+                finally:
+                    sys.stdout, sys.stderr = real_stdout, real_stderr
+                    br._stderr(temp_stderr.getvalue())  # Warnings, or the reason that the step failed
+                if not step_args.pipeline_output:
+                    if temp_stderr.getvalue() and not temp_stdout.getvalue():  # The step failed and has said why
+                        _exit("pipeline")
+                        return
+                    raise ValueError("'%s' does not output sequences, so it can only be the last step of a pipeline"
+                                     % tool)
+                seqbuddy = step_args.pipeline_output[-1]
+        # Steps pass their errors up instead of printing them (e.g., KeyError for an unknown degenerate_sequence table)
+        except (br.GuessError, AttributeError, KeyError, TypeError, ValueError, IOError) as e:
+            _raise_error(e, "pipeline")
+            return
+        _exit("pipeline")
+        return
+
+    # Stream records through a record-local command, one chunk at a time
+    if in_args.stream:
+        tools = [flag for flag in br.sb_flags if getattr(in_args, flag, None)]
+        if len(tools) != 1 or tools[0] not in STREAM_COMMANDS:
+            _raise_error(ValueError("The -stm flag requires exactly one of the following commands: %s"
+                                    % ", ".join(STREAM_COMMANDS)), "stream")
+            return
+        tool = tools[0]
+        if in_args.in_place:
+            _raise_error(ValueError("The -stm flag cannot be combined with -i"), tool)
+            return
+
+        stream_args = copy(in_args)
+        stream_args.stream = False
+        stream_args.sequence = []
+        stream_args.out_format = out_format_arg  # Each chunk is written as its own compressed block
+        out_format = in_args.screw_formats if tool == "screw_formats" else in_args.out_format
+        stream_counts = []
+        pull_ids = None
+        try:
+            # The ID file may be a pipe (e.g., '-prfl <(cut -f1 hits.tsv)'), so it can only be read once
+            if tool == "pull_records_file":
+                with br.open_text(in_args.pull_records_file) as ifile:
+                    pull_ids = set(line.strip() for line in ifile if line.strip())
+            for seq_set in in_args.sequence:
+                for chunk in stream(seq_set, in_args.in_format, out_format, in_args.alpha):
+                    chunk_args = deepcopy(stream_args)
+                    chunk_args.stream_counts = stream_counts
+                    chunk_args.pull_records_ids = pull_ids
+                    command_line_ui(chunk_args, chunk, skip_exit=True, pass_through=True)
+        except (br.GuessError, TypeError, ValueError, IOError) as e:
+            _raise_error(e, tool)
+            return
+        if stream_counts and not any(stream_counts):
+            br._stderr("Error: No sequences in object.\n", in_args.quiet)
+        _exit(tool)
+        return
+
+    # Read records out of large files through a sidecar index, instead of parsing everything
+    if in_args.index:
+        tools = [flag for flag in br.sb_flags if getattr(in_args, flag, None)]
+        if len(tools) != 1 or tools[0] not in INDEX_COMMANDS:
+            _raise_error(ValueError("The -idx flag requires exactly one of the following commands: %s"
+                                    % ", ".join(INDEX_COMMANDS)), "index")
+            return
+        try:
+            seq_index = SeqIndex(in_args.sequence[0], in_args.in_format, in_args.out_format, in_args.alpha)
+            seqbuddy = seq_index
+        except (br.GuessError, ValueError) as e:
+            _raise_error(e, tools[0])
+            return
+
     # Add feature
     if in_args.annotate:
         # _type, location, strand=None, qualifiers=None, pattern=None
@@ -3965,9 +4916,11 @@ def command_line_ui(in_args, seqbuddy, skip_exit=False, pass_through=False):  #
     # Codon counter
     if in_args.count_codons:
         try:
-            if in_args.count_codons[0] and str(in_args.count_codons[0].lower()) in "concatenate":
+            mode = str(in_args.count_codons[0]).lower() if in_args.count_codons[0] else ""
+            if mode and "concatenate".startswith(mode):  # Modes can be abbreviated (e.g., 'conc' or 'agg')
                 seqbuddy = concat_seqs(seqbuddy)
-            codon_table = count_codons(seqbuddy)[1]
+            table = in_args.genetic_code if in_args.genetic_code else 1
+            codon_table = count_codons(seqbuddy, table, aggregate=bool(mode) and "aggregate".startswith(mode))[1]
             for sequence_id in codon_table:
                 br._stdout('#### {0} ####\n'.format(sequence_id))
                 br._stdout('Codon\tAA\tNum\tPercent\n')
@@ -3977,17 +4930,23 @@ def command_line_ui(in_args, seqbuddy, skip_exit=False, pass_through=False):  #
                 br._stdout('\n')
         except TypeError as e:
             _raise_error(e, "count_codons", "Nucleic acid sequence required, not protein or other.")
+        except ValueError as e:
+            _raise_error(e, "count_codons", "Unknown genetic code")
         _exit("count_codons")
 
     # Count residues
     if in_args.count_residues:
         seqbuddy = replace_subsequence(seqbuddy, "[-.]", "")
-        if in_args.count_residues[0] and str(in_args.count_residues[0].lower()) in "concatenate":
+        mode = str(in_args.count_residues[0]).lower() if in_args.count_residues[0] else ""
+        if mode and "concatenate".startswith(mode):  # Modes can be abbreviated (e.g., 'conc' or 'agg')
             seqbuddy = concat_seqs(seqbuddy)
-        count_residues(seqbuddy)
-        for rec in seqbuddy.records:
-            br._stdout("%s\n" % str(rec.id))
-            for residue, counts in list(rec.buddy_data["res_count"].items()):
+        aggregate = bool(mode) and "aggregate".startswith(mode)
+        count_residues(seqbuddy, aggregate)
+        res_counts = [("aggregate", seqbuddy.res_count)] if aggregate else \
+            [(rec.id, rec.buddy_data["res_count"]) for rec in seqbuddy.records]
+        for rec_id, res_count in res_counts:
+            br._stdout("%s\n" % str(rec_id))
+            for residue, counts in list(res_count.items()):
                 try:
                     br._stdout("{0}:\t{1}\t{2} %\n".format(residue, counts[0], round(counts[1] * 100, 2)))
                 except TypeError:
@@ -4207,26 +5166,43 @@ def command_line_ui(in_args, seqbuddy, skip_exit=False, pass_through=False):  #
 
     # Find orfs
     if in_args.find_orfs:
+        args = in_args.find_orfs[0]
+        lower_args = [str(arg).lower() for arg in args]
+        min_length = [int(arg) for arg in args if str(arg).isdigit()]
+        min_length = min_length[0] if min_length else 0
+        table = in_args.genetic_code if in_args.genetic_code else 1
+        coords_only = "coords" in lower_args
         try:
-            find_orfs(seqbuddy)
-            for rec in seqbuddy.records:
-                pos_indices = rec.buddy_data['find_orfs']['+']
-                neg_indices = rec.buddy_data['find_orfs']['-']
-                br._stderr("# {0}\n".format(rec.id), in_args.quiet)
-                if len(pos_indices) <= 0:
-                    br._stderr("(+) ORFs: None\n", in_args.quiet)
-                else:
-                    orfs = ", ".join(["%s:%s" % (x[0], x[1]) for x in pos_indices if len(x) > 0])
-                    br._stderr("(+) ORFs: %s\n" % orfs, in_args.quiet)
-                if len(neg_indices) <= 0:
-                    br._stderr("(-) ORFs: None\n", in_args.quiet)
-                else:
-                    orfs = ", ".join(["%s:%s" % (x[1], x[0]) for x in neg_indices if len(x) > 0])
-                    br._stderr("(-) ORFs: %s\n" % orfs, in_args.quiet)
-            br._stderr("\n", in_args.quiet)
-            _print_recs(seqbuddy)
+            find_orfs(seqbuddy, include_feature=not coords_only, min_length=min_length,
+                      alt_starts="alt" in lower_args, table=table)
         except TypeError as e:
             _raise_error(e, "find_orfs")
+        except ValueError as e:
+            _raise_error(e, "find_orfs", "Unknown genetic code")
+        else:
+            if coords_only:
+                br._stdout("ID\tStrand\tStart\tEnd\n")
+                for rec in seqbuddy.records:
+                    for strand in ["+", "-"]:
+                        for start, end in rec.buddy_data['find_orfs'][strand]:
+                            br._stdout("%s\t%s\t%s\t%s\n" % (rec.id, strand, start, end))
+            else:
+                for rec in seqbuddy.records:
+                    pos_indices = rec.buddy_data['find_orfs']['+']
+                    neg_indices = rec.buddy_data['find_orfs']['-']
+                    br._stderr("# {0}\n".format(rec.id), in_args.quiet)
+                    if len(pos_indices) <= 0:
+                        br._stderr("(+) ORFs: None\n", in_args.quiet)
+                    else:
+                        orfs = ", ".join(["%s:%s" % (x[0], x[1]) for x in pos_indices if len(x) > 0])
+                        br._stderr("(+) ORFs: %s\n" % orfs, in_args.quiet)
+                    if len(neg_indices) <= 0:
+                        br._stderr("(-) ORFs: None\n", in_args.quiet)
+                    else:
+                        orfs = ", ".join(["%s:%s" % (x[1], x[0]) for x in neg_indices if len(x) > 0])
+                        br._stderr("(-) ORFs: %s\n" % orfs, in_args.quiet)
+                br._stderr("\n", in_args.quiet)
+                _print_recs(seqbuddy)
         _exit("find_orfs")
 
     # Find pattern
@@ -4664,9 +5640,9 @@ def command_line_ui(in_args, seqbuddy, skip_exit=False, pass_through=False):  #
         try:
             molecular_weight(seqbuddy)
             mws = seqbuddy.molecular_weights
-            if seqbuddy.alpha == (IUPAC.ambiguous_dna or IUPAC.unambiguous_dna):
+            if seqbuddy.alpha in [IUPAC.ambiguous_dna, IUPAC.unambiguous_dna]:
                 br._stderr("ID\tssDNA\tdsDNA\n")
-            elif seqbuddy.alpha == (IUPAC.ambiguous_rna or IUPAC.unambiguous_rna):
+            elif seqbuddy.alpha in [IUPAC.ambiguous_rna, IUPAC.unambiguous_rna]:
                 br._stderr("ID\tssRNA\n")
             else:
                 br._stderr("ID\tProtein\n")
@@ -4720,6 +5696,7 @@ def command_line_ui(in_args, seqbuddy, skip_exit=False, pass_through=False):  #
 
     # Prosite Scan
     if in_args.prosite_scan:
+        import urllib.error
         try:
             common_match = False if in_args.prosite_scan[0] and in_args.prosite_scan[0].lower() == "strict" else True
             ps_scan = PrositeScan(seqbuddy, common_match=common_match, quiet=in_args.quiet)
@@ -4766,11 +5743,24 @@ def command_line_ui(in_args, seqbuddy, skip_exit=False, pass_through=False):  #
                 search_terms.append(arg)
 
         search_terms = br.clean_regex(search_terms, in_args.quiet)
-        if search_terms:
+        if search_terms or type(seqbuddy) == SeqIndex:
             seqbuddy = pull_recs(seqbuddy, search_terms, description)
         _print_recs(seqbuddy)
         _exit("pull_records")
 
+    # Pull records listed in a file
+    if in_args.pull_records_file:
+        ids = getattr(in_args, "pull_records_ids", None)  # Already read in once, up front, by -stm
+        if ids is None:
+            try:
+                with br.open_text(in_args.pull_records_file) as ifile:
+                    ids = set(line.strip() for line in ifile if line.strip())
+            except IOError as e:
+                _raise_error(e, "pull_records_file")
+                return
+        _print_recs(pull_recs(seqbuddy, ids, exact=True))
+        _exit("pull_records_file")
+
     # Pull records with feature
     if in_args.pull_records_with_feature:
         search_terms = []
@@ -4905,9 +5895,12 @@ def command_line_ui(in_args, seqbuddy, skip_exit=False, pass_through=False):  #
         if seqbuddy.alpha == IUPAC.protein:
             _raise_error(TypeError("Nucleic acid sequence required, not protein."), "translate")
         try:
-            _print_recs(translate_cds(seqbuddy, quiet=in_args.quiet))
+            table = in_args.genetic_code if in_args.genetic_code else 1
+            _print_recs(translate_cds(seqbuddy, quiet=in_args.quiet, table=table))
         except TypeError as e:
             _raise_error(e, "translate", ["Nucleic acid sequence required, not protein.", "Record .* is protein."])
+        except ValueError as e:
+            _raise_error(e, "translate", "Unknown genetic code")
         _exit("translate")
 
     # Translate 6 reading frames
@@ -4915,9 +5908,12 @@ def command_line_ui(in_args, seqbuddy, skip_exit=False, pass_through=False):  #
         if seqbuddy.alpha == IUPAC.protein:
             _raise_error(TypeError("You need to supply DNA or RNA sequences to translate"), "translate6frames")
         try:
-            seqbuddy = translate6frames(seqbuddy)
+            table = in_args.genetic_code if in_args.genetic_code else 1
+            seqbuddy = translate6frames(seqbuddy, table=table)
         except TypeError as e:
             _raise_error(e, "translate6frames", ["Nucleic acid sequence required, not protein.", " is protein."])
+        except ValueError as e:
+            _raise_error(e, "translate6frames", "Unknown genetic code")
         if in_args.out_format:
             seqbuddy.out_format = in_args.out_format
         _print_recs(seqbuddy)
@@ -4960,7 +5956,8 @@ def main():
     initiation = []
     try:
         initiation = argparse_init()  # initiation = [in_agrs, seqbuddy]
-        command_line_ui(*initiation)
+        with br.profile_phase("operation"):
+            command_line_ui(*initiation)
     except (KeyboardInterrupt, br.GuessError) as _e:
         print(_e)
         return False
@@ -4974,6 +5971,10 @@ def main():
                 break
         br.send_traceback("SeqBuddy", function, _e, VERSION)
         return False
+    finally:
+        if br.PROFILER and initiation and initiation[0].profile:
+            br.PROFILER.write(initiation[0].profile)
+            br.disable_profiler()
     return True
 
 if __name__ == '__main__':
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This program is free software in the public domain as stipulated by the Copyright Law
+of the United States of America, chapter 1, subsection 105. You may modify it and/or redistribute it
+without restriction.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+
+name: buddy_client.py
+author: Stephen R. Bond
+email: steve.bond@nih.gov
+institute: Computational and Statistical Genomics Branch, Division of Intramural Research,
+           National Human Genome Research Institute, National Institutes of Health
+           Bethesda, MD
+repository: https://github.com/biologyguy/BuddySuite
+© license: None, this work is public domain
+
+Description: Entry points for the seqbuddy, alignbuddy, and phylobuddy commands. Calls are forwarded to the
+             BuddySuite daemon (see 'buddysuite -daemon') if one is running, and the full tool is only imported when
+             it isn't. Only the standard library is imported here, so forwarded calls start instantly.
+"""
+
+import os
+import sys
+import json
+import socket
+import struct
+import stat
+import tempfile
+import importlib
+
+# After a one line JSON header from the client, everything is sent as frames: a one byte channel ('o' = stdout,
+# 'e' = stderr, 'x' = exit code, 'i' = stdin), a four byte payload length, and then the payload. Stdin is only pulled
+# from the client if the command actually reads it.
+# The socket lives in a directory that only the current user can access, and both ends check that they are talking to
+# the same user before anything is exchanged. Only the environment variables that BuddySuite (or the third party
+# programs it calls) actually reads are forwarded to the worker.
+DAEMON_TOOLS = ["SeqBuddy", "AlignBuddy", "PhyloBuddy"]
+DAEMON_ENV = ["PATH", "HOME", "TMPDIR", "DISPLAY", "TERM", "COLUMNS", "LANG", "LC_ALL", "BUDDYSUITE_CACHE_DIR",
+              "BUDDYSUITE_CACHE_SIZE"]
+
+
+def _private_dir(path):
+    """
+    :return: True if path is a real directory (not a symlink) owned by the current user, and closed to everyone else
+    """
+    try:
+        dir_stat = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISDIR(dir_stat.st_mode) and dir_stat.st_uid == os.getuid() and not dir_stat.st_mode & 0o077
+
+
+def _trusted_socket(socket_path):
+    """
+    :return: True if socket_path is a socket owned by the current user, sitting in a private directory
+    """
+    try:
+        sock_stat = os.lstat(socket_path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK(sock_stat.st_mode) and sock_stat.st_uid == os.getuid() and \
+        _private_dir(os.path.dirname(os.path.abspath(socket_path)))
+
+
+def daemon_socket_path():
+    """
+    The socket goes into $XDG_RUNTIME_DIR if it is private, and a 0700 buddysuite-<uid> directory in the system temp
+    directory otherwise. Set $BUDDYSUITE_SOCKET to put it somewhere else (its directory must still be private).
+    :return: Path to the daemon socket
+    """
+    if "BUDDYSUITE_SOCKET" in os.environ:
+        return os.environ["BUDDYSUITE_SOCKET"]
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and _private_dir(runtime_dir):
+        return os.path.join(runtime_dir, "buddysuite.sock")
+
+    return os.path.join(tempfile.gettempdir(), "buddysuite-%s" % os.getuid(), "buddysuite.sock")
+
+
+def _peer_uid(sock):
+    """
+    :return: The user id of the process on the other end of a Unix socket, or None if the platform can't say
+    """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    return struct.unpack("3i", creds)[1]
+
+
+def _import_tool(tool):
+    try:
+        return importlib.import_module("buddysuite.%s" % tool)
+    except ImportError:
+        return importlib.import_module(tool)
+
+
+def _send_frame(sock, channel, payload):
+    sock.sendall(channel + struct.pack("!I", len(payload)) + payload)
+
+
+def _read_frame(ifile):
+    header = ifile.read(5)
+    if len(header) < 5:
+        return None, None
+    length = struct.unpack("!I", header[1:])[0]
+    return header[:1], ifile.read(length)
+
+
+def daemon_status(socket_path=None):
+    """
+    :return: True if a daemon is accepting connections on socket_path
+    """
+    socket_path = socket_path if socket_path else daemon_socket_path()
+    if not hasattr(socket, "AF_UNIX") or not _trusted_socket(socket_path):
+        return False
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        sock.sendall(b'{"command": "ping"}\n')
+        channel, payload = _read_frame(sock.makefile("rb"))
+        return channel == b"x"
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def forward_to_daemon(tool, argv, socket_path=None):
+    """
+    Run a BuddySuite command line call inside the daemon, streaming stdout/stderr back into this process
+    :param tool: One of DAEMON_TOOLS
+    :param argv: Command line arguments, not including the program name
+    :param socket_path: Defaults to daemon_socket_path()
+    :return: The exit code of the command, or None if no daemon is available
+    """
+    if not hasattr(socket, "AF_UNIX") or os.environ.get("BUDDYSUITE_NO_DAEMON"):
+        return None
+    socket_path = socket_path if socket_path else daemon_socket_path()
+    if not _trusted_socket(socket_path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+
+    peer_uid = _peer_uid(sock)
+    if peer_uid is not None and peer_uid != os.getuid():
+        sock.close()
+        return None
+
+    try:
+        isatty = sys.stdin is None or sys.stdin.isatty()
+        header = {"command": "run", "tool": tool, "argv": list(argv), "cwd": os.getcwd(),
+                  "env": {var: os.environ[var] for var in DAEMON_ENV if var in os.environ}, "isatty": isatty}
+        sock.sendall(("%s\n" % json.dumps(header)).encode("utf-8"))
+
+        ifile = sock.makefile("rb")
+        while True:
+            channel, payload = _read_frame(ifile)
+            if channel is None:
+                return 1  # The worker died without reporting back
+            elif channel == b"o":
+                sys.stdout.buffer.write(payload)
+                sys.stdout.flush()
+            elif channel == b"e":
+                sys.stderr.buffer.write(payload)
+                sys.stderr.flush()
+            elif channel == b"i":
+                data = b"" if isatty else sys.stdin.buffer.read1(struct.unpack("!I", payload)[0])
+                _send_frame(sock, b"i", data)
+            else:
+                return int(payload)
+    except BrokenPipeError:  # Output was piped into something that stopped reading (e.g., head)
+        return 1
+    finally:
+        sock.close()
+
+
+def _run_tool(tool):
+    exit_code = forward_to_daemon(tool, sys.argv[1:])
+    if exit_code is None:
+        return _import_tool(tool).main()
+    return exit_code
+
+
+def seqbuddy():
+    return _run_tool("SeqBuddy")
+
+
+def alignbuddy():
+    return _run_tool("AlignBuddy")
+
+
+def phylobuddy():
+    return _run_tool("PhyloBuddy")
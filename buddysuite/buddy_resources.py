@@ -32,25 +32,33 @@ from collections import OrderedDict
 import os
 from configparser import ConfigParser, NoOptionError
 import json
+import pickle
+import importlib.util
 import traceback
 import re
 import sre_compile
 from ftplib import FTP, all_errors
 from hashlib import md5
-from urllib import request
-from urllib.error import URLError, HTTPError, ContentTooShortError
 from multiprocessing import Process, cpu_count
-from time import time, sleep
+from time import time, sleep, perf_counter, process_time
+from contextlib import contextmanager
+from functools import wraps
+import tracemalloc
 from math import floor
-from tempfile import TemporaryDirectory
-from shutil import copytree, rmtree, copyfile
+from tempfile import TemporaryDirectory, mkstemp
+from shutil import copytree, rmtree, copyfile, copymode
 import string
 from random import choice
 import signal
-from pkg_resources import Requirement, resource_filename, DistributionNotFound
+import gzip
+import lzma
+from io import StringIO, TextIOWrapper, BufferedReader
+from copy import copy, deepcopy
 
-from Bio import AlignIO
+from Bio import AlignIO, bgzf
 from Bio.SeqFeature import SeqFeature, FeatureLocation, CompoundLocation
+from Bio.SeqRecord import SeqRecord
+from Bio.Seq import MutableSeq
 from Bio.Alphabet import IUPAC
 
 
@@ -385,6 +393,287 @@ class TempDir(object):
             return True
 
 
+class ParseCache(object):
+    """
+    Opt-in cache of parsed input files. Whatever the Buddy constructors parse out of a file is pickled into
+    cache_dir, keyed on the file's path, mtime and size along with the parse arguments (in_format, alpha, etc.), so
+    loading the same file again skips the parser completely. The least recently used entries are evicted once the
+    cache grows past max_size bytes.
+    Turn it on with enable_parse_cache(), the -cch flag, or by setting the BUDDYSUITE_CACHE_DIR environment variable.
+    Cached pickles are trusted input: unpickling can run arbitrary code, so anyone who can write to cache_dir can run
+    code as you. The directory is created 0700, and an existing directory is refused (OSError) if it belongs to someone
+    else or is writable by group/other.
+    """
+    def __init__(self, cache_dir=None, max_size=None):
+        if not cache_dir:
+            cache_dir = os.environ.get("BUDDYSUITE_CACHE_DIR",
+                                       os.path.join(os.path.expanduser("~"), ".cache", "buddysuite"))
+        if max_size is None:
+            max_size = int(float(os.environ.get("BUDDYSUITE_CACHE_SIZE", 1024)) * 2 ** 20)  # Megabytes
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = max_size
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        dir_stat = os.stat(self.cache_dir)
+        if (hasattr(os, "getuid") and dir_stat.st_uid != os.getuid()) or dir_stat.st_mode & 0o022:
+            raise OSError("Refusing to use %s for the parse cache, because other users could write to it (it must be "
+                          "owned by you, and not writable by group or other)" % self.cache_dir)
+
+    def _cache_path(self, file_path, args):
+        stats = os.stat(file_path)
+        key = repr((os.path.abspath(file_path), stats.st_mtime_ns, stats.st_size) + tuple(args))
+        return os.path.join(self.cache_dir, "%s.pkl" % md5(key.encode("utf-8")).hexdigest())
+
+    def get(self, file_path, *args):
+        """
+        :param file_path: The file that was parsed
+        :param args: Anything else that changes the result of the parse
+        :return: The cached object, or None
+        """
+        cache_path = self._cache_path(file_path, args)
+        try:
+            with open(cache_path, "rb") as ifile:
+                obj = pickle.load(ifile)
+            os.utime(cache_path)  # Mark as recently used
+            return obj
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+
+    def put(self, obj, file_path, *args):
+        cache_path = self._cache_path(file_path, args)
+        tmp_path = "%s.%s.tmp" % (cache_path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as ofile:
+                pickle.dump(obj, ofile, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError:  # The cache is only ever an optimization, so never let it break anything
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.evict()
+
+    def entries(self):
+        """
+        :return: list of (mtime, size, path) for everything in the cache, least recently used first
+        """
+        entries = []
+        for _file in os.listdir(self.cache_dir):
+            if _file.endswith(".pkl"):
+                _path = os.path.join(self.cache_dir, _file)
+                try:
+                    stats = os.stat(_path)
+                except OSError:
+                    continue
+                entries.append((stats.st_mtime, stats.st_size, _path))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum([entry[1] for entry in entries])
+        for mtime, size, _path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(_path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for mtime, size, _path in self.entries():
+            try:
+                os.remove(_path)
+            except OSError:  # Already gone (e.g., evicted by another process)
+                pass
+
+
+class NullContext(object):
+    """
+    Context manager that does nothing (contextlib.nullcontext() needs Python 3.7)
+    """
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class Profiler(object):
+    """
+    Records wall time, CPU time and peak memory for each phase of a job (parse, guess_format, guess_alphabet,
+    operation, serialize, or anything else passed to phase()). Phases can be nested, and are reported by their path
+    (e.g., 'parse/guess_format') along with 'self' times that exclude any nested phases, so slow jobs can be
+    attributed to a specific stage.
+    Used as a context manager it switches on profiling for every Buddy object created inside the block:
+        with br.Profiler() as profiler:
+            seqbuddy = Sb.SeqBuddy("file.gb")
+            with profiler.phase("translate"):
+                Sb.translate_cds(seqbuddy)
+        print(profiler.report("tsv"))
+    """
+    def __init__(self, memory="rss"):
+        """
+        :param memory: How to measure peak memory.
+                       "rss": The process high-water mark at the end of each phase. Costs nothing, but is cumulative.
+                       "trace": Peak Python allocations within each phase, from tracemalloc. Exact, but everything
+                       runs several times slower, so the timings are inflated. Before Python 3.9 the tracemalloc
+                       peak can't be reset, so each phase reports the highest peak since tracing started.
+                       None: Don't measure memory
+        """
+        if memory not in ["rss", "trace", None]:
+            raise ValueError("Profiler memory mode must be 'rss', 'trace', or None, not '%s'" % memory)
+        self.memory = memory
+        self.phases = OrderedDict()
+        self._stack = []
+        self._previous = None
+        self._started_tracemalloc = False
+
+    def __enter__(self):
+        global PROFILER
+        self._previous = PROFILER
+        PROFILER = self
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        global PROFILER
+        self.stop()
+        PROFILER = self._previous
+        return False
+
+    def start(self):
+        if self.memory == "trace" and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def stop(self):
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    @contextmanager
+    def phase(self, name):
+        path = "%s/%s" % (self._stack[-1]["path"], name) if self._stack else name
+        # Rows are reported in the order that phases are first entered
+        record = self.phases.setdefault(path, OrderedDict([("phase", path), ("calls", 0), ("wall", 0.), ("cpu", 0.),
+                                                           ("self_wall", 0.), ("self_cpu", 0.),
+                                                           ("peak_bytes", None)]))
+        frame = {"path": path, "child_wall": 0., "child_cpu": 0., "peak": 0, "mem_start": 0}
+        tracing = self.memory == "trace" and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            for parent in self._stack:  # The parents' peaks are about to be reset, so bank them first
+                parent["peak"] = max(parent["peak"], peak)
+            reset_traced_peak()
+            frame["mem_start"] = frame["peak"] = current
+        self._stack.append(frame)
+        wall, cpu = perf_counter(), process_time()
+        try:
+            yield self
+        finally:
+            wall, cpu = perf_counter() - wall, process_time() - cpu
+            self._stack.pop()
+            peak_bytes = None
+            if tracing:
+                frame["peak"] = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+                peak_bytes = frame["peak"] - frame["mem_start"]
+            elif self.memory == "rss":
+                peak_bytes = max_rss()
+            if self._stack:
+                self._stack[-1]["child_wall"] += wall
+                self._stack[-1]["child_cpu"] += cpu
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], frame["peak"])
+
+            record["calls"] += 1
+            record["wall"] += wall
+            record["cpu"] += cpu
+            record["self_wall"] += wall - frame["child_wall"]
+            record["self_cpu"] += cpu - frame["child_cpu"]
+            if peak_bytes is not None:
+                record["peak_bytes"] = max(record["peak_bytes"] or 0, peak_bytes)
+
+    def report(self, _format="json"):
+        """
+        :param _format: "json" or "tsv"
+        :return: str
+        """
+        rows = []
+        for record in self.phases.values():
+            row = OrderedDict(record)
+            for key in ["wall", "cpu", "self_wall", "self_cpu"]:
+                row[key] = round(row[key], 6)
+            rows.append(row)
+
+        if _format == "json":
+            return json.dumps(OrderedDict([("memory", self.memory), ("phases", rows)]), indent=2) + "\n"
+        elif _format == "tsv":
+            output = "# memory: %s\nphase\tcalls\twall\tcpu\tself_wall\tself_cpu\tpeak_bytes\n" % self.memory
+            for row in rows:
+                output += "%s\n" % "\t".join(["" if val is None else str(val) for val in row.values()])
+            return output
+        raise ValueError("Profile reports can be 'json' or 'tsv', not '%s'" % _format)
+
+    def write(self, destination="tsv"):
+        """
+        Write the report to stderr or a file
+        :param destination: "json" or "tsv" (written to stderr), or a file path (TSV if it ends in '.tsv', else JSON)
+        :return: None
+        """
+        if destination in ["json", "tsv"]:
+            _stderr(self.report(destination))
+        else:
+            _format = "tsv" if destination.lower().endswith(".tsv") else "json"
+            with open(destination, "w", encoding="utf-8") as ofile:
+                ofile.write(self.report(_format))
+        return
+
+
+class MemoryTracker(object):
+    """
+    Exact peak of the Python allocations made inside a block, from tracemalloc. Tracing slows everything down, so
+    this is opt-in; use estimate_memory() for a free approximation of how big an object is.
+        with br.MemoryTracker() as tracker:
+            Sb.translate_cds(seqbuddy)
+        print(tracker.peak)
+    Note that starting a tracker while something else is already using tracemalloc resets its peak (or, before
+    Python 3.9, that the tracker's peak includes everything since tracing started).
+    """
+    def __init__(self):
+        self.peak = None
+        self._baseline = 0
+        self._started_tracemalloc = False
+        self._previous = None
+
+    def __enter__(self):
+        global MEMORY_TRACKER
+        self._previous = MEMORY_TRACKER
+        MEMORY_TRACKER = self
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        else:
+            reset_traced_peak()
+        self._baseline = tracemalloc.get_traced_memory()[0]
+        self.peak = 0
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        global MEMORY_TRACKER
+        self.peak = self.peak_so_far()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        MEMORY_TRACKER = self._previous
+        return False
+
+    def peak_so_far(self):
+        """
+        :return: Peak bytes allocated above what was already in use when the block was entered
+        """
+        if not tracemalloc.is_tracing():
+            return self.peak
+        return max(tracemalloc.get_traced_memory()[1] - self._baseline, 0)
+
+
 class TempFile(object):
     # I really don't like the behavior of tempfile.[Named]TemporaryFile(), so hack TemporaryDirectory() via TempDir()
     def __init__(self, mode="w", byte_mode=False):
@@ -454,6 +743,98 @@ class TempFile(object):
         return
 
 
+class TrimmedHandle(object):
+    # Pass writes straight through to another handle, but hold back any trailing whitespace so the final output is
+    # equivalent to "%s\n" % output.rstrip() without needing to build the whole output string first.
+    def __init__(self, handle, end="\n"):
+        self.handle = handle
+        self.end = end
+        self._held = ""
+
+    def write(self, content):
+        stripped = content.rstrip()
+        if stripped:
+            self.handle.write("%s%s" % (self._held, stripped))
+            self._held = content[len(stripped):]
+        else:
+            self._held += content
+        return len(content)
+
+    def flush(self):
+        self.handle.flush()
+
+    def close(self):
+        self._held = ""
+        self.handle.write(self.end)
+
+
+class CompressedHandle(object):
+    # Text handle that compresses everything written to it (gzip, bgzf or xz) into a file path or a binary file-like
+    # object. File-like objects are left open when the handle is closed, so this is safe to wrap around stdout.
+    def __init__(self, target, compression="bgzf"):
+        if compression not in COMPRESSION_TYPES:
+            raise ValueError("Unknown compression type '%s'" % compression)
+        self._own_target = type(target) == str
+        self._target = open(target, "wb") if self._own_target else target
+        self._bytes_written = 0
+        if compression == "bgzf":
+            self.handle = bgzf.BgzfWriter(fileobj=self)
+        elif compression == "gzip":
+            self.handle = gzip.GzipFile(fileobj=self, mode="wb")
+        else:
+            self.handle = lzma.LZMAFile(self, mode="wb")
+        self._compressor_open = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, content):
+        if isinstance(content, str):
+            self.handle.write(content.encode("utf-8"))
+        else:  # Compressed bytes coming back out of the compressor
+            self._target.write(content)
+            self._bytes_written += len(content)
+        return len(content)
+
+    def tell(self):
+        return self._bytes_written
+
+    def flush(self):
+        self._target.flush()
+
+    def close(self):
+        if not self._compressor_open:
+            return
+        self._compressor_open = False
+        self.handle.close()  # Writes the trailer back through self.write()
+        if self._own_target:
+            self._target.close()
+        else:
+            self._target.flush()
+
+
+class DecompressedReader(BufferedReader):
+    # Buffered binary reader around a GzipFile or LZMAFile. It holds on to the handle that the compressed bytes come
+    # from, so that handle isn't garbage collected (which closes it) mid-read, and it is only seekable if that handle
+    # is (GzipFile always claims to be seekable, but a pipe can't be rewound). If own_source is set, closing the
+    # reader closes the source handle as well.
+    def __init__(self, stream, source, own_source=False):
+        BufferedReader.__init__(self, stream)
+        self.source = source
+        self._own_source = own_source
+
+    def seekable(self):
+        return self.source.seekable()
+
+    def close(self):
+        BufferedReader.close(self)
+        if self._own_source:
+            self.source.close()
+
+
 class SafetyValve(object):  # Use this class if you're afraid of an infinite loop
     def __init__(self, global_reps=1000, state_reps=10, counter=0):
         self.counter = counter
@@ -657,7 +1038,14 @@ class Usage(object):
     def clear_stats(self):
         self.stats = {"user_hash": self.config["user_hash"]}
 
-    def increment(self, buddy, version, tool, obj_size=None):
+    def increment(self, buddy, version, tool, obj_size=None, peak_memory=None):
+        """
+        :param buddy: Tool name (e.g., 'SeqBuddy')
+        :param version: Version string
+        :param tool: The command that was run
+        :param obj_size: Estimated bytes held by the input object (see estimate_memory())
+        :param peak_memory: Peak bytes used while running the command (see peak_memory())
+        """
         self.stats.setdefault(buddy, {})
         self.stats[buddy].setdefault(version, {})
         self.stats[buddy][version].setdefault(tool, 0)
@@ -665,6 +1053,9 @@ class Usage(object):
         if obj_size:
             self.stats[buddy][version].setdefault("sizes", [])
             self.stats[buddy][version]["sizes"].append(obj_size)
+        if peak_memory:
+            self.stats[buddy][version].setdefault("peak_memory", [])
+            self.stats[buddy][version]["peak_memory"].append(peak_memory)
         return
 
     def save(self, send_report=True):
@@ -743,14 +1134,29 @@ Contributors:
 
 
 # #################################################### FUNCTIONS ##################################################### #
+def resource_filename(package, resource_name):
+    """
+    Find a file installed alongside a package, the same way that pkg_resources.resource_filename() does for BuddySuite,
+    but without paying for the pkg_resources import (which is slow) every time a Buddy tool starts up.
+    :param package: Name of an importable package (e.g., "buddysuite")
+    :param resource_name: Path relative to the directory the package is installed in
+    :return: Absolute path to the resource
+    :raises ImportError: If the package is not installed
+    """
+    spec = importlib.util.find_spec(package)
+    if not spec or not spec.submodule_search_locations:
+        raise ImportError("No module named '%s'" % package, name=package)
+    install_dir = os.path.dirname(os.path.abspath(list(spec.submodule_search_locations)[0]))
+    return os.path.join(install_dir, resource_name)
+
+
 def config_values():
     options = {"email": "buddysuite@nih.gov",
                "diagnostics": False,
                "user_hash": "hashless",
                "shortcuts": ""}
     try:
-        config_file = resource_filename(Requirement.parse("buddysuite"),
-                                        "buddysuite{0}buddy_data{0}config.ini".format(os.path.sep))
+        config_file = resource_filename("buddysuite", "buddysuite{0}buddy_data{0}config.ini".format(os.path.sep))
         config = ConfigParser()
         config.read(config_file)
         for _key, value in list(options.items()):
@@ -762,14 +1168,164 @@ def config_values():
             except KeyError:
                 options[_key] = value
         options["shortcuts"] = options["shortcuts"].split(",")
-        options["data_dir"] = resource_filename(Requirement.parse("buddysuite"), "buddysuite%sbuddy_data" % os.path.sep)
+        options["data_dir"] = resource_filename("buddysuite", "buddysuite%sbuddy_data" % os.path.sep)
         if not os.path.isdir(options["data_dir"]):
             options["data_dir"] = False
-    except (DistributionNotFound, KeyError, NoOptionError):  # This occurs when buddysuite isn't installed
+    except (ImportError, KeyError, NoOptionError):  # This occurs when buddysuite isn't installed
         options["data_dir"] = False
     return options
 
 
+def enable_parse_cache(cache_dir=None, max_size=None):
+    """
+    Turn on the parse cache for all Buddy objects created from files after this point
+    :param cache_dir: Where to store the cached objects (defaults to $BUDDYSUITE_CACHE_DIR or ~/.cache/buddysuite)
+    :param max_size: Size limit of the cache in bytes (defaults to $BUDDYSUITE_CACHE_SIZE megabytes, or 1GB)
+    :return: ParseCache object
+    :raises OSError: If cache_dir can't be created, or could be written to by other users
+    """
+    global PARSE_CACHE
+    PARSE_CACHE = ParseCache(cache_dir, max_size)
+    return PARSE_CACHE
+
+
+def disable_parse_cache():
+    global PARSE_CACHE
+    PARSE_CACHE = None
+
+
+def _env_parse_cache():
+    """
+    The cache is only an optimization, so if $BUDDYSUITE_CACHE_DIR can't be used, warn and carry on without it
+    :return: ParseCache object if $BUDDYSUITE_CACHE_DIR is set and usable, otherwise None
+    """
+    if not os.environ.get("BUDDYSUITE_CACHE_DIR"):
+        return None
+    try:
+        return ParseCache()
+    except OSError as e:
+        _stderr("Warning: %s\n" % e)
+        return None
+
+
+def max_rss():
+    """
+    :return: The peak resident set size of this process in bytes, or None if the platform can't report it
+    """
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024  # Linux reports kilobytes, macOS bytes
+
+
+def reset_traced_peak():
+    """
+    Reset the tracemalloc peak to the current traced memory. tracemalloc.reset_peak() is new in Python 3.9, so on older
+    versions this does nothing and the peak stays the high-water mark since tracing started.
+    :return: True if the peak was reset
+    """
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+        return True
+    return False
+
+
+def peak_memory():
+    """
+    The best available measure of peak memory use so far: the innermost active MemoryTracker if there is one,
+    otherwise the process high-water mark
+    :return: int (bytes) or None
+    """
+    if MEMORY_TRACKER:
+        return MEMORY_TRACKER.peak_so_far()
+    return max_rss()
+
+
+def trace_memory(func, *args, **kwargs):
+    """
+    Call a function under a MemoryTracker (e.g., trace_memory(Sb.translate_cds, seqbuddy))
+    :return: (whatever func returns, peak bytes allocated during the call)
+    """
+    with MemoryTracker() as tracker:
+        result = func(*args, **kwargs)
+    return result, tracker.peak
+
+
+def estimate_memory(obj):
+    """
+    Cheaply estimate how many bytes a Buddy object occupies once parsed, without serializing anything.
+    Records are costed from their sequence length and number of features, qualifiers and annotations, and trees
+    from their number of nodes, using the per-item sizes in MEMORY_MODEL.
+    :param obj: SeqBuddy, AlignBuddy, or PhyloBuddy object, or any SeqRecord, alignment, tree, or list of these
+    :return: int
+    """
+    if hasattr(obj, "alignments"):  # AlignBuddy
+        return sum([estimate_memory(alignment) for alignment in obj.alignments])
+    elif hasattr(obj, "trees"):  # PhyloBuddy
+        return sum([estimate_memory(tree) for tree in obj.trees])
+    elif hasattr(obj, "records") and isinstance(obj.records, list):  # SeqBuddy
+        return estimate_memory(obj.records)
+    elif isinstance(obj, SeqRecord):
+        size = MEMORY_MODEL["record"] + len(obj.seq) * MEMORY_MODEL["residue"]
+        size += len(obj.id) + len(obj.name) + len(obj.description)
+        for feature in obj.features:
+            size += MEMORY_MODEL["feature"] + len(feature.qualifiers) * MEMORY_MODEL["qualifier"]
+        size += len(obj.annotations) * MEMORY_MODEL["annotation"]
+        return size
+    elif hasattr(obj, "preorder_node_iter"):  # DendroPy Tree
+        return MEMORY_MODEL["tree_node"] * sum([1 for _ in obj.preorder_node_iter()])
+    elif hasattr(obj, "__iter__") and not isinstance(obj, str):  # Lists of records, MultipleSeqAlignment, etc.
+        return sum([estimate_memory(item) for item in obj])
+    raise TypeError("Unable to estimate the memory used by a %s object" % type(obj).__name__)
+
+
+def enable_profiler(memory="rss"):
+    """
+    Start recording phase timings for everything that happens after this point (used by the --profile flag)
+    :param memory: "rss", "trace", or None (see Profiler)
+    :return: Profiler object
+    """
+    global PROFILER
+    PROFILER = Profiler(memory)
+    PROFILER.start()
+    return PROFILER
+
+
+def disable_profiler():
+    global PROFILER
+    if PROFILER:
+        PROFILER.stop()
+    PROFILER = None
+
+
+def profile_phase(name):
+    """
+    Time a block of code as a named phase, if profiling has been switched on. Otherwise this does nothing.
+    :param name: Phase name
+    :return: Context manager
+    """
+    if PROFILER:
+        return PROFILER.phase(name)
+    return _NULL_PHASE
+
+
+def profiled(name):
+    """
+    Decorator version of profile_phase()
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER:
+                return func(*args, **kwargs)
+            with PROFILER.phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
 def check_garbage_flags(in_args, tool):
     """
     If an unknown flag is thrown immediately after the sequence/alignment/tree positional argument it is not treated
@@ -796,6 +1352,8 @@ def check_garbage_flags(in_args, tool):
 
 
 def error_report(trace_back, permission=False):
+    from urllib import request
+    from urllib.error import URLError, HTTPError, ContentTooShortError
     message = ""
     error_hash = re.sub("^#.*?\n{2}", "", trace_back, flags=re.DOTALL)  # Remove error header information before hashing
     error_hash = md5(error_hash.encode("utf-8")).hexdigest()  # Hash the error
@@ -932,6 +1490,167 @@ def parse_format(_format):
     return _format
 
 
+def compression_type(_input):
+    """
+    Identify compressed data from its magic bytes
+    :param _input: File path or the first few bytes of a file
+    :return: "bgzf", "gzip", "xz", or None
+    """
+    if type(_input) == str:
+        try:
+            with open(_input, "rb") as ifile:
+                _input = ifile.read(18)
+        except (OSError, ValueError):
+            return None
+
+    if _input.startswith(b"\x1f\x8b"):
+        # BGZF is gzip with a 'BC' extra subfield in every block header
+        if len(_input) >= 14 and _input[3] & 4 and _input[12:14] == b"BC":
+            return "bgzf"
+        return "gzip"
+    if _input.startswith(b"\xfd7zXZ\x00"):
+        return "xz"
+    return None
+
+
+def split_compression(_format):
+    """
+    Separate a compression suffix from a format or file name (e.g., 'fasta.gz' -> ('fasta', 'bgzf'))
+    :param _format: Format string or file path
+    :return: tuple of (_format without suffix, compression type or None)
+    """
+    if _format:
+        for ext, compression in COMPRESSION_EXTENSIONS.items():
+            if _format.lower().endswith(".%s" % ext):
+                return _format[:-len(ext) - 1], compression
+    return _format, None
+
+
+def open_text(file_path, mode="r", compression=None):
+    """
+    Open a file in text mode, transparently decompressing gzip/bgzf/xz files on read and compressing on write
+    :param file_path: Path to the file
+    :param mode: "r" or "w"
+    :param compression: "bgzf", "gzip", or "xz". Detected from the magic bytes when reading.
+    :return: Text file handle
+    """
+    if "r" in mode:
+        # The file is only opened once, and the magic bytes peeked at from its buffer, so pipes and process
+        # substitutions (e.g., '<(zcat ids.gz)') aren't drained before they are read.
+        ifile = open(file_path, "rb")
+        compression = compression_type(ifile.peek(18)[:18])
+        if compression in ["bgzf", "gzip"]:
+            stream = gzip.GzipFile(fileobj=ifile)
+        elif compression == "xz":
+            stream = lzma.LZMAFile(ifile)
+        else:
+            return TextIOWrapper(ifile, encoding="utf-8")
+        return TextIOWrapper(DecompressedReader(stream, ifile, own_source=True), encoding="utf-8")
+
+    if compression:
+        return CompressedHandle(file_path, compression)
+    return open(file_path, mode, encoding="utf-8")
+
+
+@contextmanager
+def atomic_write(file_path, compression=None):
+    """
+    Stream text into a temporary file in the same directory as file_path, and only swap it into place (with
+    os.replace(), which is atomic) once everything has been written. If the job dies part way through, the original
+    file is left untouched.
+    :param file_path: The file to (over)write. Symlinks are followed, so the link itself is preserved.
+    :param compression: "bgzf", "gzip", or "xz"
+    :return: Text handle (use as a context manager)
+    """
+    file_path = os.path.realpath(file_path)
+    directory, name = os.path.split(file_path)
+    tmp_handle, tmp_path = mkstemp(prefix=".%s." % name, suffix=".tmp", dir=directory)
+    os.close(tmp_handle)
+    try:
+        with open_text(tmp_path, "w", compression) as ofile:
+            yield ofile
+        if os.path.exists(file_path):
+            copymode(file_path, tmp_path)  # mkstemp() creates the file as user read/write only
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def compress_handle(handle, compression):
+    """
+    Wrap an open handle so that text written to it comes out compressed
+    :param handle: Text handle with an underlying binary buffer (e.g., sys.stdout), or a binary file-like object
+    :param compression: "bgzf", "gzip", or "xz"
+    :return: CompressedHandle object
+    """
+    if hasattr(handle, "buffer"):
+        handle.flush()
+        handle = handle.buffer
+    return CompressedHandle(handle, compression)
+
+
+def decompress_handle(handle):
+    """
+    If a text handle (e.g., sys.stdin) is wrapped around compressed data, swap it out for a text handle that
+    decompresses the underlying byte stream as it is read
+    :param handle: File-like object
+    :return: The original handle, or a TextIOWrapper around the decompressed stream
+    """
+    buffer = getattr(handle, "buffer", None)
+    if buffer is None or not hasattr(buffer, "peek"):
+        return handle
+    try:
+        compression = compression_type(buffer.peek(18)[:18])
+    except (OSError, ValueError):
+        return handle
+    if not compression:
+        return handle
+    if compression == "xz":
+        stream = lzma.LZMAFile(buffer)
+    else:
+        stream = gzip.GzipFile(fileobj=buffer)
+    return TextIOWrapper(DecompressedReader(stream, handle), encoding="utf-8")
+
+
+def sniff_format(head):
+    """
+    Classify a file from the first few KB of its contents, without running any of the BioPython parsers
+    :param head: The start of the file (str)
+    :return: List of candidate formats, most likely first, or None if the header is not recognized
+    """
+    lines = head.lstrip().splitlines()
+    if not lines:
+        return None
+
+    first_line = lines[0].rstrip()
+    if first_line.startswith("# STOCKHOLM"):
+        return ["stockholm"]
+    elif first_line.startswith(">"):
+        return ["fasta"]
+    elif first_line.startswith("LOCUS"):
+        return ["gb"]
+    elif first_line.startswith("ID   "):
+        return ["embl", "swiss"]
+    elif first_line.upper().startswith("#NEXUS"):
+        return ["nexus"]
+    elif re.match("(CLUSTAL|MUSCLE|PROBCONS|MSAPROBS|Kalign)", first_line):
+        return ["clustal"]
+    elif first_line.startswith("<"):
+        if "<seqXML" in head:
+            return ["seqxml"]
+        elif re.search("<nex:nexml", head, re.IGNORECASE):
+            return ["nexml"]
+    elif first_line.startswith("@") and len(lines) > 2 and lines[2].startswith("+"):
+        return ["fastq"]
+    elif re.match(r"[0-9]+\s+[0-9]+$", first_line.strip()):
+        return ["phylipss", "phylipsr", "phylip", "phylip-relaxed"]
+    elif first_line.startswith("("):
+        return ["newick"]
+    return None
+
+
 def phylip_sequential_out(_input, relaxed=True, _type="alignbuddy"):
     output = ""
     if _type == "alignbuddy":
@@ -1386,6 +2105,28 @@ if os.name == "nt":
     os.path.isfile = isfile_override
 
 
+def copy_records(records):
+    """
+    Copy a list of SeqRecords. Sequence data is immutable, so each copy gets a shallow copy of the Seq object instead of
+    a deepcopy of the underlying string; everything else (features, annotations, etc.) is deepcopied. The original
+    records are not modified.
+    :param records: list of SeqRecord objects
+    :return: list of SeqRecord objects
+    """
+    new_records = []
+    for rec in records:
+        new_rec = rec.__class__.__new__(rec.__class__)
+        memo = {}
+        for key, value in rec.__dict__.items():
+            if key == "_seq":
+                value = deepcopy(value, memo) if isinstance(value, MutableSeq) else copy(value)
+            elif key not in ["id", "name", "description"]:
+                value = deepcopy(value, memo)
+            new_rec.__dict__[key] = value
+        new_records.append(new_rec)
+    return new_records
+
+
 def clean_regex(patterns, quiet=False):
     """
     Ensure that user provided regular expression are valid
@@ -1431,6 +2172,25 @@ format_to_extension = {'fasta': 'fa', 'fa': 'fa', 'genbank': 'gb', 'gb': 'gb', '
                        'phyr': 'phyr', 'phylipss': 'physs', 'physs': 'physs', 'phylipsr': 'physr',
                        'physr': 'physr', 'stockholm': 'stklm', 'stklm': 'stklm', 'clustal': 'clus', 'clus': 'clus'}
 
+# Compressed input is detected from magic bytes, while compressed output is selected by suffix (e.g., 'fasta.gz').
+# BGZF is written for '.gz' because it is still regular gzip, but can be indexed for random access.
+COMPRESSION_TYPES = ["bgzf", "gzip", "xz"]
+COMPRESSION_EXTENSIONS = OrderedDict([("gz", "bgzf"), ("bgz", "bgzf"), ("xz", "xz")])
+
+# Set by enable_parse_cache(), or just by setting the BUDDYSUITE_CACHE_DIR environment variable
+PARSE_CACHE = _env_parse_cache()
+
+# Set by enable_profiler() (the --profile flag), or while a Profiler is being used as a context manager
+PROFILER = None
+_NULL_PHASE = NullContext()
+
+# Set while a MemoryTracker is being used as a context manager
+MEMORY_TRACKER = None
+
+# Approximate bytes taken up by each part of a parsed record or tree (measured with tracemalloc), used by
+# estimate_memory(). Sequences are stored as one byte per residue.
+MEMORY_MODEL = {"record": 900, "residue": 1, "feature": 600, "qualifier": 150, "annotation": 150, "tree_node": 1300}
+
 
 # flag, action, nargs, metavar, help, choices, type
 # #################################################### INSTALLER ##################################################### #
@@ -1488,13 +2248,15 @@ sb_flags = {"annotate": {"flag": "ano",
             "count_codons": {"flag": "cc",
                              "action": "append",
                              "nargs": "?",
-                             "metavar": "'concatenate'",
-                             "help": "Return codon frequency statistics"},
+                             "metavar": "'concatenate'|'aggregate'",
+                             "help": "Return codon frequency statistics, per record or pooled across all records "
+                                     "('aggregate'). Use -gc to change the genetic code."},
             "count_residues": {"flag": "cr",
                                "action": "append",
                                "nargs": "?",
-                               "metavar": "'concatenate'",
-                               "help": "Generate a table of sequence compositions"},
+                               "metavar": "'concatenate'|'aggregate'",
+                               "help": "Generate a table of sequence compositions, per record or pooled across all "
+                                       "records ('aggregate')"},
             "degenerate_sequence": {"flag": "dgn",
                                     "action": "append",
                                     "nargs": '?',
@@ -1546,8 +2308,13 @@ sb_flags = {"annotate": {"flag": "ano",
                          "action": "store_true",
                          "help": "Predict regions under strong purifying selection based on high CpG content"},
             "find_orfs": {"flag": "orf",
-                          "action": "store_true",
-                          "help": "Finds all the open reading frames in the sequences and their reverse complements."},
+                          "action": "append",
+                          "nargs": "*",
+                          "metavar": "args",
+                          "help": "Finds all the open reading frames in the sequences and their reverse complements. "
+                                  "Args: [min length (int)] ['alt' (allow alternative start codons)] "
+                                  "['coords' (only output a table of coordinates)]. Use -gc to change the genetic "
+                                  "code."},
             "find_pattern": {"flag": "fp",
                              "action": "store",
                              "nargs": "+",
@@ -1682,6 +2449,10 @@ sb_flags = {"annotate": {"flag": "ano",
                              "nargs": "+",
                              "metavar": "<regex>",
                              "help": "Get all the records with ids containing a given string"},
+            "pull_records_file": {"flag": "prfl",
+                                  "action": "store",
+                                  "metavar": "<file>",
+                                  "help": "Get the records with IDs listed in a file (one exact ID per line)"},
             "pull_records_with_feature": {"flag": "prf",
                                           "action": "store",
                                           "nargs": "+",
@@ -1744,12 +2515,25 @@ sb_flags = {"annotate": {"flag": "ano",
 sb_modifiers = {"alpha": {"flag": "a",
                           "action": "store",
                           "help": "If you want the file read with a specific alphabet"},
+                "cache": {"flag": "cch",
+                          "action": "store_true",
+                          "help": "Reuse a cached copy of the parsed input file (set BUDDYSUITE_CACHE_DIR and "
+                                  "BUDDYSUITE_CACHE_SIZE to control location and size)"},
+                "genetic_code": {"flag": "gc",
+                                 "action": "store",
+                                 "metavar": "<NCBI table ID or name>",
+                                 "help": "Genetic code used by count_codons, find_orfs, translate and "
+                                         "translate6frames (default=1, Standard)"},
                 "in_format": {"flag": "f",
                               "action": "store",
                               "help": "If SeqBuddy can't guess the file format, try specifying it directly"},
                 "in_place": {"flag": "i",
                              "action": "store_true",
                              "help": "Rewrite the input file in-place. Be careful!"},
+                "index": {"flag": "idx",
+                          "action": "store_true",
+                          "help": "Build (or reuse) a sidecar offset index, and only read in the records that are "
+                                  "needed (pull_records, pull_random_record, extract_regions)"},
                 "keep_temp": {"flag": "k",
                               "action": "store",
                               "help": "Save temporary files created by generate_tree in current working directory"},
@@ -1757,9 +2541,25 @@ sb_modifiers = {"alpha": {"flag": "a",
                                "metavar": "",
                                "action": "store",
                                "help": "If you want a specific format output"},
+                "pipeline": {"flag": "pl",
+                             "action": "store",
+                             "metavar": "'cmd [args]; cmd [args]'",
+                             "help": "Run several commands in a row, keeping the records in memory between them "
+                                     "(e.g., -pl 'clean_seq; translate; order_ids')"},
+                "profile": {"flag": "prof",
+                            "nargs": "?",
+                            "const": "tsv",
+                            "action": "store",
+                            "metavar": "json|tsv|path",
+                            "help": "Report time and peak memory for each stage of the job (parse, format and "
+                                    "alphabet guessing, the command, output) to stderr, or write it to a file"},
                 "quiet": {"flag": "q",
                           "action": "store_true",
                           "help": "Suppress stderr messages"},
+                "stream": {"flag": "stm",
+                           "action": "store_true",
+                           "help": "Process records in chunks, without reading the whole file into memory "
+                                   "(record-local commands only)"},
                 "test": {"flag": "t",
                          "action": "store_true",
                          "help": "Run the function and return any stderr/stdout other than sequences"}}
@@ -1883,7 +2683,11 @@ alb_flags = {"alignment_lengths": {"flag": "al",
                            "help": "Convert all sequences to uppercase"},
              }
 
-alb_modifiers = {"in_format": {"flag": "f",
+alb_modifiers = {"cache": {"flag": "cch",
+                           "action": "store_true",
+                           "help": "Reuse a cached copy of the parsed input file (set BUDDYSUITE_CACHE_DIR and "
+                                   "BUDDYSUITE_CACHE_SIZE to control location and size)"},
+                 "in_format": {"flag": "f",
                                "action": "store",
                                "help": "If AlignBuddy can't guess the file format, try specifying it directly"},
                  "in_place": {"flag": "i",
@@ -1895,6 +2699,13 @@ alb_modifiers = {"in_format": {"flag": "f",
                  "out_format": {"flag": "o",
                                 "action": "store",
                                 "help": "If you want a specific format output"},
+                 "profile": {"flag": "prof",
+                             "nargs": "?",
+                             "const": "tsv",
+                             "action": "store",
+                             "metavar": "json|tsv|path",
+                             "help": "Report time and peak memory for each stage of the job (parse, format and "
+                                     "alphabet guessing, the command, output) to stderr, or write it to a file"},
                  "quiet": {"flag": "q",
                            "action": "store_true",
                            "help": "Suppress stderr messages"},
@@ -1994,6 +2805,13 @@ pb_modifiers = {"in_format": {"flag": "f",
                                "metavar": "<format>",
                                "action": "store",
                                "help": "Choose a specific output format"},
+                "profile": {"flag": "prof",
+                            "nargs": "?",
+                            "const": "tsv",
+                            "action": "store",
+                            "metavar": "json|tsv|path",
+                            "help": "Report time and peak memory for each stage of the job (parse, format and "
+                                    "alphabet guessing, the command, output) to stderr, or write it to a file"},
                 "quiet": {"flag": "q",
                           "action": "store_true",
                           "help": "Suppress stderr messages"},
@@ -389,7 +389,7 @@ def test_clustalomega(sb_resources, hf, monkeypatch):
     for file in sorted(files):
         with open("%s%s%s" % (root, os.path.sep, file), "r", encoding="utf-8") as ifile:
             kept_output += ifile.read()
-    assert hf.string2hash(kept_output) == "bad3a345e769d32672d39ee51df295f5"
+    assert hf.string2hash(kept_output) == "eae2d917c462b70253cb83af98bfb60b"
 
 
 def test_clustalw2(sb_resources, hf, monkeypatch):
@@ -429,7 +429,7 @@ def test_clustalw2(sb_resources, hf, monkeypatch):
     for file in sorted(files):
         with open("%s%s%s" % (root, os.path.sep, file), "r", encoding="utf-8") as ifile:
             kept_output += ifile.read()
-    assert hf.string2hash(kept_output) == "7c03d671198d4e6c4bb56c8fb5619fff"
+    assert hf.string2hash(kept_output) == "eb9ff56e71021ce9237aa592d4c9d686"
 
 
 def test_pagan(sb_resources, hf, monkeypatch):
@@ -472,7 +472,7 @@ def test_pagan(sb_resources, hf, monkeypatch):
     for file in sorted(files):
         with open("%s%s%s" % (root, os.path.sep, file), "r", encoding="utf-8") as ifile:
             kept_output += ifile.read()
-    assert hf.string2hash(kept_output) == "864112dafb4896ba25ece7929ca0a818"
+    assert hf.string2hash(kept_output) == "e6e34b6cc0a2de62be9e94c8917ad2fc"
 
 
 def test_prank(sb_resources, hf, monkeypatch):
@@ -512,7 +512,7 @@ def test_prank(sb_resources, hf, monkeypatch):
     for file in sorted(files):
         with open("%s%s%s" % (root, os.path.sep, file), "r", encoding="utf-8") as ifile:
             kept_output += ifile.read()
-    assert hf.string2hash(kept_output) == "d0564931e20a61b441fc60549f5560a0"
+    assert hf.string2hash(kept_output) == "4928df3557f29312d7b55166829eb477"
 
 
 def test_muscle(sb_resources, hf, monkeypatch):
@@ -543,7 +543,7 @@ def test_muscle(sb_resources, hf, monkeypatch):
     for file in sorted(files):
         with open("%s%s%s" % (root, os.path.sep, file), "r", encoding="utf-8") as ifile:
             kept_output += ifile.read()
-    assert hf.string2hash(kept_output) == "bd85c34b11261aef2d38c7a6a9d20bf9"
+    assert hf.string2hash(kept_output) == "e2f32ea93255937069bc172fbf7c354f"
 
 
 def test_mafft(sb_resources, hf, monkeypatch):
@@ -576,7 +576,7 @@ def test_mafft(sb_resources, hf, monkeypatch):
     for file in sorted(files):
         with open("%s%s%s" % (root, os.path.sep, file), "r", encoding="utf-8") as ifile:
             kept_output += ifile.read()
-    assert hf.string2hash(kept_output) == "6eaa7e087dd42a8d3ffe86d216b917d8"
+    assert hf.string2hash(kept_output) == "1a45f520c0df3670c93db90907ca3978"
 
 
 def test_alignment_edges(monkeypatch, sb_resources):
@@ -733,14 +733,14 @@ def test_rename_ids(key, next_hash, alb_resources, hf):
 
 
 # ###########################################  'tr', '--translate' ############################################ #
-hashes = [('o d f', 'b7fe22a87fb78ce747d80e1d73e39c35'), ('o d g', '625f68463c93310015c6f43100c6b96e'),
-          ('o d n', 'a2586af672ad71f16bbd54f359b323ff'), ('o d py', 'd0d4dd408e559215b2780f4f0ae0c418'),
-          ('o d pr', 'f77705e32cd753267916539ee0936e1f'), ('o d pss', 'ede672b15221ec60981287ca1e286c52'),
-          ('o d psr', '623fe1634752e812f482cfa7b7ea20ee'), ('o d s', '4ff563c39229d30aa3eda193cb290344'),
-          ('o d c', '150179326629fffadb7aef7796bd1cec'), ('m d py', '7fd28236f491c38ba261dfde20919595'),
-          ('m d pr', '0de676236eda864172b73b6abe4d7a05'), ('m d pss', 'c7feff60c16b2b187e03db5d160a4748'),
-          ('m d psr', 'b5945f0317fe9ce8fc03ac7f4c0d5932'), ('m d s', 'ee5a41b6f8b32645359beafc72efe825'),
-          ('m d c', '09251e1f4fc0e07a5bba4c64c22bac9b')]
+hashes = [('o d f', 'd410306e950fd25f86a9340d90942756'), ('o d g', '625f68463c93310015c6f43100c6b96e'),
+          ('o d n', 'fa8430bd8b073bd283856561818e7b56'), ('o d py', 'd87c83b67c9a66853dde06a6ca924ca9'),
+          ('o d pr', 'ce423d5b99d5917fbef6f3b47df40513'), ('o d pss', '48e21cfa06aed47fd2e5d99f4b88b23e'),
+          ('o d psr', '8ff80c7f0b8fc7f237060f94603c17be'), ('o d s', '2340addad40e714268d2523cdb17a78c'),
+          ('o d c', 'cd78644bbbbe01e2d4a8ad432f3643cc'), ('m d py', '982d7a8e780db777b1b1ef61f7109db7'),
+          ('m d pr', '349e2944d5ccb4c5e01d5c41bd171760'), ('m d pss', '8ffd21df111ac0b8ccba02644ae3c097'),
+          ('m d psr', 'df674450da63ef46b3ec9d8feb09ef09'), ('m d s', '29c77e7aad6c936d9d8180176c0323f1'),
+          ('m d c', '7ba8c75a2248f78a70682b8c28febc49')]
 
 
 @pytest.mark.parametrize("key,next_hash", hashes)
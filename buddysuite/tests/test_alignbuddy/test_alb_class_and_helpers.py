@@ -4,6 +4,7 @@
 import pytest
 import io
 import os
+import gzip
 from Bio.SeqRecord import SeqRecord
 from Bio.Seq import Seq
 from Bio.Alphabet import IUPAC
@@ -45,6 +46,19 @@ def test_instantiate_alignbuddy_from_raw(alb_resources):
             assert type(AlignBuddy(output)) == AlignBuddy
 
 
+def test_instantiate_alignbuddy_from_compressed(alb_resources, hf):
+    tmp_dir = br.TempDir()
+    for key in ["o d n", "o p s", "m d py"]:
+        _path = alb_resources.get_one(key, mode="paths")
+        plain = AlignBuddy(_path)
+        with open(_path, "rb") as ifile:
+            with gzip.open("%s/align.gz" % tmp_dir.path, "wb") as ofile:
+                ofile.write(ifile.read())
+        tester = AlignBuddy("%s/align.gz" % tmp_dir.path)
+        assert tester.in_format == plain.in_format
+        assert hf.buddy2hash(tester) == hf.buddy2hash(plain)
+
+
 def test_instantiate_alignbuddy_from_alignbuddy(alb_resources):
     for alignbuddy in alb_resources.get_list():
         assert type(AlignBuddy(alignbuddy)) == AlignBuddy
@@ -105,7 +119,7 @@ def test_records_iter(alb_resources):
     tester = alb_resources.get_list("m p py")[0]
     counter = 0
     for rec in tester.records_iter():
-        assert type(rec) == SeqRecord
+        assert isinstance(rec, SeqRecord)
         counter += 1
     assert counter == 29
 
@@ -219,6 +233,23 @@ hashes = [('m p c', '9c6773e7d24000f8b72dd9d25620cff1'), ('m p s', '9c6773e7d240
           ('m p pss', '1f172a3beef76e8e3d42698bb2c3c87d'), ('m p psr', '3fef9a05058a5259ebd517d1500388d4')]
 
 
+def test_write_compressed(alb_resources, hf):
+    tmp_dir = br.TempDir()
+    tester = alb_resources.get_one("o d n")
+    tester.write("%s/align.nex.gz" % tmp_dir.path)
+    assert br.compression_type("%s/align.nex.gz" % tmp_dir.path) == "bgzf"
+    assert hf.buddy2hash(AlignBuddy("%s/align.nex.gz" % tmp_dir.path)) == hf.buddy2hash(tester)
+
+    tester.write("%s/align" % tmp_dir.path, out_format="fasta.xz")
+    assert br.compression_type("%s/align" % tmp_dir.path) == "xz"
+    assert AlignBuddy("%s/align" % tmp_dir.path).in_format == "fasta"
+    assert tester.out_format == "nexus"
+
+    handle = io.BytesIO()
+    tester.write(handle, compression="gzip")
+    assert gzip.decompress(handle.getvalue()).decode("utf-8") == str(tester)
+
+
 @pytest.mark.parametrize("key,next_hash", hashes)
 def test_write2(alb_resources, hf, key, next_hash):
     temp_file = br.TempFile()
@@ -247,6 +278,41 @@ def test_write3(alb_resources, hf):  # Unloopable components
     assert hf.buddy2hash(tester) == "16b3397d6315786e8ad8b66e0d9c798f"
 
 
+def test_write_handle(alb_resources):
+    tester = alb_resources.get_one("m p s")
+    handle = io.StringIO()
+    tester.write(handle, out_format="phylipr")
+    expected = alb_resources.get_one("m p s")
+    expected.set_format("phylipr")
+    assert handle.getvalue() == str(expected)
+    assert tester.out_format == "stockholm"
+
+    tester.set_format("fasta")
+    with pytest.raises(ValueError):
+        tester.write(io.StringIO())
+
+
+# ######################  Parse cache ###################### #
+def test_parse_cache(alb_resources, hf, monkeypatch):
+    tmp_dir = br.TempDir()
+    monkeypatch.setattr(br, "PARSE_CACHE", None)
+    cache = br.enable_parse_cache(tmp_dir.path)
+    _path = alb_resources.get_one("o d n", mode="paths")
+    tester = AlignBuddy(_path)
+    assert len(cache.entries()) == 1
+
+    def kaboom(*args, **kwargs):
+        raise AssertionError("Should have been pulled from the cache")
+
+    monkeypatch.setattr(AlignIO, "parse", kaboom)
+    cached = AlignBuddy(_path)
+    assert hf.buddy2hash(cached) == hf.buddy2hash(tester)
+    assert cached.in_format == tester.in_format
+    assert cached.alpha == tester.alpha
+    assert len(cache.entries()) == 1
+    br.disable_parse_cache()
+
+
 # ################################################# HELPER FUNCTIONS ################################################# #
 def test_guess_error(alb_odd_resources):
     # File path
@@ -314,4 +380,11 @@ def test_make_copy(alb_resources, hf):
         tester = make_copy(alb)
         hf.buddy2hash(tester) == hf.buddy2hash(alb)
 
+    alb = alb_resources.get_one("o d g")
+    tester = make_copy(alb)
+    tester.records()[0].features = []
+    tester.alignments[0].annotations["foo"] = "bar"
+    assert alb.records()[0].features
+    assert "foo" not in alb.alignments[0].annotations
+
 # ToDo: def test_feature_remapper()
@@ -11,14 +11,19 @@ import ftplib
 import urllib.request
 import argparse
 import json
+import pickle
+import threading
+import gzip
+import lzma
 from hashlib import md5
 from time import sleep
 import datetime
 from unittest import mock
 import AlignBuddy as Alb
 import buddy_resources as br
-from pkg_resources import DistributionNotFound
 from configparser import ConfigParser
+from Bio import SeqIO
+from Bio.SeqRecord import SeqRecord
 if os.name == "nt":
     import msvcrt
 
@@ -334,6 +339,192 @@ def test_tempdir_make_dir_generator():
     os.makedirs(dir_path)
 
 
+# ######################################  ParseCache  ###################################### #
+def test_parsecache(monkeypatch, capsys):
+    tmp_dir = br.TempDir()
+    cache = br.ParseCache(tmp_dir.subdir("cache"), max_size=2 ** 20)
+    assert os.path.isdir(cache.cache_dir)
+    tmp_file = br.TempFile()
+    tmp_file.write("foo")
+    tmp_file.close()
+
+    assert cache.get(tmp_file.path, "fasta") is None
+    cache.put(["foo", "bar"], tmp_file.path, "fasta")
+    assert cache.get(tmp_file.path, "fasta") == ["foo", "bar"]
+    assert cache.get(tmp_file.path, "genbank") is None
+    assert len(cache.entries()) == 1
+
+    # Changing the file invalidates the entry
+    tmp_file.write("foobar")
+    tmp_file.close()
+    assert cache.get(tmp_file.path, "fasta") is None
+
+    # Least recently used entries are evicted first
+    cache.max_size = len(pickle.dumps("x" * 1000, protocol=pickle.HIGHEST_PROTOCOL)) * 2
+    cache.clear()
+    cache.put("x" * 1000, tmp_file.path, "a")
+    os.utime(cache.entries()[0][2], (1, 1))
+    cache.put("x" * 1000, tmp_file.path, "b")
+    os.utime(cache.entries()[1][2], (2, 2))
+    assert cache.get(tmp_file.path, "a") == "x" * 1000
+    cache.put("x" * 1000, tmp_file.path, "c")
+    assert cache.get(tmp_file.path, "a") == "x" * 1000
+    assert cache.get(tmp_file.path, "b") is None
+    assert cache.get(tmp_file.path, "c") == "x" * 1000
+
+    # Corrupt entries are treated as a miss
+    with open(cache.entries()[0][2], "w") as ofile:
+        ofile.write("Not a pickle")
+    assert len([x for x in [cache.get(tmp_file.path, "a"), cache.get(tmp_file.path, "c")] if x]) == 1
+
+    cache.clear()
+    assert not cache.entries()
+
+    # Entries that disappear part way through (e.g., evicted by another process) don't stop clear()
+    cache.put("x", tmp_file.path, "a")
+    monkeypatch.setattr(cache, "entries", lambda: [(0, 0, os.path.join(cache.cache_dir, "gone.pkl"))] +
+                        br.ParseCache.entries(cache))
+    cache.clear()
+    monkeypatch.undo()
+    assert not cache.entries()
+
+    # Unpickling can run code, so the cache directory has to be private
+    cache = br.ParseCache(os.path.join(tmp_dir.path, "private", "cache"))
+    assert os.stat(cache.cache_dir).st_mode & 0o777 == 0o700
+    os.chmod(cache.cache_dir, 0o770)
+    with pytest.raises(OSError) as err:
+        br.ParseCache(cache.cache_dir)
+    assert "Refusing to use %s for the parse cache" % cache.cache_dir in str(err.value)
+
+    monkeypatch.setenv("BUDDYSUITE_CACHE_DIR", cache.cache_dir)
+    assert br._env_parse_cache() is None
+    assert "Warning: Refusing to use" in capsys.readouterr()[1]
+
+    monkeypatch.setattr(br, "PARSE_CACHE", None)
+    monkeypatch.setenv("BUDDYSUITE_CACHE_DIR", tmp_dir.subdir("env_cache"))
+    monkeypatch.setenv("BUDDYSUITE_CACHE_SIZE", "0.5")
+    br.enable_parse_cache()
+    assert br.PARSE_CACHE.cache_dir == os.path.join(tmp_dir.path, "env_cache")
+    assert br.PARSE_CACHE.max_size == 2 ** 19
+    br.disable_parse_cache()
+    assert br.PARSE_CACHE is None
+
+
+# ######################################  Profiler  ###################################### #
+def test_profiler(monkeypatch):
+    monkeypatch.setattr(br, "PROFILER", None)
+    with br.profile_phase("nothing"):  # No-op when profiling is off
+        pass
+
+    @br.profiled("inner")
+    def inner():
+        return "x" * 10 ** 6
+
+    with br.Profiler(memory="trace") as profiler:
+        assert br.PROFILER is profiler
+        with br.profile_phase("outer"):
+            assert inner()
+            assert inner()
+            sleep(0.05)
+    assert br.PROFILER is None
+
+    assert list(profiler.phases) == ["outer", "outer/inner"]
+    outer_phase, inner_phase = profiler.phases["outer"], profiler.phases["outer/inner"]
+    assert outer_phase["calls"] == 1 and inner_phase["calls"] == 2
+    assert outer_phase["wall"] >= 0.05
+    assert round(outer_phase["self_wall"] + inner_phase["wall"], 6) == round(outer_phase["wall"], 6)
+    assert 10 ** 6 <= inner_phase["peak_bytes"] <= outer_phase["peak_bytes"]
+
+    report = json.loads(profiler.report("json"))
+    assert report["memory"] == "trace"
+    assert [row["phase"] for row in report["phases"]] == ["outer", "outer/inner"]
+    report = profiler.report("tsv").splitlines()
+    assert report[1] == "phase\tcalls\twall\tcpu\tself_wall\tself_cpu\tpeak_bytes"
+    assert report[3].startswith("outer/inner\t2\t")
+    with pytest.raises(ValueError) as err:
+        profiler.report("xml")
+    assert "Profile reports can be 'json' or 'tsv'" in str(err)
+
+    tmp_dir = br.TempDir()
+    profiler.write(os.path.join(tmp_dir.path, "profile.tsv"))
+    with open(os.path.join(tmp_dir.path, "profile.tsv"), "r") as ifile:
+        assert ifile.read().startswith("# memory: trace\nphase\t")
+    profiler.write(os.path.join(tmp_dir.path, "profile.json"))
+    with open(os.path.join(tmp_dir.path, "profile.json"), "r") as ifile:
+        assert json.load(ifile)["phases"][0]["phase"] == "outer"
+
+    with br.Profiler() as profiler:  # Process high-water mark by default
+        inner()
+    if br.max_rss() is not None:
+        assert profiler.phases["inner"]["peak_bytes"] >= 10 ** 6
+
+    br.enable_profiler(memory=None)
+    with br.profile_phase("outer"):
+        inner()
+    assert br.PROFILER.phases["outer/inner"]["peak_bytes"] is None
+    br.disable_profiler()
+    assert br.PROFILER is None
+
+    with pytest.raises(ValueError) as err:
+        br.Profiler(memory="foo")
+    assert "Profiler memory mode must be" in str(err)
+
+    # tracemalloc.reset_peak() doesn't exist before Python 3.9
+    with br.NullContext() as nothing:
+        assert nothing is None
+    monkeypatch.delattr(br.tracemalloc, "reset_peak", raising=False)
+    assert not br.reset_traced_peak()
+    with br.Profiler(memory="trace") as profiler:
+        with br.profile_phase("outer"):
+            inner()
+    assert profiler.phases["outer/inner"]["peak_bytes"] >= 10 ** 6
+
+
+# ######################################  Memory  ###################################### #
+def test_memory_tracker(monkeypatch):
+    monkeypatch.setattr(br, "MEMORY_TRACKER", None)
+    with br.MemoryTracker() as tracker:
+        assert br.MEMORY_TRACKER is tracker
+        big = "x" * 10 ** 6
+        assert br.peak_memory() >= 10 ** 6
+        del big
+    assert br.MEMORY_TRACKER is None
+    assert 10 ** 6 <= tracker.peak < 2 * 10 ** 6
+
+    result, peak = br.trace_memory(lambda length: len("x" * length), 10 ** 5)
+    assert result == 10 ** 5
+    assert 10 ** 5 <= peak < 2 * 10 ** 5
+
+    # Nested trackers reset the tracemalloc peak, if this version of Python can
+    monkeypatch.delattr(br.tracemalloc, "reset_peak", raising=False)
+    with br.MemoryTracker() as outer_tracker:
+        with br.MemoryTracker() as tracker:
+            big = "x" * 10 ** 6
+            del big
+    assert 10 ** 6 <= tracker.peak <= outer_tracker.peak
+
+    monkeypatch.setattr(br, "max_rss", lambda: 12345)
+    assert br.peak_memory() == 12345
+
+
+def test_estimate_memory():
+    alignbuddy = Alb.AlignBuddy(os.path.join(RESOURCE_PATH, "Mnemiopsis_cds_aln.gb"))
+    estimate = br.estimate_memory(alignbuddy)
+    assert estimate == br.estimate_memory(alignbuddy.records())
+    assert estimate == alignbuddy.memory_footprint
+
+    record = alignbuddy.records()[0]
+    expected = br.MEMORY_MODEL["record"] + len(record) + len(record.id) + len(record.name) + len(record.description)
+    expected += len(record.features) * br.MEMORY_MODEL["feature"]
+    expected += sum([len(feature.qualifiers) for feature in record.features]) * br.MEMORY_MODEL["qualifier"]
+    expected += len(record.annotations) * br.MEMORY_MODEL["annotation"]
+    assert br.estimate_memory(record) == expected
+
+    with pytest.raises(TypeError) as err:
+        br.estimate_memory("foo")
+    assert "Unable to estimate the memory used by a str object" in str(err)
+
+
 # ######################################  TempFile  ###################################### #
 def test_tempfile():
     test_file = br.TempFile()
@@ -360,6 +551,184 @@ def test_tempfile():
     assert open("{0}/temp".format(TEMP_DIR.path), 'r').read() == "hello world"
 
 
+# ######################################  TrimmedHandle  ###################################### #
+def test_trimmedhandle():
+    output = io.StringIO()
+    handle = br.TrimmedHandle(output)
+    handle.write("hello\n\n")
+    handle.write("  \n")
+    assert output.getvalue() == "hello"
+    handle.write("world \n\n")
+    handle.close()
+    assert output.getvalue() == "hello\n\n  \nworld\n"
+
+    output = io.StringIO()
+    handle = br.TrimmedHandle(output, end="\n\n")
+    handle.write("foo\n")
+    handle.close()
+    assert output.getvalue() == "foo\n\n"
+
+
+# ######################################  Copy records  ###################################### #
+def test_copy_records(sb_resources):
+    records = list(SeqIO.parse(sb_resources.get_one("d g", mode="paths"), "gb"))
+    original_features = [rec.features for rec in records]
+    new_records = br.copy_records(records)
+    assert type(records[0]) == SeqRecord
+    assert type(new_records[0]) == SeqRecord
+    assert [rec.id for rec in records] == [rec.id for rec in new_records]
+    assert [str(rec.seq) for rec in records] == [str(rec.seq) for rec in new_records]
+    assert new_records[0].seq is not records[0].seq
+
+    # The originals are left alone
+    assert [rec.features for rec in records] == original_features
+    assert records[0].features is original_features[0]
+    assert new_records[0].features is not records[0].features
+
+    # Copy a copy
+    third_records = br.copy_records(new_records)
+    third_records[1].annotations["foo"] = "bar"
+    assert "foo" not in new_records[1].annotations
+    assert "foo" not in records[1].annotations
+
+    new_records[2].letter_annotations = {}
+    new_records[2].dbxrefs.append("foo")
+    assert "foo" not in records[2].dbxrefs
+
+    tester = pickle.loads(pickle.dumps(new_records[4]))
+    assert len(tester.features) == len(records[4].features)
+
+
+# ######################################  Compression  ###################################### #
+def test_compression_type(sb_resources):
+    tmp_dir = br.TempDir()
+    _path = sb_resources.get_one("d f", mode="paths")
+    assert br.compression_type(_path) is None
+    assert br.compression_type("%s/does_not_exist" % tmp_dir.path) is None
+
+    with open(_path, "rb") as ifile:
+        content = ifile.read()
+    with gzip.open("%s/seqs.fa.gz" % tmp_dir.path, "wb") as ofile:
+        ofile.write(content)
+    assert br.compression_type("%s/seqs.fa.gz" % tmp_dir.path) == "gzip"
+    assert br.compression_type(lzma.compress(content)) == "xz"
+
+    with br.open_text("%s/seqs.fa.bgz" % tmp_dir.path, "w", "bgzf") as ofile:
+        ofile.write(content.decode("utf-8"))
+    assert br.compression_type("%s/seqs.fa.bgz" % tmp_dir.path) == "bgzf"
+
+
+def test_split_compression():
+    assert br.split_compression("fasta.gz") == ("fasta", "bgzf")
+    assert br.split_compression("Genbank.XZ") == ("Genbank", "xz")
+    assert br.split_compression("/path/to/seqs.fa.bgz") == ("/path/to/seqs.fa", "bgzf")
+    assert br.split_compression("fasta") == ("fasta", None)
+    assert br.split_compression(None) == (None, None)
+
+
+def test_open_text(sb_resources):
+    tmp_dir = br.TempDir()
+    with open(sb_resources.get_one("d f", mode="paths"), "r", encoding="utf-8") as ifile:
+        content = ifile.read()
+
+    for compression in [None] + br.COMPRESSION_TYPES:
+        _path = "%s/seqs_%s" % (tmp_dir.path, compression)
+        with br.open_text(_path, "w", compression) as ofile:
+            ofile.write(content)
+        assert br.compression_type(_path) == compression
+        with br.open_text(_path) as ifile:
+            assert ifile.read() == content
+
+    # A named pipe can only be read once, so the magic bytes must come from the same handle as the contents
+    fifo = "%s/ids_fifo" % tmp_dir.path
+    os.mkfifo(fifo)
+
+    def write_fifo():
+        with open(fifo, "wb") as ofile:
+            ofile.write(gzip.compress(content.encode()))
+
+    writer = threading.Thread(target=write_fifo)
+    writer.start()
+    with br.open_text(fifo) as ifile:
+        assert not ifile.seekable()
+        assert ifile.read() == content
+    writer.join()
+
+
+def test_atomic_write():
+    tmp_dir = br.TempDir()
+    _path = os.path.join(tmp_dir.path, "seqs.fa")
+    with open(_path, "w", encoding="utf-8") as ofile:
+        ofile.write("original")
+    os.chmod(_path, 0o640)
+    os.symlink(_path, os.path.join(tmp_dir.path, "link.fa"))
+
+    # A failure part way through leaves the original file, and no temporary files, behind
+    with pytest.raises(RuntimeError):
+        with br.atomic_write(_path) as ofile:
+            ofile.write("partial")
+            raise RuntimeError("Job killed")
+    with open(_path, "r", encoding="utf-8") as ifile:
+        assert ifile.read() == "original"
+    assert sorted(os.listdir(tmp_dir.path)) == ["link.fa", "seqs.fa"]
+
+    with br.atomic_write(os.path.join(tmp_dir.path, "link.fa"), "gzip") as ofile:
+        ofile.write("replaced")
+    assert os.path.islink(os.path.join(tmp_dir.path, "link.fa"))
+    assert br.compression_type(_path) == "gzip"
+    with br.open_text(_path) as ifile:
+        assert ifile.read() == "replaced"
+    assert os.stat(_path).st_mode & 0o777 == 0o640
+    assert sorted(os.listdir(tmp_dir.path)) == ["link.fa", "seqs.fa"]
+
+
+def test_compressed_handle():
+    output = io.BytesIO()
+    handle = br.CompressedHandle(output, "gzip")
+    handle.write("hello world\n")
+    handle.close()
+    assert not output.closed
+    assert gzip.decompress(output.getvalue()) == b"hello world\n"
+
+    output = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+    output.write("")
+    with br.compress_handle(output, "bgzf") as handle:
+        handle.write("hello world\n")
+    assert not output.closed
+    assert gzip.decompress(output.buffer.getvalue()) == b"hello world\n"
+
+    with pytest.raises(ValueError) as err:
+        br.CompressedHandle(io.BytesIO(), "zip")
+    assert "Unknown compression type 'zip'" in str(err)
+
+
+def test_decompress_handle():
+    handle = io.TextIOWrapper(io.BufferedReader(io.BytesIO(lzma.compress(b"foo bar\n"))), encoding="utf-8")
+    assert br.decompress_handle(handle).read() == "foo bar\n"
+
+    # Decompressed as it's read, and only seekable if the underlying stream is
+    raw = io.BytesIO(gzip.compress(b">foo\nATGC\n" * 1000))
+    handle = br.decompress_handle(io.TextIOWrapper(io.BufferedReader(raw), encoding="utf-8"))
+    assert type(handle) == io.TextIOWrapper
+    assert handle.readline() == ">foo\n"
+    assert handle.seekable()
+    handle.seek(0)
+    assert handle.read() == ">foo\nATGC\n" * 1000
+
+    read_fd, write_fd = os.pipe()
+    with open(write_fd, "wb") as ofile:
+        ofile.write(lzma.compress(b"foo bar\n"))
+    with open(read_fd, "r", encoding="utf-8") as ifile:
+        handle = br.decompress_handle(ifile)
+        assert not handle.seekable()
+        assert handle.read() == "foo bar\n"
+
+    handle = io.TextIOWrapper(io.BufferedReader(io.BytesIO(b"foo bar\n")), encoding="utf-8")
+    assert br.decompress_handle(handle) is handle
+    handle = io.StringIO("foo bar\n")
+    assert br.decompress_handle(handle) is handle
+
+
 def test_safetyvalve():
     valve = br.SafetyValve()
     with pytest.raises(RuntimeError):
@@ -563,7 +932,7 @@ def test_usage(monkeypatch):
     usage.increment("seqbuddy", "1.3", "usage_test", "10MB")
     usage.increment("seqbuddy", "1.3", "other", "15MB")
     usage.increment("seqbuddy", "1.3", "usage_test", "3MB")
-    usage.increment("seqbuddy", "1.4", "usage_test", "5MB")
+    usage.increment("seqbuddy", "1.4", "usage_test", "5MB", 2 ** 20)
 
     usage.save(send_report=False)
 
@@ -572,6 +941,7 @@ def test_usage(monkeypatch):
         assert "\"seqbuddy\": " in contents
         assert "\"1.4\": " in contents
         assert "\"sizes\": [\"5MB\"]" in contents
+        assert "\"peak_memory\": [1048576]" in contents
         assert "\"usage_test\": 1" in contents
         assert "\"1.3\": " in contents
         assert "\"other\": 1" in contents
@@ -621,6 +991,13 @@ def test_version():
                              "Contributors:BudDSuitebuddysuiteSweetWatersweetwater"
 
 
+def test_resource_filename():
+    assert br.resource_filename("json", "foo%sbar" % os.path.sep) == \
+        os.path.join(os.path.dirname(os.path.dirname(json.__file__)), "foo", "bar")
+    with pytest.raises(ImportError):
+        br.resource_filename("not_a_real_buddysuite_package", "foo")
+
+
 def test_config_values(monkeypatch):
     fake_config = br.TempFile()
     fake_config.write("[DEFAULT]\nuser_hash = ABCDEFG\ndiagnostics = True\nemail = buddysuite@mockmail.com"
@@ -646,7 +1023,7 @@ def test_config_values(monkeypatch):
     assert options["email"] == "buddysuite@nih.gov"
 
     def mock_distributionerror(*args, **kwargs):
-        raise DistributionNotFound(args, kwargs)
+        raise ImportError(args, kwargs)
 
     monkeypatch.setattr(br, "resource_filename", mock_distributionerror)
     options = br.config_values()
@@ -792,6 +1169,25 @@ def test_parse_format():
         br.parse_format("buddy")
 
 
+def test_sniff_format(sb_resources, alb_resources):
+    assert br.sniff_format("") is None
+    assert br.sniff_format("fdakgjfbadnsvaldagf\ndfh\n") is None
+    assert br.sniff_format("\n\n>Seq1\nATGC\n") == ["fasta"]
+    assert br.sniff_format("@Seq1\nATGC\n+\n!!!!\n") == ["fastq"]
+    assert br.sniff_format("ID   Seq1; SV 1; linear;") == ["embl", "swiss"]
+    assert br.sniff_format(" 13 681\nSeq1  ATGC") == ["phylipss", "phylipsr", "phylip", "phylip-relaxed"]
+    assert br.sniff_format("((A,B),C);") == ["newick"]
+    assert br.sniff_format('<?xml version="1.0"?>\n<nex:nexml') == ["nexml"]
+    assert br.sniff_format('<?xml version="1.0"?>\n<foo') is None
+
+    for key, _format in [("d g", "gb"), ("d s", "stockholm"), ("d n", "nexus"), ("d x", "seqxml")]:
+        with open(sb_resources.get_one(key, mode="paths"), "r", encoding="utf-8") as ifile:
+            assert br.sniff_format(ifile.read(4096)) == [_format]
+
+    with open(alb_resources.get_one("o d c", mode="paths"), "r", encoding="utf-8") as ifile:
+        assert br.sniff_format(ifile.read(4096)) == ["clustal"]
+
+
 def test_preparse_flags():
     sys.argv = ['buddy_resources.py', "-v", "-foo", "blahh", "-c", "-ns", "57684", "--blast", "--bar"]
     br.preparse_flags()
@@ -5,7 +5,11 @@ import sys
 import re
 import os
 import shutil
+import subprocess
+import threading
+import pytest
 import BuddySuite as Bs
+import buddy_client as bc
 import buddy_resources as br
 
 
@@ -144,3 +148,77 @@ def test_uninstall(monkeypatch):
     root, dirs, files = next(br.walklevel(tmp_dir.path))
     assert dirs == []
     assert files == ["something_else"]
+
+
+def test_client_imports():
+    # The console entry points have to start quickly, so the client can't pull in BioPython (or anything else heavy)
+    code = "import sys, buddy_client; print(sorted(mod for mod in sys.modules if mod.split('.')[0] in " \
+           "['Bio', 'buddy_resources', 'SeqBuddy', 'numpy']))"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=os.path.dirname(bc.__file__))
+    assert output.decode().strip() == "[]"
+
+
+def test_daemon(capfd, monkeypatch, hf):
+    tmp_dir = br.TempDir()
+    socket_path = "%s/daemon.sock" % tmp_dir.path
+    monkeypatch.setenv("BUDDYSUITE_SOCKET", socket_path)
+    assert not bc.daemon_status()
+    assert bc.forward_to_daemon("SeqBuddy", ["-h"]) is None
+
+    daemon = Bs.BuddyDaemon()
+    assert os.path.isfile("%s.pid" % socket_path)
+    server = threading.Thread(target=daemon.serve_forever)
+    server.start()
+    try:
+        assert bc.daemon_status()
+        seq_file = "%s/Mnemiopsis_cds.fa" % hf.resource_path
+        assert bc.forward_to_daemon("SeqBuddy", [seq_file, "-ns"]) == 0
+        out, err = capfd.readouterr()
+        assert out == "13\n"
+
+        monkeypatch.setattr(sys, "stdin", open(seq_file, "r"))
+        bc.forward_to_daemon("SeqBuddy", ["-ns"])
+        out, err = capfd.readouterr()
+        assert out == "13\n"
+
+        bc.forward_to_daemon("SeqBuddy", [seq_file, "-pl", "foo"])
+        out, err = capfd.readouterr()
+        assert "Unrecognized pipeline argument(s): --foo" in err
+
+        # Only the variables BuddySuite reads are forwarded to the worker
+        monkeypatch.setenv("SECRET_TOKEN", "foo")
+        forwarded = {}
+        real_dumps = bc.json.dumps
+        monkeypatch.setattr(bc.json, "dumps", lambda header: forwarded.update(header["env"]) or real_dumps(header))
+        assert bc.forward_to_daemon("SeqBuddy", [seq_file, "-ns"]) == 0
+        assert "SECRET_TOKEN" not in forwarded and forwarded["PATH"] == os.environ["PATH"]
+        capfd.readouterr()
+
+        # The parse cache is set up for each call from the client's environment, not the daemon's
+        cache_dir = br.TempDir()
+        monkeypatch.setenv("BUDDYSUITE_CACHE_DIR", cache_dir.path)
+        assert bc.forward_to_daemon("SeqBuddy", [seq_file, "-ns"]) == 0
+        assert [_file for _file in os.listdir(cache_dir.path) if _file.endswith(".pkl")]
+        monkeypatch.delenv("BUDDYSUITE_CACHE_DIR")
+        capfd.readouterr()
+
+        # Sockets in a directory other users can get into are not trusted
+        os.chmod(tmp_dir.path, 0o777)
+        assert not bc.daemon_status()
+        assert bc.forward_to_daemon("SeqBuddy", [seq_file, "-ns"]) is None
+        os.chmod(tmp_dir.path, 0o700)
+
+        monkeypatch.setenv("BUDDYSUITE_NO_DAEMON", "1")
+        assert bc.forward_to_daemon("SeqBuddy", [seq_file, "-ns"]) is None
+    finally:
+        daemon.shutdown()
+        server.join()
+        daemon.server_close()
+    assert not os.path.exists(socket_path)
+    assert not Bs.stop_daemon()
+
+    os.chmod(tmp_dir.path, 0o777)
+    with pytest.raises(OSError) as err:
+        Bs.BuddyDaemon()
+    assert "Refusing to create the BuddySuite daemon socket" in str(err)
+    os.chmod(tmp_dir.path, 0o700)
@@ -4,6 +4,7 @@ from collections import OrderedDict
 import datetime
 import random
 import re
+import gzip
 
 import buddy_resources as br
 import DatabaseBuddy as Db
@@ -373,6 +374,15 @@ def test_instantiate_dbbuddy_from_path():
         assert accn in dbbuddy.records
 
 
+def test_instantiate_dbbuddy_from_compressed_path():
+    tmp_dir = br.TempDir()
+    with gzip.open("%s/accns.gz" % tmp_dir.path, "wt", encoding="utf-8") as ofile:
+        ofile.write(", ".join(ACCNS))
+    dbbuddy = Db.DbBuddy("%s/accns.gz" % tmp_dir.path)
+    assert list(dbbuddy.records) == ACCNS
+    assert dbbuddy.search_terms == []
+
+
 def test_instantiate_dbbuddy_from_handle():
     tmp_file = br.TempFile()
     tmp_file.write(", ".join(ACCNS))
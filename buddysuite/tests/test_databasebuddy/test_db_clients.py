@@ -9,6 +9,7 @@ import os
 import buddy_resources as br
 import DatabaseBuddy as Db
 from io import StringIO
+from Bio import Entrez
 
 
 def patched_close(self):  # This suppresses an 'ignored' exception
@@ -419,17 +420,17 @@ def test_ncbiclient_mc_query(hf, monkeypatch):
     dbbuddy = Db.DbBuddy()
     client = Db.NCBIClient(dbbuddy)
 
-    monkeypatch.setattr(Db.Entrez, "esummary", patch_entrez_esummary_taxa)
+    monkeypatch.setattr(Entrez, "esummary", patch_entrez_esummary_taxa)
     client._mc_query("649,734,1009,2302", ["esummary_taxa", "ncbi_prot"])
     assert hf.string2hash(client.results_file.read()) == "fbdbce1b86fc348f1a0d98b2feabfbf3"
     client.results_file.clear()
 
-    monkeypatch.setattr(Db.Entrez, "esummary", patch_entrez_esummary_seq)
+    monkeypatch.setattr(Entrez, "esummary", patch_entrez_esummary_seq)
     client._mc_query("XP_010103297.1,XP_010103298.1,AAY72386.1", ["esummary_seq", "ncbi_prot"])
     assert hf.string2hash(client.results_file.read()) == "6f52b744599ffd860955180e6bfda3f5"
     client.results_file.clear()
 
-    monkeypatch.setattr(Db.Entrez, "efetch", patch_entrez_efetch_seq)
+    monkeypatch.setattr(Entrez, "efetch", patch_entrez_efetch_seq)
     client._mc_query("703125407,703125412,67586143", ["efetch_seq", "ncbi_prot"])
     assert hf.string2hash(client.results_file.read()) == "0154d7bd9d47ca6abac00f25428b9e7e"
 
@@ -443,28 +444,28 @@ def test_ncbiclient_mc_query(hf, monkeypatch):
         client._mc_query("703125407", ["foo", "Bar"])
     assert "Unknown type 'Bar', choose between 'nucleotide' and 'protein" in str(err)
 
-    monkeypatch.setattr(Db.Entrez, "efetch", mock_raise_httperror)
+    monkeypatch.setattr(Entrez, "efetch", mock_raise_httperror)
     client._mc_query("703125407,703125412,67586143", ["efetch_seq", "ncbi_prot"])
     assert "NCBI request failed: 703125407,703125412,67586143\nHTTP Error 101: Fake HTTPError from Mock\n//" \
            in client.http_errors_file.read()
 
     assert "Service unavailable" not in client.http_errors_file.read()
-    monkeypatch.setattr(Db.Entrez, "efetch", mock_raise_503_httperror)
+    monkeypatch.setattr(Entrez, "efetch", mock_raise_503_httperror)
     client._mc_query("703125407", ["efetch_seq", "ncbi_prot"])
     assert "Service unavailable" in client.http_errors_file.read()
 
-    monkeypatch.setattr(Db.Entrez, "efetch", mock_raise_connectionreseterror)
+    monkeypatch.setattr(Entrez, "efetch", mock_raise_connectionreseterror)
     client._mc_query("703125407", ["efetch_seq", "ncbi_prot"])
     assert "NCBI request failed: 703125407\nFake ConnectionResetError from Mock: [Errno 54] Connection reset by peer"\
            in client.http_errors_file.read()
 
     assert "are you connected to the internet?" not in client.http_errors_file.read()
-    monkeypatch.setattr(Db.Entrez, "efetch", mock_raise_urlerror_8)
+    monkeypatch.setattr(Entrez, "efetch", mock_raise_urlerror_8)
     client._mc_query("703125407", ["efetch_seq", "ncbi_prot"])
     assert "are you connected to the internet?" in client.http_errors_file.read()
 
     assert "<urlopen error Fake URLError from Mock>" not in client.http_errors_file.read()
-    monkeypatch.setattr(Db.Entrez, "efetch", mock_raise_urlerror)
+    monkeypatch.setattr(Entrez, "efetch", mock_raise_urlerror)
     client._mc_query("703125407", ["efetch_seq", "ncbi_prot"])
     assert "<urlopen error Fake URLError from Mock>" in client.http_errors_file.read()
 
@@ -487,7 +488,7 @@ def test_ncbiclient_search_ncbi(hf, monkeypatch, capsys):
                           "r")
         return handle
 
-    monkeypatch.setattr(Db.Entrez, "esearch", patch_entrez_esearch)
+    monkeypatch.setattr(Entrez, "esearch", patch_entrez_esearch)
     monkeypatch.setattr(Db.NCBIClient, "fetch_summaries", lambda _: True)
     monkeypatch.setattr(Db, "sleep", lambda _: True)
     dbbuddy = Db.DbBuddy("XP_012618499.1")
@@ -541,7 +541,7 @@ def test_show_unique_unrooted(monkeypatch, pb_odd_resources, hf):
     Pb.show_unique(tester)
     assert hf.buddy2hash(tester) == "2bba16e2c77102ba150adecc352407a9"
 
-    monkeypatch.setattr(Pb.ete3.TreeNode, 'robinson_foulds', mock_treeerror)
+    monkeypatch.setattr(ete3.TreeNode, 'robinson_foulds', mock_treeerror)
     with pytest.raises(TreeError):
         Pb.show_unique(tester)
 
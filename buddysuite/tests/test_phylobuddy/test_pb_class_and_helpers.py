@@ -3,6 +3,8 @@
 """ tests basic functionality of PhyloBuddy class """
 import pytest
 import os
+import io
+import lzma
 
 from PhyloBuddy import PhyloBuddy, _convert_to_ete, _guess_format
 import buddy_resources as br
@@ -49,6 +51,17 @@ def test_instantiate_phylobuddy_from_list(pb_resources):
         assert type(PhyloBuddy(tester.trees)) == PhyloBuddy
 
 
+def test_memory_footprint(monkeypatch, pb_resources):
+    phylobuddy = pb_resources.get_one("m k")
+    num_nodes = sum([len(tree.nodes()) for tree in phylobuddy.trees])
+
+    def mock_str(*args):
+        raise AssertionError("Trees should not be serialized to estimate their size")
+
+    monkeypatch.setattr(PhyloBuddy, "__str__", mock_str)
+    assert phylobuddy.memory_footprint == num_nodes * br.MEMORY_MODEL["tree_node"]
+
+
 def test_empty_file(pb_odd_resources):
     with open(pb_odd_resources['blank'], "r") as ifile:
         with pytest.raises(SystemExit):
@@ -122,6 +135,22 @@ def test_write1(key, next_hash, pb_resources, hf):
     assert hf.string2hash(out) == next_hash
 
 
+def test_compressed_io(pb_resources, hf):
+    temp_dir = br.TempDir()
+    tester = pb_resources.get_one("m k")
+    tester.write("%s/trees.nex.xz" % temp_dir.path)
+    assert br.compression_type("%s/trees.nex.xz" % temp_dir.path) == "xz"
+    assert hf.string2hash(str(PhyloBuddy("%s/trees.nex.xz" % temp_dir.path))) == hf.string2hash(str(tester))
+
+    handle = io.BytesIO()
+    tester.write(handle, compression="xz")
+    assert lzma.decompress(handle.getvalue()).decode("utf-8") == str(tester)
+
+    handle = io.StringIO()
+    tester.write(handle)
+    assert handle.getvalue() == str(tester)
+
+
 def test_convert_to_ete(monkeypatch, pb_resources):
     if os.name == "nt":
         return
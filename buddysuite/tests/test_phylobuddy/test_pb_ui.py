@@ -494,13 +494,14 @@ def test_exit(monkeypatch, capsys, pb_resources):
             return True
 
     monkeypatch.setattr(br, "Usage", MockUsage)
+    monkeypatch.setattr(br, "peak_memory", lambda: 1048576)
     test_in_args = deepcopy(in_args)
     test_in_args.list_ids = [True]
 
     with pytest.raises(SystemExit):
         Pb.command_line_ui(test_in_args, pb_resources.get_one("m k"))
     out, err = capsys.readouterr()
-    assert "('PhyloBuddy', '%s', 'list_ids', 2412)" % Pb.VERSION.short() in out
+    assert "('PhyloBuddy', '%s', 'list_ids', 289900, 1048576)" % Pb.VERSION.short() in out
 
 
 def test_error(monkeypatch, capsys, pb_resources, pb_odd_resources):
@@ -560,6 +560,30 @@ def test_count_codons_dna_badchar(sb_resources, hf):
     assert hf.string2hash(str(tester)) == '9aba116675fe0e9eaaf43e5c6e0ba99d'
 
 
+def test_count_codons_tables_and_aggregate(capsys):
+    tester = Sb.SeqBuddy(">seq1\nATGAGATGA-TAA\n>seq2\natgTGAaga\n", in_format="fasta")
+    counts = Sb.count_codons(tester)[1]
+    assert counts["seq1"] == OrderedDict([("AGA", ["R", 1, 25.0]), ("ATG", ["M", 1, 25.0]), ("TAA", ["*", 1, 25.0]),
+                                          ("TGA", ["*", 1, 25.0])])
+
+    counts = Sb.count_codons(tester, table=2)[1]
+    assert counts["seq1"]["AGA"] == ["*", 1, 25.0] and counts["seq1"]["TGA"] == ["W", 1, 25.0]
+    assert Sb.count_codons(tester, table="vertebrate mitochondrial")[1] == counts
+
+    counts = Sb.count_codons(tester, aggregate=True)[1]
+    assert list(counts) == ["aggregate"]
+    assert counts["aggregate"]["AGA"] == ["R", 2, 28.571]
+    assert tester.records[1].buddy_data["Codon_frequency"]["TGA"] == ["*", 1, 33.333]
+
+    Sb.count_codons(Sb.SeqBuddy(">seq1\nATGPPPPPPATG\n", in_format="fasta", alpha="dna"))
+    out, err = capsys.readouterr()
+    assert err == "Warning: Codon 'PPP' is invalid. Codon will be skipped.\n"
+
+    with pytest.raises(ValueError) as err:
+        Sb.count_codons(tester, table=7)
+    assert "Unknown genetic code '7'" in str(err)
+
+
 def test_count_codons_pep_exception(sb_resources):
     tester = sb_resources.get_one("p f")
     with pytest.raises(TypeError):
@@ -622,6 +646,19 @@ def test_count_residues_prot(sb_resources):
     assert res_count["% Hydrophobic"] == 55.4
 
 
+def test_count_residues_aggregate():
+    tester = Sb.SeqBuddy(">seq1\nMKRX\n>seq2\nmdde\n", in_format="fasta")
+    Sb.count_residues(tester, aggregate=True)
+    assert tester.records[0].buddy_data["res_count"]["K"] == [1, 0.25]
+    assert tester.records[1].buddy_data["res_count"]["% Negative"] == 75.0
+    assert tester.res_count["M"] == [2, 0.25]
+    assert tester.res_count["D"] == [2, 0.25]
+    assert tester.res_count["% Ambiguous"] == 12.5
+    assert tester.res_count["% Positive"] == 25.0
+    assert tester.res_count["% Negative"] == 37.5
+    assert tester.res_count["W"] == [0, 0]
+
+
 # ######################  '-dgn' '--degenerate_sequence'################### #
 def test_degenerate_sequence_without_arguments(sb_resources, hf):
     tester = sb_resources.get_one("f d")
@@ -720,6 +757,22 @@ def test_delete_repeats(sb_odd_resources):
     assert len(tester.repeat_seqs) == 0
 
 
+def test_delete_repeats_scope():
+    tester = Sb.SeqBuddy(">A|1\nATGC\n>B.2\nATGC\n>C\nGGGG\n>A|1\nTTTT\n>C\nCCCC\n", in_format="fasta")
+    Sb.delete_repeats(tester, scope="ids")
+    assert [(rec.id, str(rec.seq)) for rec in tester.records] == [("B.2", "ATGC"), ("A|1", "ATGC"), ("C", "GGGG")]
+
+    tester = Sb.SeqBuddy(">A|1\nATGC\n>B.2\nATGC\n>C\nGGGG\n>C\nGGGG\n", in_format="fasta")
+    Sb.delete_repeats(tester, scope="seqs")
+    assert [rec.id for rec in tester.records] == ["A|1", "C"]
+    assert list(tester.unique_seqs) == ["A|1", "C"]
+
+    # Records that share both an ID and a sequence are deleted too
+    tester = Sb.SeqBuddy(">a\nATGC\n>a\nATGC\n>b\nATGC\n>c\nGGGG\n", in_format="fasta")
+    Sb.delete_repeats(tester, scope="seqs")
+    assert [rec.id for rec in tester.records] == ["a", "c"]
+
+
 # ######################  '-ds', '--delete_small' ###################### #
 def test_delete_small(sb_resources, hf):
     tester = sb_resources.get_one("d f")
@@ -888,6 +941,15 @@ def test_extract_regions_fastq(sb_resources, hf):
     assert hf.buddy2hash(tester) == "4258dfc66a07e849ac9c396aa2763c71", print(tester)
 
 
+@pytest.mark.parametrize("key", ["d f", "d g", "d q"])
+def test_extract_regions_index(key, sb_resources, hf):
+    temp_dir = br.TempDir()
+    tester = Sb.SeqIndex(shutil.copy(sb_resources.get_one(key, mode="paths"), temp_dir.path))
+    for positions in ["2,5,9,-5", "10:45,60:75,90:-5", "1:3,1/20,-1"]:
+        assert hf.buddy2hash(Sb.extract_regions(tester, positions)) == \
+            hf.buddy2hash(Sb.extract_regions(sb_resources.get_one(key), positions))
+
+
 def test_extract_regions_edges(sb_resources):
     with pytest.raises(ValueError) as err:
         Sb.extract_regions(sb_resources.get_one("p g"), "foo")
@@ -898,7 +960,32 @@ def test_extract_regions_edges(sb_resources):
 def test_find_cpg(sb_resources, hf):
     tester = sb_resources.get_one("d g")
     tester = Sb.find_cpg(tester)
-    assert hf.buddy2hash(tester) == "9499f524da0c35a60502031e94864928"
+    assert hf.buddy2hash(tester) == "e060ea0f95e34598857757a526799ec8"
+
+
+def test_find_cpg_params(sb_resources):
+    tester = Sb.SeqBuddy(">seq1\nATATATATATCGCGCGCGCGATATATATAT\n", in_format="fasta")
+    Sb.find_cpg(tester, window=4, score_track=True)
+    assert tester.records[0].buddy_data["cpgs"] == [(10, 20)]
+    assert str(tester.records[0].seq) == "atatatatatCGCGCGCGCGAtatatatat"
+    gc_track, oe_track = tester.records[0].buddy_data["cpg_scores"]
+    assert len(gc_track) == len(oe_track) == 30
+    assert gc_track[0] == 0 and gc_track[15] == 1
+
+    tester = Sb.SeqBuddy(">seq1\nATATATATATCGCGCGCGCGATATATATAT\n", in_format="fasta")
+    Sb.find_cpg(tester, window=4, min_gc=0.9)
+    assert tester.records[0].buddy_data["cpgs"] == [(12, 18)]
+
+    # Pure python fallback gives the same answer as numpy
+    seq = str(sb_resources.get_one("d f").records[0].seq).upper()
+    numpy_islands = Sb._cpg_islands(seq, 200, .5, .6, __import__("numpy"))
+    python_islands = Sb._cpg_islands(seq, 200, .5, .6)
+    assert numpy_islands[0] == python_islands[0] and numpy_islands[0]
+    assert list(numpy_islands[2]) == pytest.approx(python_islands[2])
+
+    with pytest.raises(ValueError) as err:
+        Sb.find_cpg(tester, window=0)
+    assert "The CpG window size must be a positive integer, not '0'" in str(err)
 
 
 # #####################  '-orf', '--find_orf' ###################### ##
@@ -908,7 +995,7 @@ def test_find_orf(sb_resources, hf):
     assert hf.buddy2hash(tester) == "a9b8d1e17474184534f018d022c31c2a"
 
     tester = Sb.find_orfs(sb_resources.get_one("d g"))
-    assert hf.buddy2hash(tester) == "7aee4906f59842b13ba086fbb32e524d"
+    assert hf.buddy2hash(tester) == "4456ff96c288c6d4e35e6fc1f575e48e"
 
     tester.out_format = "fasta"
     assert hf.buddy2hash(tester) == "b831e901d8b6b1ba52bad797bad92d14"
@@ -920,7 +1007,7 @@ def test_find_orf(sb_resources, hf):
     assert hf.buddy2hash(tester) == "d2db9b02485e80323c487c1dd6f1425b"
 
     tester.out_format = "gb"
-    assert hf.buddy2hash(tester) == "2998cb6379a50ddb74deee05075430c0"
+    assert hf.buddy2hash(tester) == "c5e92ea7e5fa27b693a7b89103912012"
 
     tester = Sb.find_orfs(sb_resources.get_one("r f"), include_feature=False)
     tester.out_format = "gb"
@@ -932,6 +1019,28 @@ def test_find_orf(sb_resources, hf):
     assert "Nucleic acid sequence required, not protein." in str(err)
 
 
+def test_find_orf_options():
+    def orfs(seq, **kwargs):
+        tester = Sb.find_orfs(Sb.SeqBuddy(">seq1\n%s\n" % seq, in_format="fasta", alpha="dna"), **kwargs)
+        rec = tester.records[0]
+        features = [(int(feat.location.start), int(feat.location.end), feat.strand) for feat in rec.features]
+        return rec.buddy_data["find_orfs"], features
+
+    # Nested starts belong to the ORF already open in that frame, but ORFs in other frames are kept
+    assert orfs("ATGATGTAA") == ({'+': [(0, 9)], '-': []}, [(0, 9, 1)])
+    assert orfs("ATGAATGCCTAGATAA") == ({'+': [(0, 12), (4, 16)], '-': []}, [(0, 12, 1), (4, 16, 1)])
+    assert orfs("TTACATTTGCCCTAA") == ({'+': [], '-': [(0, 6)]}, [(0, 6, -1)])
+
+    assert orfs("TTACATTTGCCCTAA", alt_starts=True) == ({'+': [(6, 15)], '-': [(0, 6)]}, [(6, 15, 1), (0, 6, -1)])
+    assert orfs("TTACATTTGCCCTAA", alt_starts=True, min_length=7, include_feature=False) == \
+        ({'+': [(6, 15)], '-': []}, [])
+    assert orfs("ATGAGATAA", table=2) == ({'+': [(0, 6)], '-': []}, [(0, 6, 1)])
+
+    with pytest.raises(ValueError) as err:
+        orfs("ATGAGATAA", table="foo")
+    assert "Unknown genetic code 'foo'" in str(err)
+
+
 # #####################  '-fp', '--find_pattern' ###################### ##
 def test_find_pattern(sb_resources, hf):
     tester = Sb.find_pattern(sb_resources.get_one("d g"), "ATGGT")
@@ -964,6 +1073,27 @@ def test_find_repeats(sb_odd_resources):
         assert 'Seq12' in tester.repeat_seqs[key] or 'Seq10A' in tester.repeat_seqs[key]
 
 
+def test_find_repeats_modes():
+    tester = Sb.SeqBuddy(">A\nATGCATGC\n>B\natgcatgc\n>C\nATG-CAT.GC\n>A\nTTTT\n", in_format="fasta")
+    records = list(tester.records)
+    Sb.find_repeats(tester)
+    assert tester.repeat_ids == OrderedDict([("A", [0, 3])])
+    assert not tester.repeat_seqs
+    assert list(tester.unique_seqs) == ["B", "C"]
+    assert tester.records == records and str(tester.records[1].seq) == "atgcatgc"
+
+    Sb.find_repeats(tester, ignore_case=True)
+    assert list(tester.repeat_seqs.values()) == [["A", "B"]]
+    assert list(tester.unique_seqs) == ["B", "C"]
+
+    Sb.find_repeats(tester, ignore_case=True, ignore_gaps=True)
+    assert list(tester.repeat_seqs.values()) == [["C", "B", "A"]]
+    assert not tester.unique_seqs
+
+    Sb.find_repeats(tester, ignore_gaps=True)
+    assert list(tester.repeat_seqs.values()) == [["A", "C"]]
+
+
 # ######################  '-frs', '--find_restriction_sites' ###################### #
 def test_restriction_sites_no_args(sb_resources, hf):
     # No arguments passed in = commercial REs and any number of cut sites
@@ -1273,6 +1403,22 @@ def test_molecular_weight(sb_resources, sb_odd_resources, hf):
     assert "Invalid residue \'J\' in record Mle-Panxα9. \'J\' is not valid a valid character in IUPACAmbiguousDNA()." in str(err)
 
 
+def test_molecular_weight_array(sb_resources):
+    tester = sb_resources.get_one("d g")
+    masses = Sb.molecular_weight_array(tester)
+    assert masses.typecode == "d" and len(masses) == 13
+    assert masses[0] == 371242.6
+    assert Sb.molecular_weight_array(tester, double_stranded=True)[0] == 743477.1
+    assert "mw" not in [feat.type for feat in tester.records[0].features]
+
+    assert list(Sb.molecular_weight_array(Sb.SeqBuddy(">seq1\nMK-*\n>seq2\nWX\n", in_format="fasta", alpha="p"))) == \
+        [277.38, 314.23]
+
+    with pytest.raises(TypeError) as err:
+        Sb.molecular_weight_array(sb_resources.get_one("p g"), double_stranded=True)
+    assert "Double stranded masses can only be calculated for DNA sequences." in str(err)
+
+
 # ######################  '-ns', '--num_seqs' ###################### #
 def test_num_seqs(sb_resources):
     for tester in sb_resources.get_list("d p f g pr n s"):
@@ -1508,6 +1654,14 @@ def test_pull_random_recs(key, next_hash, sb_resources, hf):
     assert hf.buddy2hash(tester) == next_hash
 
 
+@pytest.mark.parametrize("key", ["d f", "d g", "d q"])
+def test_pull_random_recs_index(key, sb_resources, hf):
+    temp_dir = br.TempDir()
+    tester = Sb.SeqIndex(shutil.copy(sb_resources.get_one(key, mode="paths"), temp_dir.path))
+    tester = Sb.pull_random_recs(tester, count=3, r_seed=12345)
+    assert hf.buddy2hash(tester) == hf.buddy2hash(Sb.pull_random_recs(sb_resources.get_one(key), 3, 12345))
+
+
 # #####################  '-pre', '--pull_record_ends' ###################### ##
 def test_pull_record_ends(sb_resources, hf):
     tester = Sb.pull_record_ends(sb_resources.get_one("d g"), 10)
@@ -1536,6 +1690,30 @@ def test_pull_recs(key, next_hash, sb_resources, hf):
     tester = Sb.pull_recs(sb_resources.get_one(key), 'α2')
     assert hf.buddy2hash(tester) == next_hash
 
+@pytest.mark.parametrize("key", ["d f", "d g", "d q"])
+def test_pull_recs_index(key, sb_resources, hf):
+    temp_dir = br.TempDir()
+    tester = Sb.SeqIndex(shutil.copy(sb_resources.get_one(key, mode="paths"), temp_dir.path))
+    assert hf.buddy2hash(Sb.pull_recs(tester, 'α2')) == hf.buddy2hash(Sb.pull_recs(sb_resources.get_one(key), 'α2'))
+    assert hf.buddy2hash(Sb.pull_recs(tester, ['ML25993a', 'α9'], description=True)) == \
+        hf.buddy2hash(Sb.pull_recs(sb_resources.get_one(key), ['ML25993a', 'α9'], description=True))
+    assert hf.buddy2hash(Sb.pull_recs(tester, 'Mnemiopsis', description=True)) == \
+        hf.buddy2hash(Sb.pull_recs(sb_resources.get_one(key), 'Mnemiopsis', description=True))
+    assert hf.buddy2hash(Sb.delete_records(tester, 'α[1-9]$')) == \
+        hf.buddy2hash(Sb.delete_records(sb_resources.get_one(key), 'α[1-9]$'))
+
+
+def test_pull_recs_exact(sb_resources, hf):
+    ids = ["Mle-Panxα3", "Mle-Panxα1", "Mle-Panxα1A", "Mle-Panx"]
+    tester = Sb.pull_recs(sb_resources.get_one("d f"), ids, exact=True)
+    assert [rec.id for rec in tester.records] == ["Mle-Panxα1", "Mle-Panxα3"]
+    assert hf.buddy2hash(tester) == hf.buddy2hash(Sb.pull_recs(sb_resources.get_one("d f"), "^Mle-Panxα[13]$"))
+
+    temp_dir = br.TempDir()
+    index = Sb.SeqIndex(shutil.copy(sb_resources.get_one("d f", mode="paths"), temp_dir.path))
+    assert hf.buddy2hash(Sb.pull_recs(index, ids, exact=True)) == hf.buddy2hash(tester)
+
+
 # ######################  '-pr', '--pull_records_with_feature' ###################### #
 hashes = [('p g', '83d15851d489e89761c8faa31e5263f2'), ('d g', '36757409966ede91ab19deb56045d584')]
 
@@ -1736,14 +1914,48 @@ def test_translate6frames(sb_resources, hf):
     assert hf.buddy2hash(tester) == '0b5daa810e1589c3973e1436c40baf08'
 
 
+def test_translate6frames_single_pass(sb_resources):
+    seq = str(sb_resources.get_one("d f").records[0].seq)
+    frames = Sb._translate_frames(seq, 2)
+    assert frames == Sb._translate_frames(seq, 2, numpy=__import__("numpy"))
+
+    tester = Sb.translate6frames(sb_resources.get_one("d f"), table=2)
+    suffixes = ["f1", "f2", "f3", "rf1", "rf2", "rf3"]
+    assert [rec.id for rec in tester.records[:6]] == ["Mle-Panxα9_%s" % suffix for suffix in suffixes]
+    assert [str(rec.seq) for rec in tester.records[:6]] == frames
+    frame2 = Sb.translate_cds(Sb.select_frame(sb_resources.get_one("d f"), 2), table=2)
+    assert frames[1] == str(frame2.records[0].seq)
+    rframe1 = Sb.translate_cds(Sb.reverse_complement(sb_resources.get_one("d f")), table=2)
+    assert frames[3] == str(rframe1.records[0].seq)
+
+
+def test_translate6frames_features(sb_resources, hf):
+    # Features are mapped onto each frame, and records shifted by select_frame() are handled one at a time
+    seqbuddy = sb_resources.get_one("d g")
+    seqbuddy.records = seqbuddy.records[:4]
+    Sb.select_frame(Sb.SeqBuddy(seqbuddy.records[1:2]), 2)
+    original = hf.buddy2hash(seqbuddy)
+    tester = Sb.translate6frames(seqbuddy)
+    assert hf.buddy2hash(seqbuddy) == original
+    assert len(tester) == 24
+
+    rframe2 = Sb.select_frame(Sb.reverse_complement(Sb.make_copy(seqbuddy)), 2, add_metadata=False)
+    rframe2 = Sb.translate_cds(rframe2, quiet=True)
+    for indx in [0, 1, 3]:
+        assert str(tester.records[indx * 6 + 4].seq) == str(rframe2.records[indx].seq)
+        assert [str(feat.location) for feat in tester.records[indx * 6 + 4].features] == \
+            [str(feat.location) for feat in rframe2.records[indx].features]
+    assert tester.records[0].features
+
+
 def test_translate6frames_pep_exception(sb_resources):
     with pytest.raises(TypeError):
         Sb.translate6frames(sb_resources.get_one("p f"))
 
 # ######################  '-tr', '--translate' ###################### #
-hashes = [('d f', '06893e14839dc0448e6f522c1b8f8957'), ('d g', 'e8840e22096e933ce10dbd91036f3fa5'),
-          ('d n', 'f3339e0193c10427f017dd8f6bd81d7e'), ('r f', '06893e14839dc0448e6f522c1b8f8957'),
-          ('r n', 'f3339e0193c10427f017dd8f6bd81d7e')]
+hashes = [('d f', '3de7b7be2f2b92cf166b758625a1f316'), ('d g', 'e8840e22096e933ce10dbd91036f3fa5'),
+          ('d n', '9e6634c1b8adfba6b64d30caf94103c5'), ('r f', '3de7b7be2f2b92cf166b758625a1f316'),
+          ('r n', '9e6634c1b8adfba6b64d30caf94103c5')]
 
 
 @pytest.mark.parametrize("key,next_hash", hashes)
@@ -1755,11 +1967,28 @@ def test_translate(key, next_hash, sb_resources, hf):
 def test_translate_ambig(sb_odd_resources, hf):
     tester = Sb.SeqBuddy(sb_odd_resources['ambiguous_dna'])
     tester = Sb.translate_cds(tester)
-    assert hf.buddy2hash(tester) == '648ccc7c3400882be5bf6e8d9781f74e'
+    assert hf.buddy2hash(tester) == '093e4d8ad756f4e9ffb3aef3f3364000'
 
     tester = Sb.SeqBuddy(sb_odd_resources['ambiguous_rna'])
     tester = Sb.translate_cds(tester)
-    assert hf.buddy2hash(tester) == '648ccc7c3400882be5bf6e8d9781f74e'
+    assert hf.buddy2hash(tester) == '093e4d8ad756f4e9ffb3aef3f3364000'
+
+
+def test_translate_genetic_codes():
+    tester = Sb.SeqBuddy(">seq1\nATGAGATGATAA\n", in_format="fasta", alpha="dna")
+    assert str(Sb.translate_cds(Sb.make_copy(tester)).records[0].seq) == "MR**"
+    assert str(Sb.translate_cds(Sb.make_copy(tester), table=2).records[0].seq) == "M*W*"
+    assert str(Sb.translate_cds(Sb.make_copy(tester), table="vertebrate mitochondrial").records[0].seq) == "M*W*"
+
+    # Ambiguous codons resolve when every codon they could stand for agrees
+    tester = Sb.SeqBuddy(">seq1\nGCNTARATHNNNMGRRAY\n", in_format="fasta", alpha="dna")
+    assert str(Sb.translate_cds(tester).records[0].seq) == "A*IXRX"
+
+    tester = Sb.SeqBuddy(">seq1\nATG\n", in_format="fasta", alpha="dna")
+    with pytest.raises(ValueError) as err:
+        Sb.translate_cds(tester, table=99)
+    assert "Unknown genetic code '99'" in str(err)
+    assert str(tester.records[0].seq) == "ATG"
 
 
 def test_translate_edges_and_exceptions(capsys, sb_resources, hf):
@@ -3,8 +3,15 @@
 """ tests basic functionality of SeqBuddy class """
 import pytest
 from Bio.Alphabet import IUPAC
+from Bio import SeqIO
 from collections import OrderedDict
+from io import StringIO
 import os
+import sys
+import shutil
+from subprocess import check_output
+import gzip
+import lzma
 import buddy_resources as br
 import SeqBuddy as Sb
 
@@ -36,6 +43,27 @@ def test_instantiate_seqbuddy_from_seqbuddy(sb_resources, hf):
         assert hf.buddy2hash(input_buddy) == hf.buddy2hash(tester)
 
 
+def test_instantiate_seqbuddy_from_compressed(sb_resources, hf):
+    temp_dir = br.TempDir()
+    for key in ["d f", "p g", "d q"]:
+        _path = sb_resources.get_one(key, mode="paths")
+        plain = Sb.SeqBuddy(_path)
+        with open(_path, "rb") as ifile:
+            content = ifile.read()
+        with gzip.open("%s/seqs.gz" % temp_dir.path, "wb") as ofile:
+            ofile.write(content)
+        with lzma.open("%s/seqs.xz" % temp_dir.path, "wb") as ofile:
+            ofile.write(content)
+
+        for compressed in ["%s/seqs.gz" % temp_dir.path, "%s/seqs.xz" % temp_dir.path]:
+            tester = Sb.SeqBuddy(compressed)
+            assert tester.in_format == plain.in_format
+            assert hf.buddy2hash(tester) == hf.buddy2hash(plain)
+
+            with open(compressed, "r", encoding="utf-8") as ifile:
+                assert hf.buddy2hash(Sb.SeqBuddy(ifile)) == hf.buddy2hash(plain)
+
+
 def test_alpha_arg_dna(sb_resources):
     tester = Sb.SeqBuddy(sb_resources.get_one("d f", mode="paths"), alpha='dna')
     assert tester.alpha is IUPAC.ambiguous_dna
@@ -66,9 +94,14 @@ def test_to_dict(sb_resources, hf):
     tester = str(sb_resources.get_one("o d f").to_dict())
     assert hf.string2hash(tester) == '2311d1712d41c5ec9c23ad107c8a06c3'
 
-    with pytest.raises(RuntimeError):
+    tester = sb_resources.get_one("d f")
+    tester.to_dict()
+    assert not hasattr(tester, "repeat_ids")
+
+    with pytest.raises(RuntimeError) as err:
         tester = Sb.SeqBuddy(">duplicate_id\nATGCTCGTA\n>duplicate_id\nATGCTCGTCGATGCT\n")
         tester.to_dict()
+    assert "There are repeat IDs in self.records\nduplicate_id" in str(err.value)
 
 
 def test_to_string(sb_resources, hf, capsys):
@@ -128,6 +161,26 @@ def test_write(sb_resources, hf):
     with open("%s/sequences.fa" % temp_dir.path, encoding="utf-8") as ifile:
         assert hf.string2hash(ifile.read()) == "25073539df4a982b7f99c72dd280bb8f"
 
+    handle = StringIO()
+    tester.write(handle, out_format="fasta")
+    assert hf.string2hash(handle.getvalue()) == "25073539df4a982b7f99c72dd280bb8f"
+    assert tester.out_format == "gb"
+
+    # Compressed output, selected by file extension or out_format suffix
+    tester.write("%s/sequences.fa.gz" % temp_dir.path, out_format="fasta")
+    assert br.compression_type("%s/sequences.fa.gz" % temp_dir.path) == "bgzf"
+    with gzip.open("%s/sequences.fa.gz" % temp_dir.path, "rt", encoding="utf-8") as ifile:
+        assert hf.string2hash(ifile.read()) == "25073539df4a982b7f99c72dd280bb8f"
+
+    tester.write("%s/sequences" % temp_dir.path, out_format="fasta.xz")
+    assert br.compression_type("%s/sequences" % temp_dir.path) == "xz"
+    with lzma.open("%s/sequences" % temp_dir.path, "rt", encoding="utf-8") as ifile:
+        assert hf.string2hash(ifile.read()) == "25073539df4a982b7f99c72dd280bb8f"
+    assert tester.out_format == "gb"
+
+    tester = Sb.SeqBuddy(sb_resources.get_one("d f", mode="paths"), out_format="genbank.gz")
+    assert tester.out_format == "genbank"
+
 
 def test_print_hashmap(sb_resources, hf):
     tester = sb_resources.get_one("d f")
@@ -193,6 +246,27 @@ def test_guess_alphabet(sb_resources):
     assert not Sb._guess_alphabet(tester)
 
 
+def test_guess_alphabet_sampling(monkeypatch):
+    monkeypatch.setattr(Sb, "ALPHA_SAMPLE_RECORDS", 2)
+    monkeypatch.setattr(Sb, "ALPHA_SAMPLE_SIZE", 40)
+
+    # Only the start of every other record is looked at if the sample is unambiguous
+    tester = Sb.SeqBuddy(">A\n%s\n>B\n%s\n>C\n%s\n" % ("ATGC" * 5 + "LKMP" * 10, "LKMP" * 20, "ATGC" * 5),
+                         in_format="fasta", alpha=IUPAC.protein)
+    assert Sb._guess_alphabet(tester) == IUPAC.ambiguous_dna
+
+    # Samples that land near the threshold fall back to a full scan
+    tester = Sb.SeqBuddy(">A\n%s\n>B\n%s\n" % ("ATGC" * 4 + "LLL" + "A" + "LKMP" * 10, "atgc" * 4 + "atll"),
+                         in_format="fasta", alpha=IUPAC.protein)
+    assert Sb._guess_alphabet(tester) == IUPAC.protein
+    assert Sb._guess_alphabet([]) is None
+
+    assert Sb._alphabet_from_counts({"A": 86, "L": 14}, margin=0.05) is False
+    assert Sb._alphabet_from_counts({"A": 86, "L": 14}) == IUPAC.ambiguous_dna
+    assert Sb._alphabet_from_counts({"a": 5, "u": 1}) == IUPAC.ambiguous_rna
+    assert Sb._alphabet_from_counts({"n": 5, "-": 1}) is None
+
+
 # ######################  'guess_format' ###################### #
 def test_guess_stockholm(hf):
     assert Sb._guess_format("%s%sMnemiopsis_cds.stklm" % (hf.resource_path, os.path.sep)) == "stockholm"
@@ -285,8 +359,191 @@ def test_no__input():
         Sb.SeqBuddy()
 
 
+# ######################  Parse cache ###################### #
+def test_parse_cache(sb_resources, hf, monkeypatch):
+    tmp_dir = br.TempDir()
+    monkeypatch.setattr(br, "PARSE_CACHE", None)
+    cache = br.enable_parse_cache(tmp_dir.path)
+    _path = sb_resources.get_one("d g", mode="paths")
+    tester = Sb.SeqBuddy(_path)
+    assert len(cache.entries()) == 1
+
+    def kaboom(*args, **kwargs):
+        raise AssertionError("Should have been pulled from the cache")
+
+    monkeypatch.setattr(SeqIO, "parse", kaboom)
+    cached = Sb.SeqBuddy(_path)
+    assert hf.buddy2hash(cached) == hf.buddy2hash(tester)
+    assert cached.in_format == tester.in_format
+    assert cached.alpha == tester.alpha
+    assert len(cache.entries()) == 1
+    br.disable_parse_cache()
+
+
 # ######################  'make_copy' ###################### #
 def test_make_copy(sb_resources, hf):
     tester = Sb.SeqBuddy(sb_resources.get_one("d f", mode="paths"))
     tester_copy = Sb.make_copy(tester)
     assert hf.buddy2hash(tester) == hf.buddy2hash(tester_copy)
+
+    # Copies are independent of the original
+    tester = Sb.SeqBuddy(sb_resources.get_one("d g", mode="paths"))
+    tester_copy = Sb.make_copy(tester)
+    original_hash = hf.buddy2hash(tester)
+    assert tester_copy.records[0].seq is not tester.records[0].seq
+    assert str(tester_copy.records[0].seq) == str(tester.records[0].seq)
+    tester_copy.records[0].features[0].type = "foo"
+    tester_copy.records[1].annotations["organism"] = "bar"
+    assert hf.buddy2hash(tester) == original_hash
+    assert tester.records[0].features[0].type != "foo"
+
+    tester.records[2].features = []
+    assert tester_copy.records[2].features
+
+
+# ######################  '_parse_parallel' ###################### #
+def test_parse_parallel(sb_resources, monkeypatch):
+    for key, in_format in [("d f", "fasta"), ("d q", "fastq")]:
+        _path = sb_resources.get_one(key, mode="paths")
+        serial = list(SeqIO.parse(_path, in_format))
+        for processes in [2, 5, 50]:
+            ranges = Sb._record_ranges(_path, in_format, processes)
+            assert ranges[0][0] == 0
+            assert ranges[-1][1] == os.path.getsize(_path)
+            assert len(ranges) == min(processes, len(serial))
+
+            tester = Sb._parse_parallel(_path, in_format, processes)
+            assert [rec.id for rec in tester] == [rec.id for rec in serial]
+            assert [str(rec.seq) for rec in tester] == [str(rec.seq) for rec in serial]
+            assert [rec.letter_annotations for rec in tester] == [rec.letter_annotations for rec in serial]
+
+    # Bad range boundaries fall back on a serial parse
+    _path = sb_resources.get_one("d q", mode="paths")
+    monkeypatch.setattr(Sb, "_record_ranges", lambda *args: [(0, 10), (10, os.path.getsize(_path))])
+    assert len(Sb._parse_parallel(_path, "fastq", 2)) == len(serial)
+
+
+def test_instantiate_parallel(sb_resources, hf, monkeypatch):
+    monkeypatch.setattr(Sb, "PARALLEL_PARSE_SIZE", 0)
+    monkeypatch.setattr(br, "usable_cpu_count", lambda: 3)
+    for key in ["d f", "d q", "p g"]:
+        _path = sb_resources.get_one(key, mode="paths")
+        tester = Sb.SeqBuddy(_path)
+        assert hf.buddy2hash(tester) == hf.buddy2hash(sb_resources.get_one(key))
+
+
+# ######################  'SeqIndex' ###################### #
+def test_seqindex(sb_resources, hf):
+    temp_dir = br.TempDir()
+    for key in ["d f", "d g", "d q"]:
+        _path = shutil.copy(sb_resources.get_one(key, mode="paths"), temp_dir.path)
+        seqbuddy = Sb.SeqBuddy(_path)
+        tester = Sb.SeqIndex(_path)
+        assert os.path.isfile("%s.sbi" % _path)
+        assert len(tester) == len(seqbuddy)
+        assert [entry.id for entry in tester.entries] == [rec.id for rec in seqbuddy.records]
+        assert [entry.description for entry in tester.entries] == [rec.description for rec in seqbuddy.records]
+        assert seqbuddy.records[3].id in tester
+        assert hf.buddy2hash(tester.to_seqbuddy()) == hf.buddy2hash(seqbuddy)
+        assert str(tester.get_records([4])[0].seq) == str(seqbuddy.records[4].seq)
+        assert tester.get_subseq(2, 55, 130) == str(seqbuddy.records[2].seq)[55:130]
+        tester.close()
+
+        # Reuse the saved index, and rebuild it once the file has changed
+        assert Sb.SeqIndex(_path).entries == tester.entries
+        seqbuddy.records = seqbuddy.records[:3]
+        seqbuddy.write(_path)
+        assert len(Sb.SeqIndex(_path)) == len(seqbuddy)
+
+    with pytest.raises(ValueError) as err:
+        Sb.SeqIndex(sb_resources.get_one("d n", mode="paths"))
+    assert "Unable to index 'nexus' files" in str(err)
+
+    with pytest.raises(ValueError):
+        Sb.SeqIndex("foo")
+
+    # Empty files can't be memory mapped
+    open("%s/empty.fa" % temp_dir.path, "w").close()
+    tester = Sb.SeqIndex("%s/empty.fa" % temp_dir.path, in_format="fasta")
+    assert len(tester) == 0
+    assert tester._read(0, 0) == b""
+    assert not list(tester.iter_records())
+    tester.close()
+
+
+def test_seqindex_bgzf(sb_resources, hf):
+    temp_dir = br.TempDir()
+    for key in ["d f", "d g", "d q"]:
+        seqbuddy = Sb.SeqBuddy(sb_resources.get_one(key, mode="paths"))
+        _path = "%s/seqs.%s.gz" % (temp_dir.path, key[-1])
+        seqbuddy.write(_path)
+        tester = Sb.SeqIndex(_path)
+        assert tester.compression == "bgzf"
+        assert tester.blocks
+        assert len(tester) == len(seqbuddy.records)
+        records = tester.get_records([1, 3])
+        assert [str(rec.seq) for rec in records] == [str(rec.seq) for rec in seqbuddy.records[1:4:2]]
+        assert [rec.description for rec in records] == [rec.description for rec in seqbuddy.records[1:4:2]]
+        assert tester.get_subseq(2, 10, 25) == str(seqbuddy.records[2].seq)[10:25]
+        tester.close()
+
+        tester = Sb.SeqIndex(_path)  # Reload blocks from the saved index
+        assert tester.get_subseq(2, 10, 25) == str(seqbuddy.records[2].seq)[10:25]
+        tester.close()
+
+    with gzip.open("%s/plain.fa.gz" % temp_dir.path, "wb") as ofile:
+        ofile.write(str(seqbuddy).encode("utf-8"))
+    with pytest.raises(ValueError) as err:
+        Sb.SeqIndex("%s/plain.fa.gz" % temp_dir.path)
+    assert "Only BGZF compressed files can be indexed" in str(err)
+
+
+# ######################  'stream' ###################### #
+def test_stream(sb_resources, hf):
+    _path = sb_resources.get_one("d f", mode="paths")
+    chunks = list(Sb.stream(_path, chunk_size=4))
+    seqbuddy = Sb.SeqBuddy(_path)
+    assert [len(chunk) for chunk in chunks] == [4, 4, 4, 1]
+    assert "".join([str(chunk) for chunk in chunks]) == str(seqbuddy)
+    for chunk in chunks:
+        assert chunk.in_format == "fasta"
+        assert chunk.alpha == seqbuddy.alpha
+
+    with open(_path, "r", encoding="utf-8") as ifile:
+        chunks = list(Sb.stream(ifile, out_format="genbank"))
+    assert len(chunks) == 1
+    assert hf.buddy2hash(chunks[0]) == hf.buddy2hash(Sb.SeqBuddy(_path, out_format="genbank"))
+
+    chunks = list(Sb.stream(sb_resources.get_one("d g", mode="paths"), chunk_size=5, alpha="protein"))
+    assert chunks[-1].alpha == chunks[0].alpha == Sb.IUPAC.protein
+
+
+def test_stream_errors(sb_resources, sb_odd_resources):
+    with pytest.raises(ValueError) as e:
+        next(Sb.stream(sb_resources.get_one("d n", mode="paths")))
+    assert "Unable to stream 'nexus' input" in str(e)
+
+    with pytest.raises(ValueError) as e:
+        next(Sb.stream(sb_resources.get_one("d f", mode="paths"), out_format="phylip"))
+    assert "Unable to stream 'phylip' output" in str(e)
+
+    with pytest.raises(ValueError):
+        next(Sb.stream(sb_resources.get_one("d f", mode="paths"), chunk_size=0))
+
+    with pytest.raises(br.GuessError):
+        next(Sb.stream(sb_odd_resources["gibberish"]))
+
+    with pytest.raises(TypeError):
+        next(Sb.stream(["foo"]))
+
+
+# ######################  Start up ###################### #
+def test_lazy_imports():
+    # Modules that only a handful of commands need must not be loaded every time a Buddy tool starts
+    deferred = ["Bio.Restriction", "Bio.SeqUtils.ProtParam", "Bio.Entrez", "ete3", "dill", "readline", "pkg_resources",
+                "zipfile"]
+    code = "import sys, SeqBuddy, AlignBuddy, PhyloBuddy, DatabaseBuddy; print(' '.join(sys.modules))"
+    loaded = check_output([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(Sb.__file__)))
+    loaded = loaded.decode("utf-8").split()
+    assert "SeqBuddy" in loaded
+    assert [module for module in deferred if module in loaded] == []
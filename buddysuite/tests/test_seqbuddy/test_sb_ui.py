@@ -25,11 +25,13 @@ Description: Collection of PyTest unit tests for the AlignBuddy.py program
 
 import pytest
 import os
+import shutil
 import argparse
 from copy import deepcopy
 from unittest import mock
 from Bio.Alphabet import IUPAC
 import io
+import gzip
 import urllib.error
 import sys
 from collections import OrderedDict
@@ -308,10 +310,34 @@ def test_count_codons_ui(capsys, sb_resources, hf):
     out, err = capsys.readouterr()
     assert hf.string2hash(out) == "3e76bd510de4a61efb17ffc186ef9e68"
 
+    test_in_args.count_codons = ["agg"]
+    test_in_args.genetic_code = "2"
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddy(">seq1\nATGAGA\n>seq2\nTGA\n", in_format="fasta"), True)
+    out, err = capsys.readouterr()
+    assert out == "#### aggregate ####\nCodon\tAA\tNum\tPercent\nAGA\t*\t1\t33.333\nATG\tM\t1\t33.333\n" \
+                  "TGA\tW\t1\t33.333\n\n"
+
+    test_in_args.genetic_code = "foo"
+    Sb.command_line_ui(test_in_args, sb_resources.get_one("d g"), True)
+    out, err = capsys.readouterr()
+    assert "Unknown genetic code 'foo'" in err
+
     with pytest.raises(TypeError) as err:
         Sb.command_line_ui(test_in_args, sb_resources.get_one("p g"), pass_through=True)
     assert "Nucleic acid sequence required, not protein" in str(err)
 
+    # Modes are matched on their prefix, not anywhere in the word
+    test_in_args.genetic_code = None
+    test_in_args.count_codons = ["a"]
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddy(">seq1\nATGAGA\n>seq2\nTGA\n", in_format="fasta"), True)
+    out, err = capsys.readouterr()
+    assert out.startswith("#### aggregate ####\n")
+
+    test_in_args.count_codons = ["nate"]
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddy(">seq1\nATGAGA\n>seq2\nTGA\n", in_format="fasta"), True)
+    out, err = capsys.readouterr()
+    assert out.startswith("#### seq1 ####\n")
+
 
 # ######################  '-cr', '--count_residues' ###################### #
 def test_count_residues_ui(capsys, sb_resources, hf):
@@ -326,6 +352,23 @@ def test_count_residues_ui(capsys, sb_resources, hf):
     out, err = capsys.readouterr()
     assert hf.string2hash(out) == "051d98f6e2ba6159f5f282562d3627b4"
 
+    test_in_args.count_residues = ["agg"]
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddy(">seq1\nAC-G\n>seq2\nAAN\n", in_format="fasta"), True)
+    out, err = capsys.readouterr()
+    assert out == "aggregate\n% Ambiguous:\t16.67\nA:\t3\t50.0 %\nC:\t1\t16.67 %\nG:\t1\t16.67 %\nN:\t1\t16.67 %\n" \
+                  "T:\t0\t0 %\n\n"
+
+    # Modes are matched on their prefix, not anywhere in the word
+    test_in_args.count_residues = ["a"]
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddy(">seq1\nAC-G\n>seq2\nAAN\n", in_format="fasta"), True)
+    out, err = capsys.readouterr()
+    assert out.startswith("aggregate\n")
+
+    test_in_args.count_residues = ["gate"]
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddy(">seq1\nAC-G\n>seq2\nAAN\n", in_format="fasta"), True)
+    out, err = capsys.readouterr()
+    assert out.startswith("seq1\n")
+
 
 # ######################  '-dgn' '--degenerate_sequence'################### #
 def test_degenerate_sequence_ui(capsys, sb_resources, hf):
@@ -421,7 +464,7 @@ def test_delete_repeats_ui(capsys, sb_resources, sb_odd_resources, hf):
     test_in_args.delete_repeats = [None]
     Sb.command_line_ui(test_in_args, Sb.SeqBuddy(sb_odd_resources['duplicate']), True)
     out, err = capsys.readouterr()
-    assert hf.string2hash(out) == "df8e5f139ff41e1d81a082b83c208e12"
+    assert hf.string2hash(out) == "d37ea4f8fade74bacb59eab05e2da74d"
     assert hf.string2hash(err) == "3c27f0df0e892a1c66ed8fef047162ae"
 
     test_in_args.delete_repeats = [[2, "all"]]
@@ -489,8 +532,8 @@ def test_find_cpg_ui(capsys, sb_resources, hf):
     test_in_args.find_CpG = True
     Sb.command_line_ui(test_in_args, sb_resources.get_one('d g'), True)
     out, err = capsys.readouterr()
-    assert hf.string2hash(out) == "9499f524da0c35a60502031e94864928"
-    assert hf.string2hash(err) == "1fc07e5884a2a4c1344865f385b1dc79"
+    assert hf.string2hash(out) == "e060ea0f95e34598857757a526799ec8"
+    assert hf.string2hash(err) == "599ca23b95aff4bee0afba6f8b4f946c"
 
     Sb.command_line_ui(test_in_args, Sb.SeqBuddy(">seq1\nATGCCTAGCTAGCT", in_format="fasta"), True)
     out, err = capsys.readouterr()
@@ -504,10 +547,10 @@ def test_find_cpg_ui(capsys, sb_resources, hf):
 # ######################  '-orf', '--find_orfs' ###################### #
 def test_find_orfs_ui(capsys, sb_resources, hf, monkeypatch):
     test_in_args = deepcopy(in_args)
-    test_in_args.find_orfs = True
+    test_in_args.find_orfs = [[]]
     Sb.command_line_ui(test_in_args, sb_resources.get_one("d g"), True)
     out, err = capsys.readouterr()
-    assert hf.string2hash("%s\n%s" % (err, out)) == "1f29f572c06d4f9c69930053a6113a8d"
+    assert hf.string2hash("%s\n%s" % (err, out)) == "8ede5efcad31bab2bd173d49753836c7"
 
     tester = sb_resources.get_one("d g")
     tester = Sb.extract_regions(tester, "30:50")
@@ -515,6 +558,18 @@ def test_find_orfs_ui(capsys, sb_resources, hf, monkeypatch):
     out, err = capsys.readouterr()
     assert hf.string2hash("%s\n%s" % (err, out)) == "54876473b1c31c7fe16e4aa8d4c847c2"
 
+    test_in_args.find_orfs = [["6", "alt", "coords"]]
+    test_in_args.genetic_code = "2"
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddy(">seq1\nTTACATGTGCCCTAA\n>seq2\nATGAGATAA\n", in_format="fasta"), True)
+    out, err = capsys.readouterr()
+    assert out == "ID\tStrand\tStart\tEnd\nseq1\t+\t6\t15\nseq1\t-\t0\t6\nseq2\t+\t0\t6\n"
+
+    test_in_args.genetic_code = "foo"
+    Sb.command_line_ui(test_in_args, sb_resources.get_one("d g"), True)
+    out, err = capsys.readouterr()
+    assert "Unknown genetic code 'foo'" in err
+    test_in_args.genetic_code = None
+
     monkeypatch.setattr(Sb, "find_orfs", mock_raisetypeerror)
     Sb.command_line_ui(test_in_args, sb_resources.get_one("d g"), True)
     out, err = capsys.readouterr()
@@ -1104,6 +1159,42 @@ def test_pull_records_ui(capsys, sb_resources, hf):
     assert hf.string2hash(out) == "cd8d7284f039233e090c16e8aa6b5035"
 
 
+# ######################  '-prfl', '--pull_records_file' ###################### #
+def test_pull_records_file_ui(capsys, sb_resources, hf, monkeypatch):
+    temp_file = br.TempFile()
+    temp_file.write("Mle-Panxα1\n\nMle-Panxα2\nα3\n")
+    test_in_args = deepcopy(in_args)
+    test_in_args.pull_records_file = temp_file.path
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('d f'), True)
+    out, err = capsys.readouterr()
+    test_in_args = deepcopy(in_args)
+    test_in_args.pull_records = ["Mle-Panxα[12]$"]
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('d f'), True)
+    expected, err = capsys.readouterr()
+    assert out == expected and out.count(">") == 2
+
+    # With -stm, the ID file is only read once instead of once per chunk
+    open_text = br.open_text
+    opened = []
+    monkeypatch.setattr(Sb, "STREAM_CHUNK_SIZE", 2)
+    monkeypatch.setattr(br, "open_text", lambda *args: opened.append(args) or open_text(*args))
+    test_in_args = deepcopy(in_args)
+    test_in_args.pull_records_file = temp_file.path
+    test_in_args.stream = True
+    test_in_args.sequence = [sb_resources.get_one("d f", mode="paths")]
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddy, True)
+    out, err = capsys.readouterr()
+    assert out == expected
+    assert opened.count((temp_file.path,)) == 1
+    monkeypatch.undo()
+
+    test_in_args = deepcopy(in_args)
+    test_in_args.pull_records_file = "%s.missing" % temp_file.path
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('d f'), True)
+    out, err = capsys.readouterr()
+    assert "No such file or directory" in err
+
+
 # ######################  '-prf', '--pull_records_with_feature' ###################### #
 def test_pull_records_with_feature_ui(capsys, sb_resources, hf):
     test_in_args = deepcopy(in_args)
@@ -1297,6 +1388,192 @@ def test_shuffle_seqs_ui(capsys, sb_resources, hf):
     assert hf.string2hash(out) != "b831e901d8b6b1ba52bad797bad92d14"
 
 
+# ######################  '-stm', '--stream' ###################### #
+def test_stream_ui(capsys, sb_resources, hf, monkeypatch):
+    test_in_args = deepcopy(in_args)
+    test_in_args.uppercase = True
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('d f'), True)
+    expected, err = capsys.readouterr()
+
+    test_in_args.stream = True
+    test_in_args.sequence = [sb_resources.get_one("d f", mode="paths")]
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddy, True)
+    out, err = capsys.readouterr()
+    assert out == expected
+
+    # Chunks without any surviving records are skipped, and only reported if nothing at all was written
+    monkeypatch.setattr(Sb, "STREAM_CHUNK_SIZE", 2)
+    test_in_args.uppercase = False
+    test_in_args.pull_records = ["α10B"]
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddy, True)
+    out, err = capsys.readouterr()
+    assert out.startswith(">Mle-Panxα10B ")
+    assert out.count(">") == 1
+    assert "No sequences" not in out + err
+
+    test_in_args.pull_records = ["foo"]
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddy, True)
+    out, err = capsys.readouterr()
+    assert not out
+    assert err.count("Error: No sequences in object.") == 1
+    monkeypatch.undo()
+    test_in_args.pull_records = None
+    test_in_args.uppercase = True
+
+    test_in_args.out_format = "phylip"
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddy, True)
+    out, err = capsys.readouterr()
+    assert "Unable to stream 'phylip' output" in err
+
+    test_in_args.out_format = None
+    test_in_args.uppercase = False
+    test_in_args.order_ids = [False]
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddy, True)
+    out, err = capsys.readouterr()
+    assert "The -stm flag requires exactly one of the following commands" in err
+
+    test_in_args.order_ids = None
+    test_in_args.uppercase = True
+    test_in_args.in_place = True
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddy, True)
+    out, err = capsys.readouterr()
+    assert "The -stm flag cannot be combined with -i" in err
+
+
+# ######################  '-idx', '--index' ###################### #
+def test_index_ui(capsys, sb_resources, monkeypatch):
+    temp_dir = br.TempDir()
+    test_in_args = deepcopy(in_args)
+    test_in_args.pull_records = ["α[1-3]"]
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('d f'), True)
+    expected, err = capsys.readouterr()
+
+    closed = []
+    real_close = Sb.SeqIndex.close
+
+    def mock_close(self):
+        closed.append(self.path)
+        real_close(self)
+
+    monkeypatch.setattr(Sb.SeqIndex, "close", mock_close)
+    test_in_args.index = True
+    test_in_args.pull_records = ["α[1-3]"]
+    test_in_args.sequence = [shutil.copy(sb_resources.get_one("d f", mode="paths"), temp_dir.path)]
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddy, True)
+    out, err = capsys.readouterr()
+    assert out == expected
+    assert os.path.isfile("%s.sbi" % test_in_args.sequence[0])
+    assert closed == [os.path.abspath(test_in_args.sequence[0])]
+
+    test_in_args.pull_records = None
+    test_in_args.extract_regions = [["5:10"]]
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddy, True)
+    out, err = capsys.readouterr()
+    assert out.startswith(">Mle-Panxα9 cDNA - ML47742a.\ntagaca\n")
+
+    test_in_args.extract_regions = None
+    test_in_args.uppercase = True
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddy, True)
+    out, err = capsys.readouterr()
+    assert "The -idx flag requires exactly one of the following commands" in err
+
+    test_in_args.uppercase = False
+    test_in_args.pull_random_record = [2]
+    test_in_args.sequence = [sb_resources.get_one("d n", mode="paths")]
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddy, True)
+    out, err = capsys.readouterr()
+    assert "Unable to index 'nexus' files" in err
+
+
+# ######################  '-pl', '--pipeline' ###################### #
+def test_pipeline_ui(capsys, sb_resources, monkeypatch):
+    test_in_args = deepcopy(in_args)
+    tester = sb_resources.get_one('d g')
+    expected = Sb.order_ids(Sb.translate_cds(Sb.clean_seq(Sb.make_copy(tester))))
+
+    test_in_args.pipeline = "clean_seq; translate; order_ids"
+    Sb.command_line_ui(test_in_args, tester, True)
+    out, err = capsys.readouterr()
+    assert out == str(expected)
+
+    test_in_args.pipeline = "-cs; pull_records 'α1$' α2; -o fasta"
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('d f'), True)
+    out, err = capsys.readouterr()
+    assert "Pipeline ambiguous option: -o" in err
+
+    test_in_args.pipeline = "-cs; pull_records 'α1$' α2; num_seqs"
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('d f'), True)
+    out, err = capsys.readouterr()
+    assert out == "2\n"
+
+    test_in_args.pipeline = "num_seqs; uppercase"
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('d f'), True)
+    out, err = capsys.readouterr()
+    assert "'num_seqs' does not output sequences" in err
+    assert not out
+
+    # A failed step reports its own error, instead of the pipeline complaining about the missing sequences
+    test_in_args.pipeline = "degenerate_sequence 99; uppercase"
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('d f'), True)
+    out, err = capsys.readouterr()
+    assert "Valid dictionaries:" in err
+    assert "KeyError: 'Could not locate codon dictionary" in err
+    assert "does not output sequences" not in err
+    assert not out
+
+    # Steps already parsed by argparse_init() are not parsed again
+    test_in_args.pipeline = "clean_seq; translate; order_ids"
+    test_in_args.pipeline_steps = Sb._parse_pipeline(test_in_args.pipeline)
+    monkeypatch.setattr(Sb, "_parse_pipeline", mock_raiseruntimeerror)
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('d g'), True)
+    out, err = capsys.readouterr()
+    assert out == str(expected)
+    monkeypatch.undo()
+    test_in_args.pipeline_steps = None
+
+    test_in_args.pipeline = "uppercase lowercase"
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('d f'), True)
+    out, err = capsys.readouterr()
+    assert "Unrecognized pipeline argument(s): lowercase" in err
+
+    test_in_args.pipeline = "uppercase; lowercase"
+    test_in_args.uppercase = True
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('d f'), True)
+    out, err = capsys.readouterr()
+    assert "The -pl flag cannot be combined with other commands" in err
+
+    with pytest.raises(ValueError) as e:
+        Sb._parse_pipeline(" ; ")
+    assert "No commands found in pipeline" in str(e)
+
+
+# ######################  Compressed in/out ###################### #
+def test_compressed_ui(capsysbinary, sb_resources):
+    temp_dir = br.TempDir()
+    test_in_args = deepcopy(in_args)
+    test_in_args.uppercase = True
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('d f'), True)
+    expected, err = capsysbinary.readouterr()
+
+    test_in_args.out_format = "fasta.gz"
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('d f'), True)
+    out, err = capsysbinary.readouterr()
+    assert br.compression_type(out) == "bgzf"
+    assert gzip.decompress(out) == expected
+
+    # In-place edits of compressed files stay compressed
+    _path = "%s/seqs.fa.gz" % temp_dir.path
+    sb_resources.get_one('d f').write(_path)
+    test_in_args = deepcopy(in_args)
+    test_in_args.uppercase = True
+    test_in_args.in_place = True
+    test_in_args.sequence = [_path]
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddy(_path), True)
+    assert br.compression_type(_path) == "bgzf"
+    with gzip.open(_path, "rb") as ifile:
+        assert ifile.read() == expected
+
+
 # ######################  '-d2r', '--transcribe' ###################### #
 def test_transcribe_ui(capsys, sb_resources, hf):
     test_in_args = deepcopy(in_args)
@@ -1316,11 +1593,22 @@ def test_translate_ui(capsys, sb_resources, sb_odd_resources, hf):
     test_in_args.translate = True
     Sb.command_line_ui(test_in_args, sb_resources.get_one('d f'), True)
     out, err = capsys.readouterr()
-    assert hf.string2hash(out) == "06893e14839dc0448e6f522c1b8f8957"
+    assert hf.string2hash(out) == "3de7b7be2f2b92cf166b758625a1f316"
 
     Sb.command_line_ui(test_in_args, Sb.SeqBuddy(sb_odd_resources["ambiguous_rna"]), True)
     out, err = capsys.readouterr()
-    assert hf.string2hash(out) == "648ccc7c3400882be5bf6e8d9781f74e"
+    assert hf.string2hash(out) == "093e4d8ad756f4e9ffb3aef3f3364000"
+
+    test_in_args.genetic_code = "2"
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddy(">seq1\nATGAGATGATAA\n", in_format="fasta"), True)
+    out, err = capsys.readouterr()
+    assert out == ">seq1\nM*W*\n"
+
+    test_in_args.genetic_code = "foo"
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('d f'), True)
+    out, err = capsys.readouterr()
+    assert "Unknown genetic code 'foo'" in err
+    test_in_args.genetic_code = None
 
     tester = Sb.SeqBuddy(sb_odd_resources['mixed'])
     tester.alpha = IUPAC.ambiguous_dna
@@ -1451,3 +1739,22 @@ def test_main(monkeypatch, capsys, sb_resources):
     monkeypatch.setattr(Sb, "command_line_ui", mock_raiseruntimeerror)
     monkeypatch.setattr(br, "send_traceback", lambda *_: True)
     assert not Sb.main()
+
+
+def test_main_profile(monkeypatch, sb_resources):
+    tmp_dir = br.TempDir()
+    test_in_args = deepcopy(in_args)
+    test_in_args.profile = os.path.join(tmp_dir.path, "profile.tsv")
+
+    def mock_argparse_init():
+        br.enable_profiler()
+        return [test_in_args, Sb.SeqBuddy(sb_resources.get_one("d g", mode="paths"))]
+
+    monkeypatch.setattr(br, "PROFILER", None)
+    monkeypatch.setattr(Sb, "argparse_init", mock_argparse_init)
+    monkeypatch.setattr(Sb, "command_line_ui", lambda *_: sys.exit())
+    assert not Sb.main()
+    assert br.PROFILER is None
+    with open(test_in_args.profile, "r") as ifile:
+        phases = [line.split("\t")[0] for line in ifile.read().strip().split("\n")[2:]]
+    assert phases == ["parse", "parse/guess_format", "parse/guess_alphabet", "operation"]
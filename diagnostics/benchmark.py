@@ -0,0 +1,621 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-process benchmark suite for the BuddySuite API.
+
+Every registered function is timed against synthetic inputs of increasing size along one or more axes (number of
+records, sequence length, number of taxa). For each axis an empirical scaling exponent is fit (the slope of
+log(time) against log(size)), so that an accidental O(n^2) shows up as an exponent near 2 rather than as a vague
+'it feels slow'. Results can be saved as a JSON baseline and later runs compared against it.
+
+Examples:
+    ./benchmark.py                                  # default sizes, print a summary table
+    ./benchmark.py -f find_repeats order_ids        # only functions matching these names
+    ./benchmark.py -r 100 1000 10000 100000 1000000 -l 1000 10000 100000 1000000 10000000
+    ./benchmark.py --save baseline.json
+    ./benchmark.py --compare baseline.json          # exits 1 if anything regressed
+"""
+import sys
+import os
+import re
+import gc
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+from io import StringIO, BytesIO
+from datetime import datetime
+from collections import OrderedDict
+
+import buddysuite.buddy_resources as br
+import buddysuite.SeqBuddy as Sb
+import buddysuite.AlignBuddy as Alb
+import buddysuite.PhyloBuddy as Pb
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+from Bio.SeqFeature import SeqFeature, FeatureLocation
+from Bio.Alphabet import IUPAC
+
+AXES = OrderedDict([("records", [100, 1000, 10000]),  # Number of 1kb records
+                    ("length", [1000, 10000, 100000]),  # Length of each of 10 records
+                    ("taxa", [10, 100, 1000])])  # Number of leaves in each tree
+FIXED_LENGTH = 1000
+FIXED_RECORDS = 10
+FIXED_TREES = 3
+SEED = 12345
+
+
+# ################################################# INPUT GENERATORS ################################################# #
+def _random_residues(rand, length, alphabet):
+    return "".join(rand.choice(alphabet) for _ in range(length))
+
+
+def _random_cds(rand, length):
+    # In-frame sequence that starts with ATG, ends with a stop, and has no internal stops
+    codons = [a + b + c for a in "ACGT" for b in "ACGT" for c in "ACGT"]
+    codons = [codon for codon in codons if codon not in ["TAA", "TAG", "TGA"]]
+    num_codons = max(length // 3 - 2, 0)
+    return "ATG" + "".join(rand.choice(codons) for _ in range(num_codons)) + "TAA"
+
+
+def make_records(num_recs, length, alpha="dna", seed=SEED):
+    """
+    Build synthetic SeqRecords. Nucleotide records are a single CDS feature spanning the whole sequence, so that
+    functions working on features or codons have something to do.
+    :param num_recs: Number of records
+    :param length: Length of each sequence
+    :param alpha: 'dna', 'rna', or 'protein'
+    :param seed: Random seed, so repeated runs see the same input
+    :return: list of SeqRecords
+    """
+    rand = random.Random(seed)
+    records = []
+    # Generating a few unique sequences and recycling them keeps start-up fast for the very large sizes
+    pool_size = min(num_recs, 100)
+    if alpha == "protein":
+        pool = [_random_residues(rand, length, "ACDEFGHIKLMNPQRSTVWY") for _ in range(pool_size)]
+        alphabet = IUPAC.protein
+    else:
+        pool = [_random_cds(rand, length) for _ in range(pool_size)]
+        if alpha == "rna":
+            pool = [seq.replace("T", "U") for seq in pool]
+        alphabet = IUPAC.ambiguous_rna if alpha == "rna" else IUPAC.ambiguous_dna
+
+    for indx in range(num_recs):
+        seq = pool[indx % pool_size]
+        rec = SeqRecord(Seq(seq, alphabet), id="Seq%s" % indx, name="Seq%s" % indx, description="synthetic record")
+        feature_type = "CDS" if alpha != "protein" else "Region"
+        rec.features.append(SeqFeature(FeatureLocation(0, len(seq)), type=feature_type, strand=1))
+        records.append(rec)
+    return records
+
+
+def make_seqbuddy(num_recs, length, alpha="dna", seed=SEED):
+    alpha = {"dna": IUPAC.ambiguous_dna, "rna": IUPAC.ambiguous_rna, "protein": IUPAC.protein}[alpha] \
+        if isinstance(alpha, str) else alpha
+    records = make_records(num_recs, length, "protein" if alpha == IUPAC.protein else
+                           "rna" if alpha == IUPAC.ambiguous_rna else "dna", seed)
+    return Sb.SeqBuddy(records, out_format="genbank", alpha=alpha)
+
+
+def make_alignbuddy(num_recs, length, alpha="dna", seed=SEED):
+    """
+    Build a synthetic alignment by point-mutating and gapping a single root sequence
+    """
+    rand = random.Random(seed)
+    if alpha == "protein":
+        root = _random_residues(rand, length, "ACDEFGHIKLMNPQRSTVWY")
+        residues = "ACDEFGHIKLMNPQRSTVWY"
+    elif alpha == "rna":
+        root = _random_cds(rand, length).replace("T", "U")
+        residues = "ACGU"
+    else:
+        root = _random_cds(rand, length)
+        residues = "ACGT"
+    fasta = StringIO()
+    for indx in range(num_recs):
+        seq = list(root)
+        for _ in range(max(length // 20, 1)):
+            pos = rand.randrange(len(seq))
+            seq[pos] = rand.choice(residues) if rand.random() > 0.3 else "-"
+        fasta.write(">Seq%s\n%s\n" % (indx, "".join(seq)))
+    fasta.seek(0)
+    return Alb.AlignBuddy(fasta, in_format="fasta", out_format="fasta")
+
+
+def make_newick(num_taxa, rand):
+    nodes = ["Seq%s:%0.4f" % (indx, rand.random()) for indx in range(num_taxa)]
+    while len(nodes) > 1:
+        left = nodes.pop(rand.randrange(len(nodes)))
+        right = nodes.pop(rand.randrange(len(nodes)))
+        nodes.append("(%s,%s)%0.2f:%0.4f" % (left, right, rand.random(), rand.random()))
+    return re.sub(r"\)[0-9.]+:[0-9.]+$", ")", nodes[0]) + ";"
+
+
+def make_phylobuddy(num_taxa, num_trees=FIXED_TREES, seed=SEED):
+    rand = random.Random(seed)
+    trees = "\n".join(make_newick(num_taxa, rand) for _ in range(num_trees)) + "\n"
+    return Pb.PhyloBuddy(trees, "newick", "newick")
+
+
+# #################################################### REGISTRY ###################################################### #
+class Benchmark(object):
+    def __init__(self, module, name, func=None, kind="dna", args=(), kwargs=None, axes=("records", "length")):
+        """
+        :param module: Short module tag used in reports ('sb', 'alb', 'pb', 'br')
+        :param name: Function name, unique within the module
+        :param func: Callable. Defaults to the function of the same name in the module
+        :param kind: Which synthetic input to hand the callable (see Suite.build_input)
+        :param args: Extra positional arguments
+        :param kwargs: Extra keyword arguments
+        :param axes: Size axes this function is scaled along
+        """
+        self.module = module
+        self.name = name
+        self.func = func if func else getattr({"sb": Sb, "alb": Alb, "pb": Pb, "br": br}[module], name)
+        self.kind = kind
+        self.args = args
+        self.kwargs = kwargs if kwargs else {}
+        self.axes = axes
+
+    @property
+    def key(self):
+        return "%s.%s" % (self.module, self.name)
+
+    def __call__(self, inputs):
+        return self.func(*inputs, *self.args, **self.kwargs)
+
+
+def _br_copy_records(seqbuddy):
+    return br.copy_records(seqbuddy.records)
+
+
+def _br_compress_handle(seqbuddy):
+    handle = br.compress_handle(BytesIO(), "gzip")
+    handle.write(str(seqbuddy))
+    handle.close()
+
+
+def _br_replacements(seqbuddy):
+    return br.replacements(str(seqbuddy.records[0].seq), "ATG", "CCC", -10)
+
+
+def _br_shift_features(seqbuddy):
+    return [br.shift_features(rec.features, 10, len(rec)) for rec in seqbuddy.records]
+
+
+def _sb_parse(seqbuddy):
+    return Sb.SeqBuddy(StringIO(str(seqbuddy)), in_format="genbank")
+
+
+def _sb_write(seqbuddy):
+    return str(seqbuddy)
+
+
+def _alb_parse(alignbuddy):
+    return Alb.AlignBuddy(StringIO(str(alignbuddy)), in_format="fasta")
+
+
+def _alb_concat_alignments(alignbuddy1, alignbuddy2):
+    alignbuddy1.alignments += alignbuddy2.alignments
+    return Alb.concat_alignments(alignbuddy1, group_pattern="Seq[0-9]+")
+
+
+def _pb_show_unique(phylobuddy):
+    phylobuddy.trees = phylobuddy.trees[:2]
+    return Pb.show_unique(phylobuddy)
+
+
+def _pb_parse(phylobuddy):
+    return Pb.PhyloBuddy(str(phylobuddy), "newick")
+
+
+TREE_AXES = ("taxa",)
+
+BENCHMARKS = [
+    # I/O
+    Benchmark("sb", "parse", _sb_parse),
+    Benchmark("sb", "write", _sb_write),
+    Benchmark("alb", "parse", _alb_parse, kind="aln"),
+    Benchmark("pb", "parse", _pb_parse, kind="tree", axes=TREE_AXES),
+    # buddy_resources
+    Benchmark("br", "copy_records", _br_copy_records),
+    Benchmark("br", "compress_handle", _br_compress_handle),
+    Benchmark("br", "phylip_sequential_out", kind="aln"),
+    Benchmark("br", "replacements", _br_replacements),
+    Benchmark("br", "shift_features", _br_shift_features),
+    # SeqBuddy
+    Benchmark("sb", "annotate", args=("misc_feature", "1-10")),
+    Benchmark("sb", "ave_seq_length"),
+    Benchmark("sb", "back_translate", kind="protein", kwargs={"r_seed": SEED}),
+    Benchmark("sb", "clean_seq"),
+    Benchmark("sb", "complement"),
+    Benchmark("sb", "concat_seqs"),
+    Benchmark("sb", "count_codons"),
+    Benchmark("sb", "count_residues"),
+    Benchmark("sb", "degenerate_sequence"),
+    Benchmark("sb", "delete_features", args=("CDS",)),
+    Benchmark("sb", "delete_large", args=(FIXED_LENGTH // 2,)),
+    Benchmark("sb", "delete_metadata"),
+    Benchmark("sb", "delete_records", args=("Seq1[0-9]",)),
+    Benchmark("sb", "delete_repeats"),
+    Benchmark("sb", "delete_small", args=(FIXED_LENGTH // 2,)),
+    Benchmark("sb", "dna2rna"),
+    Benchmark("sb", "extract_feature_sequences", args=("CDS",)),
+    Benchmark("sb", "extract_regions", args=("1:100",)),
+    Benchmark("sb", "find_cpg"),
+    Benchmark("sb", "find_orfs"),
+    Benchmark("sb", "find_pattern", args=("ATG[ACGT]{3}TAA",)),
+    Benchmark("sb", "find_repeats"),
+    Benchmark("sb", "find_restriction_sites", kwargs={"quiet": True}),
+    Benchmark("sb", "hash_ids", kwargs={"r_seed": SEED}),
+    Benchmark("sb", "insert_sequence", args=("ATGCATGC",)),
+    Benchmark("sb", "isoelectric_point", kind="protein"),
+    Benchmark("sb", "lowercase"),
+    Benchmark("sb", "make_copy"),
+    Benchmark("sb", "make_groups"),
+    Benchmark("sb", "make_ids_unique"),
+    Benchmark("sb", "map_features_nucl2prot", kind="dna+protein", kwargs={"quiet": True}),
+    Benchmark("sb", "map_features_prot2nucl", kind="protein+dna", kwargs={"quiet": True}),
+    Benchmark("sb", "merge", kind="dna+dna"),
+    Benchmark("sb", "molecular_weight"),
+    Benchmark("sb", "molecular_weight_array"),
+    Benchmark("sb", "num_seqs"),
+    Benchmark("sb", "order_features_alphabetically"),
+    Benchmark("sb", "order_features_by_position"),
+    Benchmark("sb", "order_ids"),
+    Benchmark("sb", "order_ids_randomly", kwargs={"r_seed": SEED}),
+    Benchmark("sb", "pull_random_recs", kwargs={"count": 10, "r_seed": SEED}),
+    Benchmark("sb", "pull_record_ends", args=(100,)),
+    Benchmark("sb", "pull_recs", args=("Seq1[0-9]",)),
+    Benchmark("sb", "pull_recs_with_feature", args=("CDS",)),
+    Benchmark("sb", "rename", args=("Seq", "Rec")),
+    Benchmark("sb", "replace_subsequence", args=("ATG", "CCC")),
+    Benchmark("sb", "reverse_complement"),
+    Benchmark("sb", "rna2dna", kind="rna"),
+    Benchmark("sb", "select_frame", args=(2,)),
+    Benchmark("sb", "shuffle_seqs", kwargs={"r_seed": SEED}),
+    Benchmark("sb", "translate6frames"),
+    Benchmark("sb", "translate_cds", kwargs={"quiet": True}),
+    Benchmark("sb", "uppercase"),
+    # AlignBuddy
+    Benchmark("alb", "alignment_lengths", kind="aln"),
+    Benchmark("alb", "bootstrap", kind="aln", kwargs={"r_seed": SEED}),
+    Benchmark("alb", "clean_seq", kind="aln"),
+    Benchmark("alb", "concat_alignments", _alb_concat_alignments, kind="aln+aln"),
+    Benchmark("alb", "consensus_sequence", kind="aln"),
+    Benchmark("alb", "delete_records", kind="aln", args=("Seq1[0-9]",)),
+    Benchmark("alb", "dna2rna", kind="aln"),
+    Benchmark("alb", "enforce_triplets", kind="aln"),
+    Benchmark("alb", "extract_feature_sequences", kind="aln", args=("CDS",)),
+    Benchmark("alb", "extract_regions", kind="aln", args=("1:100",)),
+    Benchmark("alb", "hash_ids", kind="aln", kwargs={"r_seed": SEED}),
+    Benchmark("alb", "lowercase", kind="aln"),
+    Benchmark("alb", "make_copy", kind="aln"),
+    Benchmark("alb", "map_features2alignment", kind="dna+aln"),
+    Benchmark("alb", "order_ids", kind="aln"),
+    Benchmark("alb", "pull_records", kind="aln", args=("Seq1[0-9]",)),
+    Benchmark("alb", "rename", kind="aln", args=("Seq", "Rec")),
+    Benchmark("alb", "rna2dna", kind="rna_aln"),
+    Benchmark("alb", "translate_cds", kind="aln"),
+    Benchmark("alb", "trimal", kind="aln", args=("gappyout",)),
+    Benchmark("alb", "uppercase", kind="aln"),
+    # PhyloBuddy
+    Benchmark("pb", "collapse_polytomies", kind="tree", args=(0.5,), axes=TREE_AXES),
+    Benchmark("pb", "consensus_tree", kind="tree", axes=TREE_AXES),
+    Benchmark("pb", "distance", kind="tree", axes=TREE_AXES),
+    Benchmark("pb", "hash_ids", kind="tree", kwargs={"r_seed": SEED}, axes=TREE_AXES),
+    Benchmark("pb", "list_ids", kind="tree", axes=TREE_AXES),
+    Benchmark("pb", "make_copy", kind="tree", axes=TREE_AXES),
+    Benchmark("pb", "num_taxa", kind="tree", axes=TREE_AXES),
+    Benchmark("pb", "prune_taxa", kind="tree", args=("Seq1[0-9]",), axes=TREE_AXES),
+    Benchmark("pb", "rename", kind="tree", args=("Seq", "Rec"), axes=TREE_AXES),
+    Benchmark("pb", "root", kind="tree", axes=TREE_AXES),
+    Benchmark("pb", "show_unique", _pb_show_unique, kind="tree", axes=TREE_AXES),
+    Benchmark("pb", "split_polytomies", kind="tree", axes=TREE_AXES),
+    Benchmark("pb", "trees_to_ascii", kind="tree", axes=TREE_AXES),
+    Benchmark("pb", "unroot", kind="tree", axes=TREE_AXES),
+]
+
+# Public functions that are deliberately not benchmarked, because they wrap third party binaries, hit the network,
+# open a display, or are the command line plumbing itself.
+NOT_BENCHMARKED = ["argparse_init", "command_line_ui", "main", "bl2seq", "blast", "purge", "transmembrane_domains",
+                   "stream", "generate_msa", "generate_tree", "display_trees", "guess_alphabet", "guess_format",
+                   "clean_newick"]
+
+
+def uncovered_functions():
+    """
+    List the public API functions that are neither in BENCHMARKS nor NOT_BENCHMARKED, so new functions don't
+    silently escape performance tracking.
+    """
+    import inspect
+    covered = [bench.key for bench in BENCHMARKS]
+    missing = []
+    for tag, module in [("sb", Sb), ("alb", Alb), ("pb", Pb)]:
+        for name, func in inspect.getmembers(module, inspect.isfunction):
+            if name.startswith("_") or func.__module__ != module.__name__ or name in NOT_BENCHMARKED:
+                continue
+            if "%s.%s" % (tag, name) not in covered:
+                missing.append("%s.%s" % (tag, name))
+    return missing
+
+
+# ##################################################### RUNNER ####################################################### #
+def fit_exponent(sizes, times, floor=1e-4):
+    """
+    Least squares slope of log(time) vs log(size). Timings below `floor` seconds are dominated by noise and dropped.
+    :return: float, or None if fewer than two usable points
+    """
+    points = [(math.log(size), math.log(secs)) for size, secs in zip(sizes, times) if secs and secs >= floor]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if not var_x:
+        return None
+    return round(sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x, 3)
+
+
+class Suite(object):
+    def __init__(self, benchmarks, axes, repeats=3, max_seconds=10.0, memory=True, quiet=False):
+        """
+        :param benchmarks: list of Benchmark objects
+        :param axes: OrderedDict of {axis: [sizes]}
+        :param repeats: Best-of-N timing
+        :param max_seconds: Once a single call takes longer than this, larger sizes are skipped for that function
+        :param memory: Also record peak memory with tracemalloc (a separate, untimed call)
+        :param quiet: Suppress progress on stderr
+        """
+        self.benchmarks = benchmarks
+        self.axes = axes
+        self.repeats = repeats
+        self.max_seconds = max_seconds
+        self.memory = memory
+        self.quiet = quiet
+        self._input_cache = {}
+
+    @staticmethod
+    def _dims(axis, size):
+        # (num records, sequence length) for sequence inputs, or num taxa for trees
+        if axis == "records":
+            return size, FIXED_LENGTH
+        elif axis == "length":
+            return FIXED_RECORDS, size
+        return size
+
+    def build_input(self, kind, axis, size):
+        """
+        Synthetic inputs are cached per (kind, axis, size) and each call gets a fresh copy, so the timed region never
+        includes input generation and functions that modify their input in place don't leak into the next repeat.
+        """
+        cache_key = (kind, axis, size)
+        if cache_key not in self._input_cache:
+            built = []
+            for part in kind.split("+"):
+                if part == "tree":
+                    built.append(make_phylobuddy(self._dims(axis, size)))
+                elif part.endswith("aln"):
+                    # 'aln' is a DNA alignment, 'rna_aln' an RNA one
+                    built.append(make_alignbuddy(*self._dims(axis, size), alpha=part[:-4] or "dna"))
+                else:
+                    num_recs, length = self._dims(axis, size)
+                    if part == "protein":
+                        length = max(length // 3, 1)
+                    built.append(make_seqbuddy(num_recs, length, part))
+            self._input_cache[cache_key] = built
+        copies = []
+        for buddy in self._input_cache[cache_key]:
+            module = Pb if isinstance(buddy, Pb.PhyloBuddy) else Alb if isinstance(buddy, Alb.AlignBuddy) else Sb
+            copies.append(module.make_copy(buddy))
+        return copies
+
+    def clear_inputs(self):
+        self._input_cache = {}
+        gc.collect()
+
+    def time_call(self, bench, axis, size):
+        best = None
+        for _ in range(self.repeats):
+            inputs = self.build_input(bench.kind, axis, size)
+            gc.collect()
+            start = time.perf_counter()
+            bench(inputs)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+            if elapsed > self.max_seconds:
+                break
+        return best
+
+    def peak_memory(self, bench, axis, size):
+        inputs = self.build_input(bench.kind, axis, size)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            bench(inputs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return peak
+
+    def run_one(self, bench):
+        result = OrderedDict()
+        for axis in bench.axes:
+            if axis not in self.axes:
+                continue
+            sizes, times, peaks, errors = [], [], [], []
+            for size in self.axes[axis]:
+                try:
+                    with open(os.devnull, "w") as devnull:
+                        stderr, sys.stderr = sys.stderr, devnull
+                        try:
+                            secs = self.time_call(bench, axis, size)
+                            peak = self.peak_memory(bench, axis, size) if self.memory else None
+                        finally:
+                            sys.stderr = stderr
+                except Exception as err:
+                    errors.append("%s=%s: %s: %s" % (axis, size, type(err).__name__, err))
+                    break
+                sizes.append(size)
+                times.append(round(secs, 6))
+                peaks.append(peak)
+                if not self.quiet:
+                    sys.stderr.write("  %-40s %-8s %10s  %10.4fs\n" % (bench.key, axis, size, secs))
+                if secs > self.max_seconds:
+                    break
+            result[axis] = OrderedDict([("sizes", sizes), ("seconds", times), ("peak_bytes", peaks),
+                                        ("exponent", fit_exponent(sizes, times))])
+            if errors:
+                result[axis]["errors"] = errors
+        return result
+
+    def run(self):
+        results = OrderedDict()
+        kinds = OrderedDict()
+        for bench in self.benchmarks:
+            kinds.setdefault(bench.kind, []).append(bench)
+        # Group by input kind so the input cache can be dropped between groups and large inputs don't pile up
+        for kind, benches in kinds.items():
+            for bench in benches:
+                results[bench.key] = self.run_one(bench)
+            self.clear_inputs()
+        return OrderedDict([(bench.key, results[bench.key]) for bench in self.benchmarks])
+
+
+# ##################################################### REPORTS ###################################################### #
+def metadata():
+    import Bio
+    return OrderedDict([("date", str(datetime.now())), ("seqbuddy", Sb.VERSION.short()),
+                        ("python", platform.python_version()), ("biopython", Bio.__version__),
+                        ("platform", platform.platform()), ("processor", platform.processor())])
+
+
+def _human_bytes(num):
+    if num is None:
+        return "-"
+    for unit in ["B", "KB", "MB", "GB"]:
+        if num < 1024:
+            return "%0.1f%s" % (num, unit)
+        num /= 1024
+    return "%0.1fTB" % num
+
+
+def summary(results):
+    output = "%-40s %-8s %10s %12s %10s %8s\n" % ("function", "axis", "max size", "seconds", "peak mem", "exponent")
+    for key, axes in results.items():
+        for axis, data in axes.items():
+            if data["sizes"]:
+                exponent = "-" if data["exponent"] is None else "%0.2f" % data["exponent"]
+                output += "%-40s %-8s %10s %12.4f %10s %8s\n" % (key, axis, data["sizes"][-1], data["seconds"][-1],
+                                                                _human_bytes(data["peak_bytes"][-1]), exponent)
+            for error in data.get("errors", []):
+                output += "%-40s %-8s ERROR %s\n" % (key, axis, error)
+    return output
+
+
+def compare(baseline, results, time_tolerance=1.5, exponent_tolerance=0.25):
+    """
+    Compare a fresh run against a saved baseline.
+    :param baseline: dict as written by --save
+    :param results: dict of results from Suite.run()
+    :param time_tolerance: Flag when time at the largest shared size grows by more than this ratio
+    :param exponent_tolerance: Flag when the scaling exponent grows by more than this much
+    :return: list of regression strings
+    """
+    regressions = []
+    for key, axes in results.items():
+        if key not in baseline["results"]:
+            continue
+        for axis, data in axes.items():
+            base = baseline["results"][key].get(axis)
+            if not base:
+                continue
+            shared = [size for size in data["sizes"] if size in base["sizes"]]
+            if shared:
+                size = shared[-1]
+                new_secs = data["seconds"][data["sizes"].index(size)]
+                old_secs = base["seconds"][base["sizes"].index(size)]
+                # Ignore sub-millisecond differences; they are timer noise
+                if old_secs and new_secs > 1e-3 and new_secs / old_secs > time_tolerance:
+                    regressions.append("%s (%s=%s): %0.4fs -> %0.4fs (x%0.2f)" %
+                                       (key, axis, size, old_secs, new_secs, new_secs / old_secs))
+            if data["exponent"] is not None and base["exponent"] is not None \
+                    and data["exponent"] - base["exponent"] > exponent_tolerance:
+                regressions.append("%s (%s): scaling exponent %0.2f -> %0.2f" %
+                                   (key, axis, base["exponent"], data["exponent"]))
+    return regressions
+
+
+def argparse_init():
+    parser = argparse.ArgumentParser(prog="benchmark.py", formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     description=__doc__)
+    parser.add_argument("-f", "--functions", nargs="+", metavar="regex",
+                        help="Only run benchmarks whose 'module.function' key matches one of these patterns")
+    parser.add_argument("-r", "--records", nargs="+", type=int, metavar="int",
+                        help="Record counts (default: %s)" % AXES["records"])
+    parser.add_argument("-l", "--length", nargs="+", type=int, metavar="int",
+                        help="Sequence lengths (default: %s)" % AXES["length"])
+    parser.add_argument("-t", "--taxa", nargs="+", type=int, metavar="int",
+                        help="Tree sizes (default: %s)" % AXES["taxa"])
+    parser.add_argument("-a", "--axes", nargs="+", choices=list(AXES), help="Only scale along these axes")
+    parser.add_argument("-n", "--repeats", type=int, default=3, help="Report the best of N calls (default: 3)")
+    parser.add_argument("-m", "--max_seconds", type=float, default=10.0,
+                        help="Stop scaling a function once one call exceeds this (default: 10)")
+    parser.add_argument("-nm", "--no_memory", action="store_true", help="Skip the tracemalloc peak memory pass")
+    parser.add_argument("-s", "--save", metavar="path", help="Write results to a JSON baseline file")
+    parser.add_argument("-c", "--compare", metavar="path", help="Compare against a JSON baseline file")
+    parser.add_argument("-tt", "--time_tolerance", type=float, default=1.5,
+                        help="Time ratio that counts as a regression with --compare (default: 1.5)")
+    parser.add_argument("-et", "--exponent_tolerance", type=float, default=0.25,
+                        help="Exponent increase that counts as a regression with --compare (default: 0.25)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Suppress progress output")
+    return parser.parse_args()
+
+
+def main():
+    in_args = argparse_init()
+    axes = OrderedDict()
+    for axis, sizes in AXES.items():
+        if in_args.axes and axis not in in_args.axes:
+            continue
+        axes[axis] = sorted(getattr(in_args, axis) or sizes)
+
+    benchmarks = BENCHMARKS
+    if in_args.functions:
+        benchmarks = [bench for bench in BENCHMARKS if any(re.search(patt, bench.key) for patt in in_args.functions)]
+        if not benchmarks:
+            sys.stderr.write("No benchmarks match %s\n" % in_args.functions)
+            return 1
+
+    missing = uncovered_functions()
+    if missing and not in_args.quiet:
+        sys.stderr.write("Warning: no benchmark registered for %s\n" % ", ".join(missing))
+
+    suite = Suite(benchmarks, axes, repeats=in_args.repeats, max_seconds=in_args.max_seconds,
+                  memory=not in_args.no_memory, quiet=in_args.quiet)
+    results = suite.run()
+    sys.stdout.write(summary(results))
+
+    if in_args.save:
+        with open(in_args.save, "w") as ofile:
+            json.dump(OrderedDict([("meta", metadata()), ("results", results)]), ofile, indent=2)
+        sys.stderr.write("Results written to %s\n" % os.path.abspath(in_args.save))
+
+    if in_args.compare:
+        with open(in_args.compare, "r") as ifile:
+            baseline = json.load(ifile)
+        regressions = compare(baseline, results, in_args.time_tolerance, in_args.exponent_tolerance)
+        if regressions:
+            sys.stdout.write("\n%s regression(s) against %s:\n" % (len(regressions), in_args.compare))
+            sys.stdout.write("\n".join(regressions) + "\n")
+            return 1
+        sys.stdout.write("\nNo regressions against %s\n" % in_args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -52,10 +52,10 @@ KEYWORDS = [
 
 ENTRY_POINTS = {
     'console_scripts': [
-        'alignbuddy = buddysuite.AlignBuddy:main',
+        'alignbuddy = buddysuite.buddy_client:alignbuddy',
         'databasebuddy = buddysuite.DatabaseBuddy:main',
-        'phylobuddy = buddysuite.PhyloBuddy:main',
-        'seqbuddy = buddysuite.SeqBuddy:main',
+        'phylobuddy = buddysuite.buddy_client:phylobuddy',
+        'seqbuddy = buddysuite.buddy_client:seqbuddy',
         'buddysuite = buddysuite.BuddySuite:main'
     ]
 }